@@ -0,0 +1,191 @@
+"""
+Exact cache of the stage scripts of finished runs, keyed on the canonical form of the extracted spec and the
+env_type; a hit replays the scripts instead of asking the stage agents.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from helper_functions import atomic_write, extract_json_object
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARTIFACT_CACHE_DIR = os.path.join(".cache", "artifacts")
+DEPENDENCY_KEY_HINTS = ("dependenc", "requirement", "package", "librar")
+_SECTION = re.compile(r"^\s*(?:\d+[.)]\s*)?\*\*(?P<heading>[^*]+?)\*\*\s*:?\s*(?P<rest>.*)$")
+_ITEM = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+(?P<item>.+)$")
+_VERSION = re.compile(r"^(?P<name>.+?)\s*(?P<version>(?:[<>=!~^@]=?|\s+v?(?=\d)).*)?$")
+
+
+def _snake(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", text.lower()).strip("_")
+
+
+def _normalize_text(text: str) -> str:
+    text = re.sub(r"(`+|\*{1,2})(.+?)\1", r"\2", text)      # inline markdown
+    return " ".join(text.split()).strip(" .,;").lower()
+
+
+def normalize_dependency(dependency: str) -> str:
+    """`Flask_SQLAlchemy >= 3.0 (ORM)` -> `flask-sqlalchemy>=3.0`"""
+    # drop explanations: "flask (web framework)", "flask: web framework", "flask - web framework"
+    text = re.split(r":\s| - ", re.sub(r"\([^)]*\)", "", _normalize_text(dependency)))[0].strip()
+    match = _VERSION.match(text)
+    if match is None:
+        return text
+    name = re.sub(r"[\s._-]+", "-", match.group("name").strip())
+    version = re.sub(r"\s+", "", match.group("version") or "").lstrip("v")
+    return f"{name}{version}" if version[:1] in ("<", ">", "=", "!", "~", "^", "@") or not version else f"{name}=={version}"
+
+
+def is_dependency_key(key: str) -> bool:
+    return any(hint in key for hint in DEPENDENCY_KEY_HINTS)
+
+
+def _canonical_value(value, dependencies: bool):
+    if isinstance(value, dict):
+        return {_snake(str(k)): _canonical_value(v, dependencies or is_dependency_key(_snake(str(k))))
+                for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        items = []
+        for item in value:
+            canonical = _canonical_value(item, dependencies)
+            # "flask, sqlalchemy" inside a dependency list counts as two entries of that list
+            if dependencies and isinstance(item, str) and isinstance(canonical, list):
+                items.extend(canonical)
+            elif canonical not in ("", None, [], {}):
+                items.append(canonical)
+        return sorted({json.dumps(item, sort_keys=True): item for item in items}.values(),
+                      key=lambda item: json.dumps(item, sort_keys=True))
+    if isinstance(value, str):
+        if dependencies:
+            parts = [part for part in re.split(r",|;|\s\+\s", value) if part.strip()]
+            return _canonical_value(parts, True) if len(parts) > 1 else normalize_dependency(value)
+        return _normalize_text(value)
+    return value
+
+
+def _parse_markdown_spec(description: str) -> Dict[str, List[str]]:
+    sections: Dict[str, List[str]] = {}
+    current = None
+    for line in description.splitlines():
+        section = _SECTION.match(line)
+        if section is not None:
+            current = _snake(section.group("heading"))
+            sections[current] = [section.group("rest")] if section.group("rest").strip() else []
+            continue
+        item = _ITEM.match(line)
+        if current is not None and (item is not None or line.strip()):
+            sections[current].append(item.group("item") if item is not None else line.strip())
+    return sections
+
+
+def canonical_spec(description: Optional[str]) -> Optional[Dict]:
+    """Canonical form of an extracted project spec, or None if it is not a structured spec."""
+    if not description:
+        return None
+    spec = extract_json_object(description)
+    if spec is None:
+        spec = _parse_markdown_spec(description)
+    return _canonical_value(spec, False) or None
+
+
+def spec_key(spec: Dict, env_type: str) -> str:
+    material = json.dumps({"env_type": env_type, "spec": spec}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ArtifactEntry:
+    key: str
+    env_type: str
+    spec: Dict
+    # stage -> executed commands, each {"command": ..., "cwd": <directory relative to the workspace, or None>}
+    scripts: Dict[str, List[Dict]] = field(default_factory=dict)
+    created: float = field(default_factory=time.time)
+    hits: int = 0
+    last_hit: Optional[float] = None
+
+    def script(self, stage: str, work_dir: str) -> Optional[List[Dict]]:
+        """The stage's script with its directories resolved against work_dir (None if the stage is missing)."""
+        steps = self.scripts.get(stage)
+        if steps is None:
+            return None
+        root = os.path.abspath(work_dir)
+        return [{"command": step["command"],
+                 "cwd": os.path.normpath(os.path.join(root, step["cwd"])) if step.get("cwd") is not None else None}
+                for step in steps]
+
+
+class ArtifactCache:
+    """
+    Verified stage scripts of finished runs, one JSON file per (canonical spec, env_type).
+
+    :param directory: where the entries live; safe to share between processes (writes are atomic).
+    """
+
+    def __init__(self, directory: str = DEFAULT_ARTIFACT_CACHE_DIR):
+        self.directory = str(directory)
+
+    def key_for(self, description: Optional[str], env_type: str) -> Optional[str]:
+        """Cache key of an extracted description, or None if it cannot be canonicalized."""
+        spec = canonical_spec(description)
+        return spec_key(spec, env_type) if spec is not None else None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[ArtifactEntry]:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return ArtifactEntry(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError) as e:
+            logger.warning("dropping unreadable artifact cache entry %s: %s", key, e)
+            self.invalidate(key)
+            return None
+
+    def keys(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return [name[:-len(".json")] for name in os.listdir(self.directory) if name.endswith(".json")]
+
+    def _write(self, entry: ArtifactEntry):
+        os.makedirs(self.directory, exist_ok=True)
+        with atomic_write(self._path(entry.key)) as f:
+            json.dump(asdict(entry), f, indent=4)
+
+    def store(self, description: str, env_type: str, scripts: Dict[str, List[Dict]], work_dir: str) -> Optional[str]:
+        """Store the scripts of a finished run; absolute directories below work_dir are made relative to it."""
+        spec = canonical_spec(description)
+        if spec is None:
+            return None
+        root = os.path.abspath(work_dir)
+        relative = {
+            stage: [{"command": step["command"],
+                     "cwd": os.path.relpath(step["cwd"], root) if step.get("cwd") is not None else None}
+                    for step in steps]
+            for stage, steps in scripts.items()
+        }
+        entry = ArtifactEntry(key=spec_key(spec, env_type), env_type=env_type, spec=spec, scripts=relative)
+        self._write(entry)
+        logger.info("stored the artifacts of %s in %s", entry.key, self.directory)
+        return entry.key
+
+    def record_hit(self, entry: ArtifactEntry):
+        entry.hits += 1
+        entry.last_hit = time.time()
+        self._write(entry)
+
+    def invalidate(self, key: str):
+        try:
+            os.remove(self._path(key))
+            logger.info("invalidated artifact cache entry %s", key)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,162 @@
+"""
+Docker build contexts: stack-specific .dockerignore rules and a tarball reused for as long as its content
+hash is unchanged.
+"""
+import hashlib
+import logging
+import os
+import stat
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from ExecutionLedger import HEAVY_DIRS
+from helper_functions import atomic_write
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTEXT_CACHE_DIR = os.path.join(".cache", "build_contexts")
+MAX_CACHED_CONTEXTS = 20
+IGNORE_HEADER = "# added by code-catalyst for the detected stack"
+
+COMMON_IGNORES = [".git", ".cache", "**/.DS_Store", "**/*.swp", ".idea", ".vscode"]
+
+# marker files -> ignore rules of that stack
+STACK_IGNORES: Dict[str, Tuple[List[str], List[str]]] = {
+    "python": (
+        ["requirements.txt", "pyproject.toml", "setup.py", "Pipfile"],
+        ["venv", ".venv", "**/__pycache__", "**/*.pyc", ".pytest_cache", ".mypy_cache", ".tox", "*.egg-info"],
+    ),
+    "node": (
+        ["package.json"],
+        ["node_modules", "**/node_modules", "npm-debug.log*", "yarn-error.log*", "coverage", ".next/cache"],
+    ),
+    "rust": (["Cargo.toml"], ["target"]),
+    "java": (["pom.xml", "build.gradle", "build.gradle.kts"], ["target", ".gradle", "build"]),
+}
+
+
+@dataclass
+class BuildContext:
+    path: str               # the context tarball
+    digest: str
+    size: int               # bytes sent to the daemon
+    files: int
+    reused: bool
+    prepare_s: float
+
+
+def find_dockerfile(work_dir: str) -> Optional[str]:
+    """The most recently written Dockerfile below work_dir, or None."""
+    newest, newest_mtime = None, 0.0
+    for root, dirs, files in os.walk(work_dir):
+        dirs[:] = [d for d in dirs if d not in HEAVY_DIRS and not d.startswith(".")]
+        if "Dockerfile" in files:
+            path = os.path.join(root, "Dockerfile")
+            mtime = os.path.getmtime(path)
+            if newest is None or mtime > newest_mtime:
+                newest, newest_mtime = path, mtime
+    return newest
+
+
+def detect_stacks(project_dir: str) -> List[str]:
+    """Stacks whose marker files are in the top level of project_dir."""
+    names = set(os.listdir(project_dir))
+    return [stack for stack, (markers, _) in STACK_IGNORES.items() if names.intersection(markers)]
+
+
+def merge_dockerignore(project_dir: str) -> List[str]:
+    """
+    Add the ignore rules for the detected stack(s) to the project's .dockerignore, keeping the rules that are
+    already there. Returns the resulting patterns.
+    """
+    path = os.path.join(project_dir, ".dockerignore")
+    existing = []
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            existing = f.read().splitlines()
+
+    rules = list(COMMON_IGNORES)
+    for stack in detect_stacks(project_dir):
+        rules.extend(STACK_IGNORES[stack][1])
+    present = {line.strip() for line in existing}
+    missing = [rule for rule in dict.fromkeys(rules) if rule not in present]
+    if missing:
+        lines = existing + ([""] if existing and existing[-1].strip() else []) + [IGNORE_HEADER] + missing
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        logger.info("added %d rules to %s", len(missing), path)
+
+    return [line.strip() for line in existing + missing if line.strip() and not line.lstrip().startswith("#")]
+
+
+def _context_files(project_dir: str, patterns: List[str]) -> List[str]:
+    from docker.utils.build import exclude_paths  # deferred: the docker SDK is only needed for builds
+
+    return sorted(exclude_paths(project_dir, patterns, dockerfile="Dockerfile"))
+
+
+def context_digest(project_dir: str, files: List[str]) -> str:
+    """sha256 over the relative path, the exec bit and the content of every file in the context."""
+    digest = hashlib.sha256()
+    for relpath in files:
+        full_path = os.path.join(project_dir, relpath)
+        info = os.lstat(full_path)
+        digest.update(relpath.encode("utf-8", "surrogateescape") + b"\0")
+        if stat.S_ISLNK(info.st_mode):
+            digest.update(b"link:" + os.readlink(full_path).encode("utf-8", "surrogateescape"))
+        elif stat.S_ISREG(info.st_mode):
+            digest.update(b"x" if info.st_mode & 0o111 else b"-")
+            with open(full_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+        else:
+            digest.update(b"dir")
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _prune(cache_dir: str, keep: int = MAX_CACHED_CONTEXTS):
+    tarballs = sorted(
+        (os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(".tar")),
+        key=os.path.getmtime,
+    )
+    for path in tarballs[:-keep]:
+        os.remove(path)
+
+
+def prepare_build_context(project_dir: str, cache_dir: Optional[str] = None) -> BuildContext:
+    """
+    Merge the .dockerignore rules, then return the context tarball for project_dir, building it only if no
+    tarball with the same content hash exists yet.
+    """
+    from docker.utils.build import create_archive
+
+    start = time.perf_counter()
+    cache_dir = cache_dir or DEFAULT_CONTEXT_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+
+    patterns = merge_dockerignore(project_dir)
+    files = _context_files(project_dir, patterns)
+    digest = context_digest(project_dir, files)
+    path = os.path.join(cache_dir, f"{digest}.tar")
+
+    reused = os.path.exists(path)
+    if reused:
+        os.utime(path)      # keep recently used contexts when pruning
+    else:
+        with atomic_write(path, binary=True) as f:
+            create_archive(project_dir, files=files, fileobj=f)
+        _prune(cache_dir)
+
+    context = BuildContext(
+        path=path,
+        digest=digest,
+        size=os.path.getsize(path),
+        files=len(files),
+        reused=reused,
+        prepare_s=round(time.perf_counter() - start, 3),
+    )
+    logger.info("build context for %s: %d files, %d bytes, %s", project_dir, context.files, context.size,
+                "reused" if reused else "built")
+    return context
@@ -0,0 +1,50 @@
+"""
+Run checkpoints, written at every stage boundary so `--resume <run-id>` continues without repeating an
+LLM call.
+"""
+import json
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from helper_functions import atomic_write
+
+
+def new_run_id() -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+@dataclass
+class Checkpoint:
+    run_id: str
+    project_name: str
+    project_description: str
+    env_type: str
+    work_dir: str
+    extracted_description: Optional[str] = None
+    stored_messages: List[Dict] = field(default_factory=list)
+    completed_stages: List[str] = field(default_factory=list)
+    # stage -> executed commands, each {"command": ..., "cwd": <directory it ran in, or None for the workspace root>}
+    scripts: Dict[str, List[Dict]] = field(default_factory=dict)
+    finished: bool = False
+    created: float = field(default_factory=time.time)
+    updated: float = field(default_factory=time.time)
+
+    @staticmethod
+    def path(directory: str, run_id: str) -> str:
+        return os.path.join(directory, f"{run_id}.json")
+
+    @classmethod
+    def load(cls, directory: str, run_id: str) -> "Checkpoint":
+        """Load a run's checkpoint. Raises FileNotFoundError if there is none."""
+        with open(cls.path(directory, run_id), encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+    def save(self, directory: str):
+        """Write the checkpoint atomically, so a crash while saving leaves the previous one intact."""
+        os.makedirs(directory, exist_ok=True)
+        self.updated = time.time()
+        with atomic_write(self.path(directory, self.run_id)) as f:
+            json.dump(asdict(self), f, indent=4)
@@ -0,0 +1,231 @@
+"""
+Warm, pre-started containers per image and port set for the docker stage's test runs (agent_skills.run_image_tests).
+"""
+import atexit
+import logging
+import shlex
+import threading
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_IDLE_TIMEOUT = 600          # seconds an idle container is kept
+SWEEP_INTERVAL = 60                 # seconds between the checks for containers idle past the timeout
+POOL_LABEL = "code-catalyst.pool"
+PRISTINE_DIR = "/tmp/.code_catalyst_pristine"
+KEEP_ALIVE_COMMAND = ["sleep", "infinity"]
+
+PoolKey = Tuple[str, Tuple[str, ...]]      # (image id, container ports): containers are only shared by equal keys
+
+
+@dataclass
+class PooledContainer:
+    container: object
+    image_id: str
+    tag: str
+    workdir: str
+    ports: Tuple[str, ...] = ()
+    last_used: float = field(default_factory=time.monotonic)
+    uses: int = 0
+
+    @property
+    def key(self) -> PoolKey:
+        return self.image_id, self.ports
+
+    @property
+    def host_ports(self) -> Dict[str, str]:
+        """Container port -> host port docker picked for it."""
+        self.container.reload()
+        ports = self.container.attrs["NetworkSettings"]["Ports"] or {}
+        return {port: bindings[0]["HostPort"] for port, bindings in ports.items() if bindings}
+
+
+class ContainerPool:
+    """
+    Pool of pre-started containers, keyed by image id and the container ports they publish.
+
+    :param client_factory: returns the Docker client to use (agent_skills.get_docker_client).
+    :param size: idle containers kept per image and port set.
+    :param idle_timeout: seconds after which an idle container is removed.
+    :param sweep_interval: seconds between the background checks for containers idle past idle_timeout.
+    """
+
+    def __init__(self, client_factory: Callable, size: int = DEFAULT_POOL_SIZE, idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 sweep_interval: float = SWEEP_INTERVAL):
+        self.client_factory = client_factory
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self._idle: Dict[PoolKey, List[PooledContainer]] = defaultdict(list)
+        self._tags: Dict[str, str] = {}             # tag -> image id its containers were started from
+        self._starting: Dict[PoolKey, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+        self.stats = {"warm": 0, "cold": 0, "evicted": 0, "reset_failures": 0}
+
+    # public API -----------------------------------------------------------------------------
+
+    def acquire(self, tag: str, ports: Optional[List[str]] = None) -> PooledContainer:
+        """Return a started container of the image currently tagged `tag`, warm if possible."""
+        image_id = self.client_factory().images.get(tag).id
+        key = image_id, tuple(sorted(str(port) for port in ports or []))
+        self._evict(tag, image_id)
+        with self._lock:
+            idle = self._idle[key]
+            pooled = idle.pop() if idle else None
+            self.stats["warm" if pooled is not None else "cold"] += 1
+        if pooled is None:
+            pooled = self._start(tag, key)
+        pooled.uses += 1
+        self._top_up(tag, key)
+        return pooled
+
+    def release(self, pooled: PooledContainer):
+        """Give a container back; its workspace is reset in the background before it is handed out again."""
+        threading.Thread(target=self._reset_and_return, args=(pooled,), daemon=True).start()
+
+    def discard(self, pooled: PooledContainer):
+        self._remove(pooled)
+
+    def shutdown(self):
+        """Remove every idle container of the pool."""
+        with self._lock:
+            self._closed.set()          # also stops the sweeper
+            containers = [pooled for idle in self._idle.values() for pooled in idle]
+            self._idle.clear()
+        for pooled in containers:
+            self._remove(pooled)
+
+    # internals ------------------------------------------------------------------------------
+
+    def _start(self, tag: str, key: PoolKey) -> PooledContainer:
+        image_id, ports = key
+        client = self.client_factory()
+        options = dict(
+            image=image_id,
+            name=f"code-catalyst-{uuid.uuid4().hex[:12]}",
+            labels={POOL_LABEL: tag},
+            # docker picks free host ports, so several containers of one image can run side by side
+            ports={f"{port}/tcp": None for port in ports},
+            detach=True,
+        )
+        container = client.containers.run(**options)
+        container.reload()
+        if container.status != "running":
+            # the image's command exited right away (e.g. a base language image): keep it alive instead
+            container.remove(force=True)
+            container = client.containers.run(entrypoint=KEEP_ALIVE_COMMAND, command=[], **options)
+        workdir = container.attrs["Config"].get("WorkingDir") or "/"
+        pooled = PooledContainer(container=container, image_id=image_id, tag=tag, workdir=workdir, ports=ports)
+        if workdir != "/":
+            snapshot = container.exec_run(["sh", "-c", f"mkdir -p {PRISTINE_DIR} && cp -a {shlex.quote(workdir)}/. {PRISTINE_DIR}/"])
+            if snapshot.exit_code != 0:
+                pooled.workdir = "/"        # no reset possible: the container is used once
+        return pooled
+
+    def _top_up(self, tag: str, key: PoolKey):
+        with self._lock:
+            missing = self.size - len(self._idle[key]) - self._starting[key]
+            self._starting[key] += max(0, missing)
+
+        def start_one():
+            try:
+                pooled = self._start(tag, key)
+                self._put_back(pooled)
+            except Exception as e:
+                logger.warning("could not pre-start a container of %s: %s", tag, e)
+            finally:
+                with self._lock:
+                    self._starting[key] -= 1
+
+        for _ in range(max(0, missing)):
+            threading.Thread(target=start_one, daemon=True).start()
+
+    def _reset_and_return(self, pooled: PooledContainer):
+        if pooled.workdir == "/":
+            self._remove(pooled)
+            return
+        workdir = shlex.quote(pooled.workdir)
+        try:
+            reset = pooled.container.exec_run(
+                ["sh", "-c", f"find {workdir} -mindepth 1 -delete && cp -a {PRISTINE_DIR}/. {workdir}/"]
+            )
+            ok = reset.exit_code == 0
+        except Exception:
+            ok = False
+        if not ok:
+            with self._lock:
+                self.stats["reset_failures"] += 1
+            self._remove(pooled)
+            return
+        self._put_back(pooled)
+
+    def _put_back(self, pooled: PooledContainer):
+        pooled.last_used = time.monotonic()
+        with self._lock:
+            current = self._tags.get(pooled.tag) == pooled.image_id
+            idle = self._idle[pooled.key]
+            if current and not self._closed.is_set() and len(idle) < self.size:
+                idle.append(pooled)
+                if self._sweeper is None:
+                    self._sweeper = threading.Thread(target=self._sweep, name="container_pool_sweeper", daemon=True)
+                    self._sweeper.start()
+                return
+        self._remove(pooled)
+
+    def _sweep(self):
+        # idle containers time out even when no test run comes by to acquire() one
+        while not self._closed.wait(self.sweep_interval):
+            self._evict()
+
+    def _evict(self, tag: Optional[str] = None, image_id: Optional[str] = None):
+        """Drop containers idle for too long and, given a tag, the containers of images `tag` no longer points to."""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            for (key_image_id, _), idle in self._idle.items():
+                stale = tag is not None and key_image_id != image_id and any(pooled.tag == tag for pooled in idle)
+                keep = [p for p in idle if not stale and now - p.last_used < self.idle_timeout]
+                evicted.extend(p for p in idle if p not in keep)
+                idle[:] = keep
+            if tag is not None:
+                self._tags[tag] = image_id
+            self.stats["evicted"] += len(evicted)
+        for pooled in evicted:
+            self._remove(pooled)
+
+    @staticmethod
+    def _remove(pooled: PooledContainer):
+        try:
+            pooled.container.remove(force=True)
+        except Exception as e:
+            logger.debug("could not remove container %s: %s", getattr(pooled.container, "name", "?"), e)
+
+
+_pool: Optional[ContainerPool] = None
+_pool_lock = threading.Lock()
+
+
+def configure_container_pool(size: int = DEFAULT_POOL_SIZE, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+    """Set the size and idle timeout of the process-wide pool (takes effect for the pool's next use)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.size, _pool.idle_timeout = size, idle_timeout
+        else:
+            from agent_skills import get_docker_client
+
+            _pool = ContainerPool(get_docker_client, size=size, idle_timeout=idle_timeout)
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def get_container_pool() -> ContainerPool:
+    """The process-wide pool, created with the defaults on first use."""
+    return _pool if _pool is not None else configure_container_pool()
@@ -0,0 +1,178 @@
+"""
+Keeps the context of a retried stage under its token ceiling: the task and the latest attempt stay, the
+rounds in between are shortened, then dropped.
+"""
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import tiktoken
+
+from MessageScanner import scan_message
+from MessageStore import get_message_store
+
+DEFAULT_TOKEN_LIMIT = 12000
+OMITTED_CODE = "[code from this earlier attempt omitted: {lines} lines]"
+OMITTED_LINES = "[... {lines} lines omitted ...]"
+
+
+def excerpt(text: str, head_lines: int, tail_lines: int) -> str:
+    """Keep the first head_lines and last tail_lines of text."""
+    lines = text.splitlines()
+    if len(lines) <= head_lines + tail_lines:
+        return text
+    omitted = len(lines) - head_lines - tail_lines
+    return "\n".join(lines[:head_lines] + [OMITTED_LINES.format(lines=omitted)] + lines[len(lines) - tail_lines:])
+
+
+def strip_code_blocks(text: str) -> str:
+    """Replace fenced code blocks with a one-line placeholder, keeping the prose (e.g. the summary) around them."""
+    out, block, in_block = [], 0, False
+    for line in text.splitlines():
+        if line.lstrip().startswith("```"):
+            if in_block:
+                out.append(OMITTED_CODE.format(lines=block))
+            in_block, block = not in_block, 0
+            continue
+        if in_block:
+            block += 1
+        else:
+            out.append(line)
+    if in_block:
+        out.append(OMITTED_CODE.format(lines=block))
+    return "\n".join(out)
+
+
+def compress(content: str, head_lines: int, tail_lines: int) -> str:
+    """Shorten an older round: CommandResponse -> its summary, ExecutionResult -> excerpt of its output."""
+    scan = scan_message(content)
+    response, result = scan.command_response, scan.execution_result
+    if response is not None:
+        return f"[earlier attempt with {len(response.commands)} commands omitted]\nSummary: {response.summary}"
+    if result is not None:
+        # the scan's objects are shared: change a copy
+        return result.model_copy(update={"output": excerpt(result.output, head_lines, tail_lines)}).model_dump_json()
+    return excerpt(strip_code_blocks(content), head_lines, tail_lines)
+
+
+def shorten(content: str, head_lines: int, tail_lines: int) -> str:
+    """Shorten the newest round while keeping it usable: only logs are cut, commands stay intact."""
+    scan = scan_message(content)
+    if scan.execution_result is not None:
+        return scan.execution_result.model_copy(
+            update={"output": excerpt(scan.execution_result.output, head_lines, tail_lines)}).model_dump_json()
+    if scan.command_response is not None:
+        return content
+    return excerpt(content, head_lines, tail_lines)
+
+
+class ContextBudgeter:
+    """
+    Compacts retry contexts to a per-stage token ceiling and records how many tokens that saved.
+
+    :param model: model whose tokenizer is used for counting.
+    :param default_limit: token ceiling for stages without an entry in stage_limits.
+    :param stage_limits: per-stage (agent name) token ceilings.
+    """
+
+    def __init__(self, model: str = "gpt-4o", default_limit: int = DEFAULT_TOKEN_LIMIT,
+                 stage_limits: Optional[Dict[str, int]] = None):
+        self.model = model
+        self._encoding = None
+        self.default_limit = default_limit
+        self.stage_limits = dict(stage_limits or {})
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"compactions": 0, "tokens_before": 0, "tokens_after": 0}
+        )
+        # counts of the group chat's contents are kept with them in the message store, so they are released at stage
+        # boundaries; the rest (task, summaries, shortened copies) is small
+        self._count_other_text = lru_cache(maxsize=1024)(self._count_text_uncached)
+
+    def _load_encoding(self):
+        # loaded on first use: tiktoken downloads the BPE ranks the first time an encoding is needed
+        try:
+            try:
+                return tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                return tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            return False        # offline without a cached encoding: fall back to an estimate
+
+    def _count_text_uncached(self, text: str) -> int:
+        if self._encoding is None:
+            self._encoding = self._load_encoding()
+        if self._encoding is False:
+            return len(text) // 4 + 1
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def _count_text(self, text: str) -> int:
+        store = get_message_store()
+        if text in store:
+            return store.cached(text, self._count_text_uncached)
+        return self._count_other_text(text)
+
+    def count(self, messages: List[Dict]) -> int:
+        # ~4 tokens of per-message overhead for role/name framing
+        return sum(self._count_text(str(m.get("content") or "")) + 4 for m in messages)
+
+    def limit_for(self, stage: str) -> int:
+        return self.stage_limits.get(stage, self.default_limit)
+
+    def compact(self, messages: List[Dict], stage: str, head: int = 1) -> List[Dict]:
+        """
+        Return a copy of messages that fits the stage's token ceiling.
+
+        messages[:head] are the task and are never touched; the last two messages (latest attempt and its
+        execution result) are only shortened if head and tail alone are still over the ceiling.
+        """
+        limit = self.limit_for(stage)
+        before = self.count(messages)
+        if before <= limit or len(messages) <= head + 2:
+            compacted = list(messages)
+            if before > limit:
+                compacted = self._shorten_tail(compacted, head, limit)
+        else:
+            task, middle, tail = messages[:head], [dict(m) for m in messages[head:-2]], list(messages[-2:])
+
+            # 1. older rounds: drop code from earlier attempts and cut execution logs down to an excerpt
+            for message in middle:
+                content = str(message.get("content") or "")
+                message["content"] = compress(content, head_lines=3, tail_lines=10)
+
+            # 2. drop the oldest rounds until the ceiling is met
+            while middle and self.count(task + middle + tail) > limit:
+                middle.pop(0)
+
+            compacted = task + middle + tail
+            # 3. last resort: shorten the newest attempt/result themselves
+            if self.count(compacted) > limit:
+                compacted = self._shorten_tail(compacted, head, limit)
+
+        after = self.count(compacted)
+        with self._lock:
+            stats = self._stats[stage]
+            stats["compactions"] += 1
+            stats["tokens_before"] += before
+            stats["tokens_after"] += after
+        return compacted
+
+    def _shorten_tail(self, messages: List[Dict], head: int, limit: int) -> List[Dict]:
+        messages = list(messages)
+        for tail_lines in (200, 80, 30):
+            for index in range(max(head, len(messages) - 2), len(messages)):
+                content = str(messages[index].get("content") or "")
+                # errors are at the end of execution logs, so keep more of the tail
+                messages[index] = {**messages[index], "content": shorten(content, head_lines=10, tail_lines=tail_lines)}
+            if self.count(messages) <= limit:
+                break
+        return messages
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Per-stage compaction counters, including the tokens saved."""
+        with self._lock:
+            return {
+                stage: {**counts, "saved": counts["tokens_before"] - counts["tokens_after"]}
+                for stage, counts in self._stats.items()
+            }
@@ -1,4 +1,19 @@
-from autogen.coding import CodeBlock,CodeExecutor,CodeExtractor,CodeResult
+from autogen.coding import CodeBlock,CodeExecutor,CodeExtractor,CodeResult,MarkdownCodeExtractor
+from rich.console import Console
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional, Sequence
+from structured_output import CommandOutcome, ExecutionResult
+from ExecutionLedger import ExecutionLedger, LedgerEntry, changes_environment
+from Tracer import record_span
+import os
+import queue
+import shlex
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
 
 """
 On ConversableAgent, we have the following methods:
@@ -21,8 +36,277 @@ On ConversableAgent, we have the following methods:
         It uses a ThreadPoolExecutor to run the code in a separate thread. This allows for timeout management.
 
     we need to first override generate_reply(), so places where generate reply is used:
-        
 
+
+PersistentShellExecutor below plugs into the first path: pass it as {"executor": PersistentShellExecutor(...)} in
+code_execution_config and ConversableAgent will extract the code blocks and hand them to execute_code_blocks().
+Unlike the stock local executor it keeps ONE bash process per session, so `source venv/bin/activate`, exported
+variables and (optionally) the working directory survive from one code block / message to the next.
 """
 
+SHELL_LANGUAGES = ["bash", "shell", "sh", "zsh", ""]
+PYTHON_LANGUAGES = ["python", "py", "python3"]
+TIMEOUT_EXIT_CODE = 124
+
+
+@dataclass
+class ShellRunResult:
+    exit_code: int
+    output: str
+    duration: float
+    cwd: str
+
+
+class PersistentShellExecutor(CodeExecutor):
+    """
+    Executes code blocks in one long-lived bash process.
+
+    :param work_dir: directory the shell starts in.
+    :param timeout: seconds a single code block may run before the shell is killed and restarted.
+    :param keep_cwd: if False, every execute_code_blocks() call starts again from work_dir (the environment,
+        e.g. an activated venv, is still kept).
+    :param console: output is streamed line by line to this console while a block runs.
+    :param on_output: optional callback receiving every output line as it arrives.
+    :param ledger: records succeeded commands so execute_commands can skip them when a stage is retried.
+    """
+
+    def __init__(
+        self,
+        work_dir: str = ".",
+        timeout: int = 600,
+        keep_cwd: bool = True,
+        console: Optional[Console] = None,
+        on_output: Optional[Callable[[str], None]] = None,
+        shell: str = "/bin/bash",
+        ledger: Optional[ExecutionLedger] = None,
+    ):
+        self.work_dir = os.path.abspath(work_dir)
+        self.timeout = timeout
+        self.keep_cwd = keep_cwd
+        self.console = console
+        self.on_output = on_output
+        self.shell = shell
+        self.ledger = ledger
+        self.cwd = self.work_dir
+        self._process: Optional[subprocess.Popen] = None
+        self._lines: Optional[queue.Queue] = None
+        self._script_dir = tempfile.mkdtemp(prefix="code_catalyst_shell_")
+        self._lock = threading.Lock()
+
+    @property
+    def code_extractor(self) -> CodeExtractor:
+        return MarkdownCodeExtractor()
+
+    # shell lifecycle ------------------------------------------------------------------------
+
+    def _start(self):
+        os.makedirs(self.work_dir, exist_ok=True)
+        self._process = subprocess.Popen(
+            [self.shell, "--noprofile", "--norc"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            cwd=self.work_dir,
+            text=True,
+            bufsize=1,
+            errors="replace",
+            start_new_session=True,     # own process group, so a timeout can kill everything the block started
+        )
+        self._lines = queue.Queue()
+        threading.Thread(target=self._pump, args=(self._process, self._lines), daemon=True).start()
+        self.cwd = self.work_dir
+
+    @staticmethod
+    def _pump(process: subprocess.Popen, lines: queue.Queue):
+        for line in process.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    def _alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def stop(self):
+        """Terminate the shell and everything it started."""
+        if self._process is None:
+            return
+        if self._process.poll() is None:
+            try:
+                os.killpg(self._process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                self._process.kill()
+        self._process.wait()
+        self._process = None
+
+    def restart(self) -> None:
+        self.stop()
+        self._start()
+
+    # execution ------------------------------------------------------------------------------
+
+    def run(self, script: str, timeout: Optional[int] = None) -> ShellRunResult:
+        """Run a shell script in the persistent session, streaming its output, and wait for it to finish."""
+        with self._lock:
+            if not self._alive():
+                self._start()
+            timeout = timeout or self.timeout
+            script_path = os.path.join(self._script_dir, f"block_{uuid.uuid4().hex}.sh")
+            with open(script_path, "w", encoding="utf-8") as f:
+                f.write(script + "\n")
+
+            sentinel = f"__CODE_CATALYST_DONE_{uuid.uuid4().hex}__"
+            # sourcing keeps cd/export/activate in this shell; stdin is detached so prompts cannot hang the session
+            self._process.stdin.write(
+                f"source {shlex.quote(script_path)} < /dev/null\n"
+                f"__cc_status=$?; set +e\n"
+                f"printf '\\n%s %s %s\\n' {sentinel} \"$__cc_status\" \"$PWD\"\n"
+            )
+            self._process.stdin.flush()
+
+            start = time.perf_counter()
+            deadline = start + timeout
+            output, exit_code, held_blank = [], None, None
+            while True:
+                try:
+                    line = self._lines.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    output.append(f"\nTimeout: the code block did not finish within {timeout}s and the shell was restarted.")
+                    exit_code = TIMEOUT_EXIT_CODE
+                    self.restart()
+                    break
+                if line is None:
+                    # the script called `exit` (or the shell died); the next run starts a fresh shell
+                    exit_code = self._process.wait()
+                    output.append(f"\nThe shell exited with code {exit_code}; a new shell will be started.")
+                    self._process = None
+                    break
+                if line.startswith(sentinel):
+                    _, status, cwd = line.rstrip("\n").split(" ", 2)
+                    exit_code, self.cwd = int(status), cwd
+                    break
+                if held_blank:
+                    self._stream(held_blank)
+                # a blank line may be the newline printed in front of the sentinel, so stream it one line late
+                held_blank = line if line == "\n" else None
+                output.append(line)
+                if held_blank is None:
+                    self._stream(line)
+
+            os.remove(script_path)
+            text = "".join(output)
+            if text.endswith("\n\n"):
+                text = text[:-1]      # the newline printed in front of the sentinel
+            return ShellRunResult(exit_code, text, time.perf_counter() - start, self.cwd)
+
+    def _stream(self, line: str):
+        if self.console is not None:
+            self.console.print(line.rstrip("\n"), style="dim", markup=False, highlight=False)
+        if self.on_output is not None:
+            self.on_output(line)
+
+    def _script_for(self, code_block: CodeBlock) -> Optional[str]:
+        language = code_block.language.lower()
+        if language in SHELL_LANGUAGES:
+            return code_block.code
+        if language in PYTHON_LANGUAGES:
+            path = os.path.join(self._script_dir, f"block_{uuid.uuid4().hex}.py")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(code_block.code)
+            # run with whatever python is active in the session (e.g. the project's venv)
+            return f'"$(command -v python || command -v python3)" {shlex.quote(path)}; __cc_py=$?; rm -f {shlex.quote(path)}; (exit $__cc_py)'
+        return None
+
+    def _reset_cwd(self):
+        if not self.keep_cwd and self._alive():
+            self.run(f"cd {shlex.quote(self.work_dir)}")
+
+    def execute_code_blocks(self, code_blocks: List[CodeBlock]) -> CodeResult:
+        self._reset_cwd()
+        outputs, exit_code = [], 0
+        for code_block in code_blocks:
+            script = self._script_for(code_block)
+            if script is None:
+                outputs.append(f"unknown language {code_block.language}")
+                exit_code = 1
+                break
+            result = self.run(script)
+            outputs.append(result.output)
+            exit_code = result.exit_code
+            if exit_code != 0:
+                break
+        return CodeResult(exit_code=exit_code, output="".join(outputs))
+
+    def execute_commands(self, commands: Sequence, stage: Optional[str] = None) -> ExecutionResult:
+        """
+        Run a structured command list (CommandResponse.commands) one command at a time in the session,
+        stopping at the first command that fails.
+
+        With a ledger and a stage, the leading commands that already succeeded in the stage's previous attempt
+        (and whose workspace effects still hold) are skipped, see ExecutionLedger.
+        """
+        self._reset_cwd()
+        start = time.perf_counter()
+        texts = [item["command"] if isinstance(item, dict) else item.command for item in commands]
+
+        incremental = self.ledger is not None and stage is not None
+        prefix, state = self.ledger.reusable_prefix(stage, texts, self.cwd) if incremental else ([], None)
+        if incremental:
+            self.ledger.restart(stage, prefix, state)
+        return self._run_commands(texts, stage if incremental else None, prefix, state, start)
+
+    def execute_stream(self, commands: Iterable[str], stage: Optional[str] = None) -> ExecutionResult:
+        """
+        Like execute_commands, for a command list that is still being generated: `commands` yields each command
+        as soon as it is complete. Nothing is skipped (the full list is not known up front), so the ledger records
+        this attempt of the stage from scratch.
+        """
+        self._reset_cwd()
+        start = time.perf_counter()
+        incremental = self.ledger is not None and stage is not None
+        prefix, state = self.ledger.reusable_prefix(stage, [], self.cwd) if incremental else ([], None)
+        if incremental:
+            self.ledger.restart(stage, prefix, state)
+        return self._run_commands(commands, stage if incremental else None, prefix, state, start)
+
+    def _run_commands(self, texts: Iterable[str], stage: Optional[str], prefix: List[LedgerEntry], state,
+                      start: float) -> ExecutionResult:
+        # stage is None unless the commands are recorded in the ledger
+        outcomes, outputs = [], []
+        exit_code, failed_command = 0, None
+        incremental = stage is not None
+        reused, resume_cwd = [], None
+
+        for index, command in enumerate(texts):
+            if failed_command is not None:
+                outcomes.append(CommandOutcome(command=command, skipped=True))
+                continue
+            if index < len(prefix) and not changes_environment(command):
+                reused.append(prefix[index])
+                resume_cwd = prefix[index].cwd_after
+                outcomes.append(CommandOutcome(command=command, exit_code=0, reused=True))
+                outputs.append(f"$ {command}\n[already succeeded in the previous attempt, its effects are unchanged: not run again]\n")
+                continue
+
+            cwd_before = prefix[index].cwd_before if index < len(prefix) else (resume_cwd or self.cwd)
+            if self.cwd != cwd_before:
+                self.run(f"cd {shlex.quote(cwd_before)}")       # where the skipped commands would have left the shell
+            resume_cwd = None
+            result = self.run(command)
+            record_span("exec", "exec", result.duration, status="ok" if result.exit_code == 0 else "error",
+                        command=command, exit_code=result.exit_code)
+            outcomes.append(CommandOutcome(command=command, exit_code=result.exit_code, duration=result.duration))
+            outputs.append(f"$ {command}\n{result.output}")
+            if result.exit_code != 0:
+                exit_code, failed_command = result.exit_code, command
+            elif incremental and index >= len(prefix):
+                entry = LedgerEntry(command=command, cwd_before=cwd_before, cwd_after=self.cwd, duration=result.duration)
+                state = self.ledger.record(stage, entry, state)
 
+        if reused:
+            self.ledger.count_reuse(stage, reused)
+        return ExecutionResult(
+            exit_code=exit_code,
+            output="".join(outputs),
+            failed_command=failed_command,
+            duration=time.perf_counter() - start,
+            commands=outcomes,
+        )
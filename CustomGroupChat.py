@@ -4,18 +4,41 @@ from autogen.exception_utils import NoEligibleSpeaker
 from autogen.io.base import IOStream
 from autogen.runtime_logging import log_new_agent,logging_enabled
 from typing import Dict, List, Optional, Tuple, Union,Literal,Callable
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import sys
 import logging
 
+from MessageStore import MessageStore
+
 logger = logging.getLogger(__name__)
 
 @dataclass
 class CustomGroupChat(GroupChat):
+    message_store: Optional[MessageStore] = None         # holds the contents of the messages until they are cleared
+    _held: List[str] = field(default_factory=list, init=False, repr=False)
 
     def __post_init__(self):
         super().__post_init__()
 
+    def append(self, message: Dict, speaker: Agent):
+        super().append(message, speaker)
+        content = message["content"]
+        # only text is held: multimodal (list) content is not hashable
+        if self.message_store is not None and isinstance(content, str) and content:
+            # the manager's history entry is this same dict, so it shares the stored content too
+            message["content"] = self.message_store.hold(content)
+            self._held.append(message["content"])
+
+    def clear_messages(self):
+        """Forget the messages and release their contents from the message store."""
+        self.messages.clear()
+        if self.message_store is not None:
+            self.message_store.release(self._held)
+        self._held.clear()
+
+    def reset(self):
+        self.clear_messages()
+
     def _prepare_and_select_agents(
         self,
         last_speaker: Agent,
@@ -162,6 +185,20 @@ class CustomGroupChat(GroupChat):
         # auto speaker selection with 2-agent chat
         return self._auto_select_speaker(last_speaker, selector, messages, agents)
 
+    async def a_select_speaker(self, last_speaker: Agent, selector: ConversableAgent) -> Tuple[Agent, Optional[List[Dict]]]:
+        """Select the next speaker (with requery), asynchronously."""
+
+        # Prepare the list of available agents and select an agent if selection method allows (non-auto)
+        selected_agent, agents, messages = self._prepare_and_select_agents(last_speaker)
+        if selected_agent:
+            return selected_agent,messages                              # MODIFIED - returning the message from custom speaker_selection_method to a_run_chat of chat_manager_agent
+        elif self.speaker_selection_method == "manual":
+            # An agent has not been selected while in manual mode, so move to the next agent
+            return self.next_agent(last_speaker),None                   # MODIFIED - always a (speaker, send_msg) pair so a_run_chat can unpack it
+
+        # auto speaker selection with 2-agent chat
+        return await self.a_auto_select_speaker(last_speaker, selector, messages, agents),None
+
 
     
 class CustomGroupChatManager(GroupChatManager):
@@ -291,4 +328,83 @@ class CustomGroupChatManager(GroupChatManager):
             for a in groupchat.agents:
                 a.client_cache = a.previous_cache
                 a.previous_cache = None
-        return True, None
\ No newline at end of file
+        return True, None
+
+    async def a_run_chat(
+        self,
+        messages: Optional[List[Dict]] = None,
+        sender: Optional[Agent] = None,
+        config: Optional[GroupChat] = None,
+    ):
+        """Run a group chat asynchronously. Mirrors run_chat, including the (speaker, send_msg) protocol."""
+        if messages is None:
+            messages = self._oai_messages[sender]
+        message = messages[-1]
+        speaker = sender
+        groupchat = config
+        send_introductions = getattr(groupchat, "send_introductions", False)
+        silent = getattr(self, "_silent", False)
+
+        if send_introductions:
+            # Broadcast the intro
+            intro = groupchat.introductions_msg()
+            for agent in groupchat.agents:
+                await self.a_send(intro, agent, request_reply=False, silent=True)
+            # NOTE: We do not also append to groupchat.messages,
+            # since groupchat handles its own introductions
+
+        if self.client_cache is not None:
+            for a in groupchat.agents:
+                a.previous_cache = a.client_cache
+                a.client_cache = self.client_cache
+        for i in range(groupchat.max_round):
+            groupchat.append(message, speaker)
+            # broadcast the message to all agents except the speaker
+            for agent in groupchat.agents:
+                if agent != speaker and i == 0:                        # MODIFIED : broadcast only the first message of the groupChat otherwise its causing an error in ConversableAgent.
+                    await self.a_send(message, agent, request_reply=False, silent=True)
+            if self._is_termination_msg(message) or i == groupchat.max_round - 1:
+                # The conversation is over or it's the last round
+                break
+            try:
+                # select the next speaker
+                speaker , send_msg = await groupchat.a_select_speaker(speaker, self)     # MODIFIED - accepting the message from custom speaker_selection_method
+                if not silent:
+                    iostream = IOStream.get_default()
+                    iostream.print(colored(f"\nNext speaker: {speaker.name}\n", "green"), flush=True)
+                # let the speaker speak
+                reply = await speaker.a_generate_reply(sender=self,messages=send_msg)     # MODIFIED - sending the message from custom speaker_selection_method to a_generate_reply of speaker_agent.
+            except KeyboardInterrupt:
+                # let the admin agent speak if interrupted
+                if groupchat.admin_name in groupchat.agent_names:
+                    # admin agent is one of the participants
+                    speaker = groupchat.agent_by_name(groupchat.admin_name)
+                    reply = await speaker.a_generate_reply(sender=self)
+                else:
+                    # admin agent is not found in the participants
+                    raise
+            except NoEligibleSpeaker:
+                # No eligible speaker, terminate the conversation
+                break
+
+            if reply is None:
+                # no reply is generated, exit the chat
+                break
+
+            # check for "clear history" phrase in reply and activate clear history function if found
+            if (
+                groupchat.enable_clear_history
+                and isinstance(reply, dict)
+                and reply["content"]
+                and "CLEAR HISTORY" in reply["content"].upper()
+            ):
+                reply["content"] = self.clear_agents_history(reply, groupchat)
+
+            # The speaker sends the message without requesting a reply
+            await speaker.a_send(reply, self, request_reply=False, silent=silent)
+            message = self.last_message(speaker)
+        if self.client_cache is not None:
+            for a in groupchat.agents:
+                a.client_cache = a.previous_cache
+                a.previous_cache = None
+        return True, None
@@ -0,0 +1,158 @@
+"""
+Skips the leading commands of a retried stage that are unchanged and whose changes to the workspace are
+still intact.
+"""
+import hashlib
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Tuple
+
+from ParallelCommandExecutor import split_segments
+
+HEAVY_DIRS = {"node_modules", "venv", ".venv", ".git", "__pycache__", "target", ".next", ".gradle", ".tox",
+              ".pytest_cache", ".mypy_cache", "dist", "build"}
+HEAVY_DIR_DEPTH = 3
+ENV_COMMANDS = {"source", ".", "export", "unset", "alias", "set", "deactivate", "conda", "nvm", "pyenv", "ulimit", "umask"}
+_ASSIGNMENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+
+Fingerprint = Tuple
+
+
+def changes_environment(command: str) -> bool:
+    """True if any segment of command changes the shell session (venv activation, exported variables, ...)."""
+    for segment in split_segments(command):
+        words = segment.split()
+        if words and (words[0] in ENV_COMMANDS or _ASSIGNMENT.match(segment)):
+            return True
+    return False
+
+
+def _summarize_dir(path: str) -> Fingerprint:
+    digest = hashlib.sha256()
+    stack = [(path, 0)]
+    while stack:
+        current, depth = stack.pop()
+        try:
+            digest.update(f"{os.path.relpath(current, path)}:{os.stat(current).st_mtime_ns}\n".encode())
+            if depth >= HEAVY_DIR_DEPTH:
+                continue
+            with os.scandir(current) as entries:
+                subdirs = sorted(e.path for e in entries if e.is_dir(follow_symlinks=False))
+        except OSError:
+            continue
+        stack.extend((subdir, depth + 1) for subdir in reversed(subdirs))
+    return ("dir", digest.hexdigest())
+
+
+def snapshot(root: str) -> Dict[str, Fingerprint]:
+    """Fingerprint every path below root, with heavy directories summarized as one entry."""
+    state: Dict[str, Fingerprint] = {}
+    if not os.path.isdir(root):
+        return state
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError:
+            continue
+        for entry in entries:
+            relpath = os.path.relpath(entry.path, root)
+            try:
+                if entry.is_symlink():
+                    state[relpath] = ("link", os.readlink(entry.path))
+                elif entry.is_dir():
+                    if entry.name in HEAVY_DIRS or os.path.exists(os.path.join(entry.path, "pyvenv.cfg")):
+                        state[relpath] = _summarize_dir(entry.path)
+                    else:
+                        state[relpath] = ("dir",)
+                        stack.append(entry.path)
+                else:
+                    info = entry.stat()
+                    state[relpath] = ("file", info.st_size, info.st_mtime_ns)
+            except OSError:
+                continue
+    return state
+
+
+def changed_paths(before: Dict[str, Fingerprint], after: Dict[str, Fingerprint]) -> List[str]:
+    return [path for path in set(before) | set(after) if before.get(path) != after.get(path)]
+
+
+@dataclass
+class LedgerEntry:
+    command: str
+    cwd_before: str
+    cwd_after: str
+    duration: float
+    paths: List[str] = field(default_factory=list)      # paths the command added, changed or removed
+
+
+@dataclass
+class StageLedger:
+    entries: List[LedgerEntry] = field(default_factory=list)
+    state: Dict[str, Fingerprint] = field(default_factory=dict)     # workspace after the last successful command
+
+
+class ExecutionLedger:
+    """Per-stage record of successfully executed commands and their workspace effects."""
+
+    def __init__(self, work_dir: str):
+        self.work_dir = os.path.abspath(work_dir)
+        self._stages: Dict[str, StageLedger] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def reusable_prefix(self, stage: str, commands: Sequence[str], cwd: str) -> Tuple[List[LedgerEntry], Dict[str, Fingerprint]]:
+        """
+        Ledger entries of the leading commands that can be skipped (env-changing ones are re-run by the caller),
+        and the current workspace state.
+        """
+        current = snapshot(self.work_dir)
+        ledger = self._stages.get(stage)
+        if ledger is None:
+            return [], current
+        prefix, touched = [], set()
+        for command, entry in zip(commands, ledger.entries):
+            if command != entry.command or entry.cwd_before != cwd:
+                break
+            touched.update(entry.paths)
+            if any(current.get(path) != ledger.state.get(path) for path in touched):
+                break
+            prefix.append(entry)
+            cwd = entry.cwd_after
+        return prefix, current
+
+    def restart(self, stage: str, kept: List[LedgerEntry], state: Dict[str, Fingerprint]):
+        """Start recording a new attempt of stage after the kept prefix, from the given workspace state."""
+        with self._lock:
+            self._stages[stage] = StageLedger(entries=list(kept), state=state)
+
+    def record(self, stage: str, entry: LedgerEntry, before: Dict[str, Fingerprint]) -> Dict[str, Fingerprint]:
+        """Record a successful command; returns the workspace state after it."""
+        after = snapshot(self.work_dir)
+        entry.paths = changed_paths(before, after)
+        with self._lock:
+            ledger = self._stages.setdefault(stage, StageLedger())
+            ledger.entries.append(entry)
+            ledger.state = after
+        return after
+
+    def entries(self, stage: str) -> List[LedgerEntry]:
+        """Commands of the stage's latest attempt that succeeded (including the skipped prefix)."""
+        with self._lock:
+            ledger = self._stages.get(stage)
+            return list(ledger.entries) if ledger is not None else []
+
+    def count_reuse(self, stage: str, entries: List[LedgerEntry]):
+        with self._lock:
+            stats = self._stats.setdefault(stage, {"reused": 0, "saved_s": 0.0})
+            stats["reused"] += len(entries)
+            stats["saved_s"] += sum(entry.duration for entry in entries)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage number of commands skipped on retries and the execution time they took originally."""
+        with self._lock:
+            return {stage: dict(counts) for stage, counts in self._stats.items()}
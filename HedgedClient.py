@@ -0,0 +1,172 @@
+"""
+Hedged LLM requests: a completion slower than its model's recent tail latency is sent again and the first
+answer wins, within a budget of extra requests.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from autogen.oai.client import OpenAIClient, OpenAIWrapper
+from openai import AsyncOpenAI, OpenAI
+
+from helper_functions import percentile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEDGE_PERCENTILE = 0.95
+DEFAULT_HEDGE_BUDGET = 0.1
+DEFAULT_MIN_SAMPLES = 10
+DEFAULT_WINDOW = 200
+MIN_HEDGE_DELAY = 0.5           # seconds; faster requests are never hedged
+CLOSE_TIMEOUT = 10              # seconds close() waits for the clients to close their connections
+
+
+class Hedger:
+    """
+    Latency tracking, hedging budget and counters shared by all HedgedOpenAIClients of a session.
+
+    :param percentile: a request is hedged once it runs longer than this percentile of the model's recent latencies.
+    :param budget: extra (hedge) requests allowed per request sent.
+    :param max_extra_cost: cap on the estimated extra spend in USD (None: only the request budget applies).
+    """
+
+    def __init__(self, percentile: float = DEFAULT_HEDGE_PERCENTILE, budget: float = DEFAULT_HEDGE_BUDGET,
+                 max_extra_cost: Optional[float] = None, min_samples: int = DEFAULT_MIN_SAMPLES,
+                 window: int = DEFAULT_WINDOW):
+        self.percentile = percentile
+        self.budget = budget
+        self.max_extra_cost = max_extra_cost
+        self.min_samples = min_samples
+        self._latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._counters: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"requests": 0, "hedged": 0, "hedge_won": 0, "denied": 0, "extra_cost": 0.0}
+        )
+        self._lock = threading.Lock()
+        self._clients: Dict[Tuple, AsyncOpenAI] = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="hedged_requests", daemon=True)
+        self._thread.start()
+
+    def delay(self, model: str) -> Optional[float]:
+        """Seconds after which a request to model is hedged, or None while there are too few samples."""
+        with self._lock:
+            latencies = list(self._latencies[model])
+        if len(latencies) < self.min_samples:
+            return None
+        return max(MIN_HEDGE_DELAY, percentile(latencies, self.percentile))
+
+    def _allow_hedge(self, model: str) -> bool:
+        with self._lock:
+            totals = {key: sum(c[key] for c in self._counters.values()) for key in ("requests", "hedged", "extra_cost")}
+            allowed = totals["hedged"] + 1 <= self.budget * totals["requests"] and (
+                self.max_extra_cost is None or totals["extra_cost"] < self.max_extra_cost
+            )
+            self._counters[model]["hedged" if allowed else "denied"] += 1
+        return allowed
+
+    def _count(self, model: str, key: str, amount: float = 1):
+        with self._lock:
+            self._counters[model][key] += amount
+
+    def _record_latency(self, model: str, latency: float):
+        with self._lock:
+            self._latencies[model].append(latency)
+
+    def _async_client(self, openai_config: Dict[str, Any]) -> AsyncOpenAI:
+        key = tuple(sorted((k, str(v)) for k, v in openai_config.items()))
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = AsyncOpenAI(**openai_config)
+            return self._clients[key]
+
+    def complete(self, openai_config: Dict[str, Any], params: Dict[str, Any], cost) -> Any:
+        """Run a (possibly hedged) chat completion on the event loop thread and wait for it."""
+        client = self._async_client(openai_config)
+        future = asyncio.run_coroutine_threadsafe(self._hedged(client, params, cost), self._loop)
+        return future.result()
+
+    async def _timed_request(self, client: AsyncOpenAI, params: Dict[str, Any]):
+        start = time.perf_counter()
+        response = await client.chat.completions.create(**params)
+        return response, time.perf_counter() - start
+
+    async def _hedged(self, client: AsyncOpenAI, params: Dict[str, Any], cost):
+        model = params.get("model")
+        self._count(model, "requests")
+        primary = asyncio.ensure_future(self._timed_request(client, params))
+        delay = self.delay(model)
+        if delay is not None:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if not done and self._allow_hedge(model):
+                logger.info("hedging a %s request after %.1fs", model, delay)
+                hedge = asyncio.ensure_future(self._timed_request(client, params))
+                return await self._first_of(model, primary, hedge, cost)
+        response, latency = await primary
+        self._record_latency(model, latency)
+        return response
+
+    async def _first_of(self, model: str, primary: asyncio.Future, hedge: asyncio.Future, cost):
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                for other in pending:
+                    other.cancel()
+                response, latency = task.result()
+                self._record_latency(model, latency)
+                if task is hedge:
+                    self._count(model, "hedge_won")
+                self._count(model, "extra_cost", cost(response))
+                return response
+        raise error
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-model counters: requests, hedged (fired), hedge_won, denied (over budget) and estimated extra cost."""
+        with self._lock:
+            return {model: dict(counts) for model, counts in self._counters.items()}
+
+    async def _shutdown(self, clients):
+        current = asyncio.current_task()
+        for task in asyncio.all_tasks():
+            if task is not current:
+                task.cancel()           # hedges that lost and are still waiting on a response
+        await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+
+    def close(self):
+        """Close the clients' HTTP connections, then stop and close the event loop (and join its thread)."""
+        if self._loop.is_closed():
+            return
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(clients), self._loop).result(timeout=CLOSE_TIMEOUT)
+        except Exception as e:
+            logger.warning("could not close the hedged request clients: %s", e)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+class HedgedOpenAIClient(OpenAIClient):
+    """autogen model client whose chat completions go through a Hedger."""
+
+    def __init__(self, config: Dict[str, Any], hedger: Hedger, **kwargs):
+        openai_config = {k: v for k, v in config.items() if k in OpenAIWrapper.openai_kwargs}
+        # the sync client serves what is not hedged (legacy completions); cost/usage come from OpenAIClient
+        super().__init__(OpenAI(**openai_config))
+        self._openai_config = openai_config
+        self._hedger = hedger
+
+    def create(self, params: Dict[str, Any]):
+        params = {k: v for k, v in params.items() if k != "model_client_cls"}
+        if "messages" not in params or params.get("stream"):
+            return super().create(params)
+        params["stream"] = False
+        return self._hedger.complete(self._openai_config, params, self.cost)
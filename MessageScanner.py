@@ -0,0 +1,87 @@
+"""
+One scan per message content (decoded JSON, code blocks, summary, termination marker), shared by everything
+that looks at the message. Treat the results as read-only.
+"""
+import re
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from autogen.code_utils import CODE_BLOCK_PATTERN, UNKNOWN, infer_lang
+from autogen.coding import CodeBlock
+from pydantic import ValidationError
+
+from MessageStore import get_message_store
+from structured_output import CommandResponse, ExecutionResult, load_message_json
+
+TERMINATION_LINES = 15
+TERMINATION_MARKER = "TERMINATE"
+
+_TERMINATION = re.compile(TERMINATION_MARKER, re.IGNORECASE)
+
+# autogen's code block pattern, or the first "summary" heading (extract_summary's pattern)
+_FREE_TEXT = re.compile(rf"{CODE_BLOCK_PATTERN}|(?P<summary>[Ss][Uu][Mm][Mm][Aa][Rr][Yy])", re.DOTALL)
+
+
+@dataclass(frozen=True)
+class ScannedMessage:
+    command_response: Optional[CommandResponse] = None     # an agent's structured proposal
+    execution_result: Optional[ExecutionResult] = None     # HumanProxyGroup's report
+    code_blocks: Tuple[CodeBlock, ...] = ()                # markdown code blocks of a free-text message
+    summary: Optional[str] = None                          # text after the first "summary" line of a free-text message
+    terminated: bool = False                               # TERMINATE in one of the last lines
+
+    @property
+    def exit_code(self) -> Optional[int]:
+        return self.execution_result.exit_code if self.execution_result is not None else None
+
+
+EMPTY_SCAN = ScannedMessage()
+
+
+def _tail(content: str, lines: int) -> str:
+    # like content.splitlines()[-lines:] without splitting the rest of the content
+    end = len(content) - 1 if content.endswith("\n") else len(content)
+    for _ in range(lines):
+        end = content.rfind("\n", 0, end)
+        if end < 0:
+            return content
+    return content[end + 1:]
+
+
+def _scan_free_text(content: str) -> Tuple[Tuple[CodeBlock, ...], Optional[str]]:
+    blocks, summary = [], None
+    for match in _FREE_TEXT.finditer(content):
+        if match.group("summary") is None:
+            language, code = match.group(1) or "", match.group(2)
+            language = language or infer_lang(code)
+            blocks.append(CodeBlock(code=code, language="" if language == UNKNOWN else language))
+        elif summary is None:
+            newline = content.find("\n", match.end())
+            if newline >= 0:
+                summary = content[newline + 1:].strip()
+    return tuple(blocks), summary
+
+
+def _scan(content: str) -> ScannedMessage:
+    terminated = _TERMINATION.search(_tail(content, TERMINATION_LINES)) is not None
+    data = load_message_json(content)
+    if data is not None:
+        # an ExecutionResult has a "commands" list too (its outcomes)
+        for model, field in ((ExecutionResult, "exit_code"), (CommandResponse, "commands")):
+            if field in data:
+                try:
+                    parsed = model.model_validate(data)
+                except ValidationError:
+                    continue
+                if model is ExecutionResult:
+                    return ScannedMessage(execution_result=parsed, terminated=terminated)
+                return ScannedMessage(command_response=parsed, terminated=terminated)
+    code_blocks, summary = _scan_free_text(content)
+    return ScannedMessage(code_blocks=code_blocks, summary=summary, terminated=terminated)
+
+
+def scan_message(content) -> ScannedMessage:
+    """The scan of a message content (str; None and non-text content scan as empty), computed once while held."""
+    if not isinstance(content, str) or not content:
+        return EMPTY_SCAN
+    return get_message_store().cached(content, _scan)
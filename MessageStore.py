@@ -0,0 +1,109 @@
+"""
+Message contents of the process' group chats, held once per distinct content and released, with what was
+derived from them, at stage boundaries.
+"""
+import ctypes
+import threading
+from typing import Any, Callable, Dict, Iterable, TypeVar
+
+T = TypeVar("T")
+TRIM_MIN_CHARS = 1024 ** 2       # released since the last trim; below that a trim is not worth a walk of the heap
+
+
+def _load_malloc_trim():
+    try:
+        return ctypes.CDLL(None).malloc_trim
+    except (OSError, AttributeError):
+        return None           # not glibc: freed memory is returned (or not) by the platform's allocator
+
+
+_malloc_trim = _load_malloc_trim()
+
+
+class _Entry:
+    __slots__ = ("content", "refs", "derived")
+
+    def __init__(self, content: str):
+        self.content = content
+        self.refs = 0
+        self.derived: Dict[Callable, Any] = {}
+
+
+class MessageStore:
+    """Reference-counted message contents, with values derived from them kept as long as they are held."""
+
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self.deduplicated = 0          # holds of a content that was held already
+        self.trims = 0
+        self._released_chars = 0       # of the entries dropped since the last trim
+
+    def hold(self, content: str) -> str:
+        """Take a reference to `content`; returns the stored string equal to it (store it instead of `content`)."""
+        with self._lock:
+            entry = self._entries.get(content)
+            if entry is None:
+                entry = self._entries[content] = _Entry(content)
+            else:
+                self.deduplicated += 1
+            entry.refs += 1
+            return entry.content
+
+    def release(self, contents: Iterable[str]):
+        """Drop one reference to each of `contents`; entries without references are forgotten."""
+        with self._lock:
+            for content in contents:
+                entry = self._entries.get(content)
+                if entry is None:
+                    continue
+                entry.refs -= 1
+                if entry.refs <= 0:
+                    del self._entries[content]
+                    self._released_chars += len(content)
+
+    def cached(self, content: str, compute: Callable[[str], T]) -> T:
+        """compute(content), computed once while `content` is held (and on every call when it is not)."""
+        with self._lock:
+            entry = self._entries.get(content)
+            if entry is not None and compute in entry.derived:
+                return entry.derived[compute]
+        value = compute(content)
+        with self._lock:
+            # the entry may have been released (or held) while computing
+            entry = self._entries.get(content)
+            if entry is not None:
+                entry.derived.setdefault(compute, value)
+        return value
+
+    def trim(self):
+        """Hand the heap memory freed by dropped entries back to the OS, once TRIM_MIN_CHARS were dropped since the last."""
+        with self._lock:
+            if self._released_chars < TRIM_MIN_CHARS:
+                return
+            self._released_chars = 0
+            self.trims += 1
+        if _malloc_trim is not None:
+            _malloc_trim(0)
+
+    def __contains__(self, content: str) -> bool:
+        with self._lock:
+            return content in self._entries
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "contents": len(self._entries),
+                "references": sum(entry.refs for entry in self._entries.values()),
+                "chars": sum(len(content) for content in self._entries),
+                "deduplicated": self.deduplicated,
+                "trims": self.trims,
+            }
+
+
+_store = MessageStore()
+
+
+def get_message_store() -> MessageStore:
+    """The process-wide store, shared by all sessions (and their group chats) in this process."""
+    return _store
@@ -0,0 +1,236 @@
+"""
+Per-stage model routing: each agent's clients are reordered by the rolling latency and success rate of its
+policy's models.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from autogen import ConversableAgent
+
+from helper_functions import atomic_write, percentile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_STATS_PATH = os.path.join(".cache", "model_stats.json")
+DEFAULT_WINDOW = 50
+DEFAULT_MIN_SUCCESS_RATE = 0.8
+DEFAULT_MIN_SAMPLES = 5
+DEFAULT_EXPLORE_RATE = 0.05
+DEFAULT_POLICY = "default"
+
+# models each agent may use, most preferred first; agents without a policy use DEFAULT_POLICY, and models of an
+# agent's config_list that its policy does not name are kept as the last fallbacks
+DEFAULT_POLICIES: Dict[str, List[str]] = {
+    # extraction and speaker selection are short, well-defined tasks: the fast model is preferred
+    "info_extracter": ["gpt-4o-mini", "gpt-4o", "gpt-3.5-turbo"],
+    "chat_manager": ["gpt-4o-mini", "gpt-4o", "gpt-3.5-turbo"],
+    # the stage agents write the project: the strongest model is preferred until a faster one proves as reliable
+    "TemplateAgent": ["gpt-4o", "gpt-4o-mini"],
+    "TesterAgent": ["gpt-4o", "gpt-4o-mini"],
+    "DockerAgent": ["gpt-4o", "gpt-4o-mini"],
+    DEFAULT_POLICY: ["gpt-4o", "gpt-4o-mini", "gpt-3.5-turbo"],
+}
+
+Sample = List          # [latency in seconds, ok]
+
+
+def parse_policies(specs: List[str]) -> Dict[str, List[str]]:
+    """["TemplateAgent=gpt-4o,gpt-4o-mini", ...] -> {"TemplateAgent": ["gpt-4o", "gpt-4o-mini"], ...}"""
+    policies = {}
+    for spec in specs:
+        agent, _, models = spec.partition("=")
+        if not agent.strip() or not models.strip():
+            raise ValueError(f"Invalid model policy '{spec}', expected AGENT=MODEL[,MODEL...]")
+        policies[agent.strip()] = [model.strip() for model in models.split(",") if model.strip()]
+    return policies
+
+
+class ModelRouter:
+    """
+    Per-stage model policies with rolling latency/success statistics.
+
+    :param policies: agent name -> models in order of preference, merged over DEFAULT_POLICIES.
+    :param stats_path: JSON file the statistics are loaded from and saved to (None keeps them in memory).
+    :param window: requests per (stage, model) the statistics are computed over.
+    :param min_success_rate: models below this success rate are not picked for their speed.
+    :param min_samples: requests a model needs in a stage before its statistics are trusted.
+    :param explore_rate: share of requests that try an under-sampled model first.
+    """
+
+    def __init__(self, policies: Optional[Dict[str, List[str]]] = None, stats_path: Optional[str] = DEFAULT_MODEL_STATS_PATH,
+                 window: int = DEFAULT_WINDOW, min_success_rate: float = DEFAULT_MIN_SUCCESS_RATE,
+                 min_samples: int = DEFAULT_MIN_SAMPLES, explore_rate: float = DEFAULT_EXPLORE_RATE):
+        self.policies = {**DEFAULT_POLICIES, **(policies or {})}
+        self.stats_path = stats_path
+        self.window = window
+        self.min_success_rate = min_success_rate
+        self.min_samples = min_samples
+        self.explore_rate = explore_rate
+        self._samples: Dict[Tuple[str, str], Deque[Sample]] = defaultdict(lambda: deque(maxlen=self.window))
+        self._new: Dict[Tuple[str, str], List[Sample]] = defaultdict(list)      # recorded since load, merged on save
+        self._last: Dict[str, Sample] = {}          # stage -> sample of its latest successful request
+        self._choices: Dict[str, str] = {}
+        self._requests: Dict[Tuple[str, str], int] = defaultdict(int)      # sent by this router
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self._load()
+
+    # wiring ---------------------------------------------------------------------------------
+
+    def attach(self, agent: ConversableAgent, stage: Optional[str] = None):
+        """Route agent's requests by the policy of stage (the agent's name by default) and time its clients."""
+        wrapper = getattr(agent, "client", None)
+        if wrapper is None:
+            return      # no LLM
+        stage = stage or agent.name
+
+        def route(messages):
+            self.route(agent, stage)
+            return messages
+
+        async def a_route(messages):
+            self.route(agent, stage)
+            return messages
+
+        agent.register_hook("process_all_messages_before_reply", route)
+        agent.register_hook("a_process_all_messages_before_reply", a_route)
+
+    def _time_clients(self, wrapper, stage: str):
+        # autogen replaces an agent's client when its tools change, so new clients are wrapped on every route
+        for client, config in zip(wrapper._clients, wrapper._config_list):
+            if not getattr(client, "_routed_stage", None):
+                client.create = self._timed(stage, config.get("model"), client.create)
+                client._routed_stage = stage
+
+    def _timed(self, stage: str, model: str, create):
+        def timed_create(params):
+            start = time.perf_counter()
+            try:
+                response = create(params)
+            except Exception:
+                self.record(stage, model, time.perf_counter() - start, False)
+                raise
+            self.record(stage, model, time.perf_counter() - start, True)
+            return response
+
+        return timed_create
+
+    # routing --------------------------------------------------------------------------------
+
+    def route(self, agent: ConversableAgent, stage: str) -> Optional[str]:
+        """Put the chosen model's client first in agent's client list; returns the model."""
+        wrapper = agent.client
+        self._time_clients(wrapper, stage)
+        models = [config.get("model") for config in wrapper._config_list]
+        model, reason = self.choose(stage, models)
+        if model is None:
+            return None
+        order = sorted(range(len(models)), key=lambda i: (models[i] != model, self._preference(stage, models[i])))
+        # new lists: a request of this agent that is still running keeps iterating over the old order
+        wrapper._clients = [wrapper._clients[i] for i in order]
+        wrapper._config_list = [wrapper._config_list[i] for i in order]
+        with self._lock:
+            changed = self._choices.get(stage) != model
+            self._choices[stage] = model
+        logger.log(logging.INFO if changed or reason == "exploring" else logging.DEBUG,
+                   "routing %s to %s (%s)", stage, model, reason)
+        return model
+
+    def _preference(self, stage: str, model: str) -> int:
+        policy = self.policies.get(stage, self.policies[DEFAULT_POLICY])
+        return policy.index(model) if model in policy else len(policy)
+
+    def choose(self, stage: str, models: List[str]) -> Tuple[Optional[str], str]:
+        """The model stage's next request goes to, among models, and why."""
+        candidates = sorted((m for m in models if m is not None), key=lambda m: self._preference(stage, m))
+        if not candidates:
+            return None, "no models"
+        stats = self.stats(stage)
+        undersampled = [m for m in candidates if stats.get(m, {}).get("samples", 0) < self.min_samples]
+        if undersampled and len(undersampled) < len(candidates) and self._random.random() < self.explore_rate:
+            return undersampled[0], "exploring"
+        eligible = [m for m in candidates
+                    if m not in undersampled and stats[m]["success_rate"] >= self.min_success_rate]
+        if not eligible:
+            return candidates[0], "policy default"
+        best = min(eligible, key=lambda m: (stats[m]["p50"], stats[m]["p95"]))
+        s = stats[best]
+        return best, f"p50 {s['p50']:.1f}s, p95 {s['p95']:.1f}s, success {s['success_rate']:.0%} over {s['samples']}"
+
+    # statistics -----------------------------------------------------------------------------
+
+    def record(self, stage: str, model: str, latency: float, ok: bool):
+        sample = [round(latency, 3), ok]
+        with self._lock:
+            self._samples[(stage, model)].append(sample)
+            self._new[(stage, model)].append(sample)
+            self._requests[(stage, model)] += 1
+            if ok:
+                self._last[stage] = sample
+
+    def record_outcome(self, stage: str, succeeded: bool):
+        """Count the stage's latest request as failed if the proposal it produced did not execute."""
+        with self._lock:
+            sample = self._last.pop(stage, None)
+            if sample is not None and not succeeded:
+                sample[1] = False
+
+    def stats(self, stage: Optional[str] = None) -> Dict:
+        """{model: {samples, p50, p95, success_rate}} of stage, or {stage: {model: ...}} of every stage."""
+        with self._lock:
+            pairs = {key: list(samples) for key, samples in self._samples.items() if samples}
+        result: Dict[str, Dict[str, Dict]] = defaultdict(dict)
+        for (s, model), samples in pairs.items():
+            latencies = [latency for latency, ok in samples if ok] or [latency for latency, _ in samples]
+            result[s][model] = {
+                "samples": len(samples),
+                "p50": percentile(latencies, 0.5),
+                "p95": percentile(latencies, 0.95),
+                "success_rate": sum(1 for _, ok in samples if ok) / len(samples),
+            }
+        return dict(result.get(stage, {})) if stage is not None else dict(result)
+
+    def requests(self) -> Dict[Tuple[str, str], int]:
+        """Requests this router's agents sent to each (stage, model)."""
+        with self._lock:
+            return dict(self._requests)
+
+    # persistence ----------------------------------------------------------------------------
+
+    def _read(self) -> Dict:
+        if self.stats_path is None or not os.path.exists(self.stats_path):
+            return {}
+        try:
+            with open(self.stats_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("ignoring unreadable model statistics %s: %s", self.stats_path, e)
+            return {}
+
+    def _load(self):
+        for stage, models in self._read().items():
+            for model, samples in models.items():
+                self._samples[(stage, model)].extend(samples)
+
+    def save(self):
+        """Merge this router's new samples into the statistics file (atomically)."""
+        if self.stats_path is None:
+            return
+        with self._lock:
+            new, self._new = self._new, defaultdict(list)
+        if not new:
+            return
+        saved = self._read()
+        for (stage, model), samples in new.items():
+            merged = deque(saved.get(stage, {}).get(model, []), maxlen=self.window)
+            merged.extend(samples)
+            saved.setdefault(stage, {})[model] = list(merged)
+        os.makedirs(os.path.dirname(os.path.abspath(self.stats_path)), exist_ok=True)
+        with atomic_write(self.stats_path) as f:
+            json.dump(saved, f, indent=1)
@@ -1,25 +1,127 @@
 import os
+import shlex
+import time
+import asyncio
+from collections import Counter
 from autogen import UserProxyAgent,AssistantAgent,Agent,register_function
-from typing import List,Dict
+from typing import List,Dict,Optional
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TimeElapsedColumn, TextColumn
+from rich.table import Table
+from rich.markup import escape
+from autogen.oai.client import PlaceHolderClient
 
-import agentops
 from sys_msg_docker import docker_extract_info_prompt,docker_template_agent_prompt,docker_tester_agent_prompt,docker_agent_prompt,compose_agent_prompt
 from sys_msg_normal import normal_extract_info_agent,template_agent_prompt,tester_agent_prompt
-from helper_functions import extract_description,get_sys_msg_normal,get_sys_msg_docker,extract_summary
+from helper_functions import extract_description,get_sys_msg_normal,get_sys_msg_docker
 from CustomGroupChat import CustomGroupChat,CustomGroupChatManager
-from agent_skills import ask_human
+from agent_skills import ask_human,ask_human_headless,collect_docker_timings,stop_collecting_docker_timings,docker_available,run_image_tests,DOCKER_PHASES
+from ResponseCache import ResponseCache
+from ContextBudgeter import ContextBudgeter,DEFAULT_TOKEN_LIMIT
+from CustomCodeExecutor import PersistentShellExecutor
+from ExecutionLedger import ExecutionLedger,changes_environment
+from Checkpoint import Checkpoint,new_run_id
+from ArtifactCache import ArtifactCache,DEFAULT_ARTIFACT_CACHE_DIR,canonical_spec
+from SpecIndex import SpecIndex,run_tokens,spec_tokens,similar_run_hint
+from ParallelCommandExecutor import ParallelCommandExecutor
+from BuildContext import find_dockerfile
+from ContainerPool import DEFAULT_POOL_SIZE,configure_container_pool
+from ModelRouter import ModelRouter,DEFAULT_MODEL_STATS_PATH
+from HedgedClient import Hedger,HedgedOpenAIClient,DEFAULT_HEDGE_BUDGET
+from StreamingClient import StreamMonitor,StreamingOpenAIClient
+from Tracer import Tracer,DEFAULT_TRACE_DIR
+from TranscriptStore import TranscriptStore,DEFAULT_TRANSCRIPT_DB
+from SpeculativeDrafter import SpeculativeDrafter
+from structured_output import CommandOutcome,ExecutionResult,command_response_format
+from MessageScanner import scan_message
+from MessageStore import get_message_store
 
 agentops_api_key = os.getenv('AGENTOPS_API_KEY')
+DEFAULT_CACHE_DIR = os.path.join(".cache", "llm_responses")
+# progress task (number, description) of each pipeline stage
+STAGE_TASKS = {
+    "TemplateAgent": (3, "[dark_orange3]Adding the boileplate code... 🪄"),
+    "TesterAgent": (4, "[dark_orange3]Adding the test files...  🧪"),
+    "DockerAgent": (5, "[dark_orange3]Adding the Docker files...  🐳"),
+}
+TRANSCRIPT_FLUSH_TIMEOUT = 10     # seconds the end of a run waits for its transcript rows to be committed
 
 class MultiAgentSystem:
-    def __init__(self, api_key: str, console: Console, monitor_agents: bool = False,env_type: str = "normal"):
+    def __init__(self, api_key: str, console: Console, monitor_agents: bool = False,env_type: str = "normal",
+                 work_dir: str = ".", headless: bool = False, cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                 context_token_limit: int = DEFAULT_TOKEN_LIMIT, stage_token_limits: Optional[Dict[str, int]] = None,
+                 parallel_commands: int = 1, container_pool_size: int = DEFAULT_POOL_SIZE, speculative: bool = False,
+                 incremental: bool = True, checkpoint_dir: Optional[str] = None,
+                 artifact_cache_dir: Optional[str] = DEFAULT_ARTIFACT_CACHE_DIR, similar_run_hints: bool = True,
+                 model_routing: bool = True, model_policies: Optional[Dict[str, List[str]]] = None,
+                 model_stats_path: Optional[str] = DEFAULT_MODEL_STATS_PATH, hedge_percentile: Optional[float] = None,
+                 hedge_budget: float = DEFAULT_HEDGE_BUDGET, hedge_max_cost: Optional[float] = None,
+                 streaming: bool = False, trace_dir: Optional[str] = DEFAULT_TRACE_DIR, base_url: Optional[str] = None,
+                 transcript_db: Optional[str] = DEFAULT_TRANSCRIPT_DB):
         self.api_key = api_key
+        self.base_url = base_url      # OpenAI-compatible endpoint (None: the openai default / OPENAI_BASE_URL)
         self.monitor_agents = monitor_agents
         self.stored_messages = []
+        self.group_chat: Optional[CustomGroupChat] = None
         self.console = console
         self.env_type = env_type
+        self.work_dir = work_dir      # directory the generated commands are executed in
+        self.headless = headless      # never block on user input (batch mode)
+        self.finished = False         # set once the last stage exits with code 0
+        self.run_id = new_run_id()
+        self.checkpoint_dir = checkpoint_dir      # None disables checkpointing
+        self.checkpoint: Optional[Checkpoint] = None
+        self.resume_agent: Optional[Agent] = None     # first unfinished stage of a resumed run
+        self.stage_scripts: Dict[str, List[Dict]] = {}     # commands each completed stage executed
+        self.docker_timings: List[Dict] = []      # per-phase timings of the docker builds/test runs of the last run
+        self._docker_timings_token = None
+        # spans of the run (stages, group chat rounds, completions, commands) in <trace_dir>/<run id>.jsonl
+        self.trace_dir = trace_dir      # None: nothing is written
+        self.tracer = Tracer(None, self.run_id)
+        self._run_span = self._stage_span = self._round_span = None
+        self._rounds = 0
+        # every group chat message, stage attempt and command of the run, kept after the chat forgets them
+        self.transcripts = TranscriptStore.open(transcript_db) if transcript_db else None
+        self._message_seq = 0
+        self._current_stage: Optional[str] = None
+        self._stage_attempts = Counter()         # attempts per stage so far
+        self._attempt_started: Dict[str, float] = {}
+        # verified stage scripts of earlier runs with the same spec, replayed instead of the stage agents
+        self.artifact_cache = ArtifactCache(artifact_cache_dir) if artifact_cache_dir else None
+        self.artifact_cache_status: Optional[str] = None  # hit, miss, invalidated or None (cache not consulted)
+        # on a miss, the closest verified run of a similar spec gives the stage agents a script to start from
+        self.similar_run_hints = similar_run_hints and self.artifact_cache is not None
+        self.similar_run: Optional[Dict] = None           # {"key": ..., "similarity": ...} of the run used for hints
+        self.llm_cache = ResponseCache(cache_dir) if cache_dir else None   # None disables LLM response caching
+        self.context_budgeter = ContextBudgeter(default_limit=context_token_limit, stage_limits=stage_token_limits)
+        # One shell for the whole session: activated venvs and exported variables carry over between scripts.
+        # The cwd is reset per message because the agents write every script relative to the workspace root.
+        # With incremental re-execution, a retried stage skips the leading commands that already succeeded.
+        self.execution_ledger = ExecutionLedger(self.work_dir) if incremental else None
+        self.shell_executor = PersistentShellExecutor(work_dir=self.work_dir, keep_cwd=False, console=self.console,
+                                                      ledger=self.execution_ledger)
+        # Structured command lists either run one by one in that shell or, with parallel_commands > 1,
+        # as a dependency graph on a pool of that many workers.
+        self.command_executor = (
+            ParallelCommandExecutor(work_dir=self.work_dir, max_workers=parallel_commands)
+            if parallel_commands > 1 else self.shell_executor
+        )
+        # per-agent model policies: each request goes to the fastest model that keeps up the stage's success rate
+        self.model_router = ModelRouter(model_policies, stats_path=model_stats_path) if model_routing else None
+        # opt-in: a request slower than the hedge_percentile latency of its model is sent again, the first answer wins
+        self.hedger = Hedger(hedge_percentile, hedge_budget, hedge_max_cost) if hedge_percentile else None
+        # streamed stage replies show their tokens in the progress view; their commands run (in the session shell,
+        # so not with the parallel executor) while the rest of the reply is generated
+        self.stream_monitor = StreamMonitor(
+            executor=self.shell_executor if parallel_commands == 1 else None,
+            ledger=self.execution_ledger,
+            on_status=self._show_stream_status,
+        ) if streaming else None
+        # with speculation the next stage's agent starts drafting while the current stage's commands execute
+        self.drafter = SpeculativeDrafter() if speculative else None
+        if env_type == "docker":
+            # warm containers for the docker test runs, shared by all sessions in this process
+            configure_container_pool(size=container_pool_size)
         self.progress = Progress(
             SpinnerColumn(finished_text="✅"),
             TextColumn("[progress.description]{task.description}"),
@@ -30,13 +132,35 @@ class MultiAgentSystem:
         self.llm_config = {
             "config_list": [
                 {"model": "gpt-4o", "api_key": self.api_key},
+                {"model": "gpt-4o-mini", "api_key": self.api_key},
                 {"model": "gpt-3.5-turbo", "api_key": self.api_key},
                 # {"model":"claude-3-5-sonnet-20240620","api_key":os.getenv("ANTHROPIC_API_KEY"),"api_type":"anthropic"}
                 # todo - make api_key handling and model_selection in the main.py
             ],
             "temperature": 0,
-            "cache_seed": 56
+            "cache_seed": None    # autogen's own disk cache is replaced by self.llm_cache, passed to initiate_chat
+        }
+        if self.hedger is not None:
+            for config in self.llm_config["config_list"]:
+                config["model_client_cls"] = HedgedOpenAIClient.__name__
+        # Pipeline agents answer with a CommandResponse (commands + summary) enforced by a strict JSON schema,
+        # so only models that support structured outputs are listed.
+        self.stage_llm_config = {
+            **self.llm_config,
+            "config_list": [
+                {"model": "gpt-4o", "api_key": self.api_key},
+                {"model": "gpt-4o-mini", "api_key": self.api_key},
+            ],
+            "response_format": command_response_format(),
         }
+        if self.base_url is not None:
+            for config in self.llm_config["config_list"] + self.stage_llm_config["config_list"]:
+                config["base_url"] = self.base_url
+        if self.stream_monitor is not None or self.hedger is not None:
+            # a streamed reply is not hedged: its commands may be running by the time a hedge would be sent
+            client_cls = StreamingOpenAIClient if self.stream_monitor is not None else HedgedOpenAIClient
+            for config in self.stage_llm_config["config_list"]:
+                config["model_client_cls"] = client_cls.__name__
 
     def add_task(self, task_no: int, description: str, total: int = 100) -> int:
         if task_no not in self.tasks:
@@ -59,10 +183,7 @@ class MultiAgentSystem:
             "human_proxy",
             llm_config=False,
             human_input_mode="NEVER",
-            is_termination_msg=lambda x: (
-                isinstance(x, dict) and 
-                any("TERMINATE" in line.upper() for line in str(x.get("content", "")).splitlines()[-15:])
-            )
+            is_termination_msg=lambda x: isinstance(x, dict) and scan_message(x.get("content")).terminated
         )
 
         self.extract_info_agent = AssistantAgent( 
@@ -74,12 +195,28 @@ class MultiAgentSystem:
         )      
 
         register_function(
-            f=ask_human,
+            f=ask_human_headless if self.headless else ask_human,
             caller=self.extract_info_agent,
             executor=self.human_proxy,
             name="ask_user",
             description="Asks user for the missing information"
         )
+        # after register_function: adding the tool replaced the agent's LLM client
+        self._configure_clients(self.extract_info_agent)
+
+    def _configure_clients(self, *agents: Agent):
+        self.tracer.bind(*agents)
+        for agent in agents:
+            # register_model_client fills one placeholder client (config_list entry with a model_client_cls) per call
+            for client in list(agent.client._clients):
+                if not isinstance(client, PlaceHolderClient):
+                    continue
+                if client.config["model_client_cls"] == HedgedOpenAIClient.__name__:
+                    agent.register_model_client(HedgedOpenAIClient, hedger=self.hedger)
+                elif client.config["model_client_cls"] == StreamingOpenAIClient.__name__:
+                    agent.register_model_client(StreamingOpenAIClient, monitor=self.stream_monitor, stage=agent.name)
+            if self.model_router is not None:
+                self.model_router.attach(agent)
 
     def _create_agents(self):
         # Create all your agents here
@@ -93,26 +230,108 @@ class MultiAgentSystem:
         self.human_proxy_group = UserProxyAgent(
             "HumanProxyGroup",
             llm_config = False,  # no LLM used for human proxy
-            code_execution_config={
-                "work_dir" : ".",    # todo - change here to the correct work_dir
-                "use_docker" : False,
-                "last_n_messages" : 1  # todo
-            },
+            code_execution_config = False,  # execution is done by _execute_reply, which returns an ExecutionResult
             human_input_mode = "NEVER",
         ) 
+        self.human_proxy_group.register_reply([Agent, None], self._execute_reply)
+        # In async chats run the (blocking) execution in a worker thread so other sessions
+        # sharing the event loop keep making progress. Ignored by the sync run_chat.
+        self.human_proxy_group.register_reply(
+            [Agent, None],
+            MultiAgentSystem._a_reply_in_thread,
+            ignore_async_in_sync_chat=True,
+        )
         
         # Add other agents based on env_type
         if self.env_type == "normal":
             self.create_normal_agents()
+            self.next_stage = {self.template_agent: self.tester_agent}
         elif self.env_type == "docker":
             self.create_docker_agents()
+            self.next_stage = {self.template_agent: self.tester_agent, self.tester_agent: self.docker_agent}
+        self._configure_clients(*self._stage_agents())
+        if self.drafter is not None:
+            for agent in self.next_stage.values():
+                self.drafter.register(agent)
+
+    @staticmethod
+    async def _a_reply_in_thread(recipient: UserProxyAgent, messages=None, sender=None, config=None):
+        # the sync generate_reply skips async reply functions, so this does not recurse
+        return True, await asyncio.to_thread(recipient.generate_reply, messages, sender)
+
+    def _execute_reply(self, recipient: UserProxyAgent, messages: Optional[List[Dict]] = None, sender: Optional[Agent] = None, config=None):
+        """Run the commands of the last agent message and reply with an ExecutionResult (JSON)."""
+        if messages is None:
+            messages = recipient._oai_messages[sender]
+        content = messages[-1].get("content") if messages else None
+        # the ledger is kept per proposing agent (the stage), not per sender (the group chat manager)
+        stage = (messages[-1].get("name") or (sender.name if sender else None)) if messages else None
+        with self.tracer.span("execute", "execute", stage=stage) as span:
+            result = self._execute_proposal(content, stage)
+            if result is None:
+                span.set(commands=0)
+                return False, None
+            span.set(exit_code=result.exit_code, commands=len(result.commands), failed_command=result.failed_command)
+            if not result.succeeded:
+                span.status = "error"
+        if self.model_router is not None and stage is not None:
+            self.model_router.record_outcome(stage, result.succeeded)
+        self._record_attempt(stage, result)
+        return True, result.model_dump_json()
+
+    def _execute_proposal(self, content: Optional[str], stage: Optional[str]) -> Optional[ExecutionResult]:
+        scan = scan_message(content)
+        response = scan.command_response
+        # commands of a streamed proposal may have run while it was generated
+        early = self.stream_monitor.collect(stage, [c.command for c in response.commands] if response else []) \
+            if self.stream_monitor is not None and stage is not None else None
+        if early is not None:
+            result = early
+        elif response is not None:
+            result = self.command_executor.execute_commands(response.commands, stage=stage)
+        else:
+            # free-text answer (e.g. from a model without structured outputs): run its markdown code blocks
+            code_blocks = list(scan.code_blocks)
+            if not code_blocks:
+                return None
+            start = time.perf_counter()
+            code_result = self.shell_executor.execute_code_blocks(code_blocks)
+            result = ExecutionResult(
+                exit_code=code_result.exit_code,
+                output=code_result.output,
+                failed_command=None if code_result.exit_code == 0 else "markdown code block",
+                duration=time.perf_counter() - start,
+            )
+        if stage == "DockerAgent" and result.succeeded:
+            result = self._test_docker_image(result)
+        return result
+
+    def _test_docker_image(self, result: ExecutionResult) -> ExecutionResult:
+        """Build the image of the Dockerfile the DockerAgent wrote and run the tests in a pooled container of it."""
+        dockerfile = find_dockerfile(self.work_dir)
+        if dockerfile is None:
+            return result
+        if not docker_available():
+            note = "No docker daemon: the image was not built and tested."
+            return result.model_copy(update={"output": f"{result.output}\n{note}"})
+        command = f"docker build and test {os.path.relpath(dockerfile, self.work_dir)}"
+        start = time.perf_counter()
+        output, exit_code = run_image_tests(os.path.dirname(dockerfile), f"code-catalyst-{self.run_id}")
+        outcome = CommandOutcome(command=command, exit_code=exit_code, duration=time.perf_counter() - start)
+        return result.model_copy(update={
+            "exit_code": exit_code,
+            "output": f"{result.output}\n{output}",
+            "failed_command": command if exit_code != 0 else None,
+            "duration": result.duration + outcome.duration,
+            "commands": result.commands + [outcome],
+        })
 
     def create_normal_agents(self):
         
         self.template_agent = AssistantAgent(
             "TemplateAgent",
             system_message=get_sys_msg_normal(template_agent_prompt),
-            llm_config=self.llm_config,
+            llm_config=self.stage_llm_config,
             code_execution_config=False,
             human_input_mode="NEVER"
         )
@@ -120,7 +339,7 @@ class MultiAgentSystem:
         self.tester_agent = AssistantAgent(
             "TesterAgent",
             system_message = get_sys_msg_normal(tester_agent_prompt),
-            llm_config = self.llm_config,
+            llm_config = self.stage_llm_config,
             code_execution_config = False,
             human_input_mode= "NEVER",
         )
@@ -129,7 +348,7 @@ class MultiAgentSystem:
         self.template_agent = AssistantAgent(
             "TemplateAgent",
             system_message = get_sys_msg_docker(docker_template_agent_prompt),
-            llm_config = self.llm_config,
+            llm_config = self.stage_llm_config,
             code_execution_config = False,
             human_input_mode = "NEVER"
         )
@@ -137,7 +356,7 @@ class MultiAgentSystem:
         self.tester_agent = AssistantAgent(
             "TesterAgent",
             system_message = get_sys_msg_docker(docker_tester_agent_prompt),
-            llm_config = self.llm_config,
+            llm_config = self.stage_llm_config,
             code_execution_config = False,
             human_input_mode= "NEVER",
         )
@@ -145,7 +364,7 @@ class MultiAgentSystem:
         self.docker_agent = AssistantAgent(
             "DockerAgent",
             system_message = get_sys_msg_docker(docker_agent_prompt),
-            llm_config = self.llm_config,
+            llm_config = self.stage_llm_config,
             code_execution_config = False,
             human_input_mode= "NEVER",
         )
@@ -156,7 +375,8 @@ class MultiAgentSystem:
                 agents=[self.initializer, self.template_agent, self.tester_agent, self.human_proxy_group],
                 messages=[],
                 select_speaker_auto_verbose=False,
-                speaker_selection_method=self.speaker_selection_function
+                speaker_selection_method=self.speaker_selection_function,
+                message_store=get_message_store()
             )
             self.group_chat_manager = CustomGroupChatManager(
                 groupchat=self.group_chat,
@@ -168,27 +388,231 @@ class MultiAgentSystem:
                 agents=[self.initializer, self.template_agent, self.tester_agent, self.docker_agent, self.human_proxy_group],
                 messages=[],
                 select_speaker_auto_verbose=False,
-                speaker_selection_method=self.speaker_selection_function
+                speaker_selection_method=self.speaker_selection_function,
+                message_store=get_message_store()
             )
             self.group_chat_manager = CustomGroupChatManager(
                 groupchat=self.group_chat,
                 llm_config=self.llm_config,
                 silent=True
             )
+        self._configure_clients(self.group_chat_manager)
+
+    def _stage_succeeded(self, content: Optional[str]) -> bool:
+        result = scan_message(content).execution_result
+        return result is not None and result.succeeded
+
+    def _stage_summary(self, grp_messages: List[Dict]) -> Dict:
+        # grp_messages[-2] is the agent's proposal that HumanProxyGroup just executed successfully
+        return self._summary_message(grp_messages[-2])
+
+    def _summary_message(self, proposal: Dict) -> Dict:
+        scan = scan_message(proposal["content"])
+        summary = scan.command_response.summary if scan.command_response is not None else scan.summary
+        name = proposal["name"]
+        return {
+            'name': name,
+            'content': f"Summary from {name}:\n" + (summary or "No summary was provided."),
+            'role': "assistant"
+        }
+
+    def _retry_messages(self, groupchat: CustomGroupChat, agent: Agent) -> List[Dict]:
+        # The first stage's task is the initializer message at the top of groupchat.messages. Later stages were
+        # started from stored_messages (task + summaries), which groupchat.messages no longer holds after the clear.
+        if groupchat.messages and groupchat.messages[0].get("name") == self.initializer.name:
+            head = groupchat.messages[:1]
+            history = groupchat.messages[1:]
+        else:
+            head = self.stored_messages
+            history = groupchat.messages
+        return self.context_budgeter.compact(head + history, agent.name, head=len(head))
+
+    def _complete_stage(self, grp_messages: List[Dict]):
+        """Store the summary and the script of the stage that just succeeded and checkpoint the run."""
+        self.stored_messages.append(self._stage_summary(grp_messages))
+        stage = grp_messages[-2]["name"]
+        self.stage_scripts[stage] = self._executed_script(stage, grp_messages[-2])
+        self.tracer.exit(self._stage_span, "ok", commands=len(self.stage_scripts[stage]))
+        self._stage_span = None
+        if self.checkpoint is None:
+            return
+        self.checkpoint.stored_messages = list(self.stored_messages)
+        self.checkpoint.completed_stages.append(stage)
+        self.checkpoint.scripts[stage] = self.stage_scripts[stage]
+        self._save_checkpoint()
+
+    def _release_messages(self, groupchat: CustomGroupChat):
+        """
+        Stage boundary: the next stage starts from stored_messages, so the messages of the stage are released from
+        the group chat and from the agents' histories, which reference the same contents (every speaker is passed its
+        messages explicitly, nothing reads them). The initializer's chat with the manager is initiate_chat's result.
+        """
+        groupchat.clear_messages()
+        for agent in [self.group_chat_manager, *groupchat.agents]:
+            for peer in list(agent.chat_messages):
+                if self.initializer not in (agent, peer):
+                    agent.clear_history(peer)
+        if groupchat.message_store is not None:
+            groupchat.message_store.trim()
+
+    def _save_checkpoint(self):
+        if self.checkpoint is not None and self.checkpoint_dir is not None:
+            self.checkpoint.save(self.checkpoint_dir)
+
+    def _executed_script(self, stage: str, proposal: Dict) -> List[Dict]:
+        # the ledger knows the directory each command ran in; without it the commands are recorded as proposed
+        if self.execution_ledger is not None and self.execution_ledger.entries(stage):
+            return [{"command": e.command, "cwd": e.cwd_before} for e in self.execution_ledger.entries(stage)]
+        scan = scan_message(proposal["content"])
+        if scan.command_response is not None:
+            return [{"command": c.command, "cwd": None} for c in scan.command_response.commands]
+        return [{"command": block.code, "cwd": None} for block in scan.code_blocks]
+
+    def _stage_agents(self) -> List[Agent]:
+        if self.env_type == "docker":
+            return [self.template_agent, self.tester_agent, self.docker_agent]
+        return [self.template_agent, self.tester_agent]
+
+    def _start_checkpoint(self, project_name: str, project_description: str, extracted_desc: str):
+        if self.checkpoint_dir is None:
+            return
+        self.checkpoint = Checkpoint(
+            run_id=self.run_id,
+            project_name=project_name,
+            project_description=project_description,
+            env_type=self.env_type,
+            work_dir=os.path.abspath(self.work_dir),
+            extracted_description=extracted_desc,
+        )
+        self._save_checkpoint()
+        self.console.print(f"[cyan]Run id: {self.run_id} (continue an interrupted run with --resume {self.run_id})[/cyan]")
+
+    def _restore_checkpoint(self, checkpoint: Checkpoint) -> str:
+        """Take over a checkpointed run; returns its extracted description."""
+        self.checkpoint = checkpoint
+        self.run_id = checkpoint.run_id
+        self.stored_messages = [dict(m) for m in checkpoint.stored_messages]
+        self.stage_scripts = dict(checkpoint.scripts)
+        done = ", ".join(checkpoint.completed_stages) or "none"
+        self.console.print(f"[cyan]Resuming run {checkpoint.run_id} (completed stages: {done})...[/cyan]")
+        return checkpoint.extracted_description
+
+    def _prepare_resume(self):
+        """Pick the first unfinished stage and restore the shell session the completed stages left behind."""
+        completed = self.checkpoint.completed_stages
+        if not completed:
+            return
+        self.resume_agent = next((a for a in self._stage_agents() if a.name not in completed), None)
+        # the workspace is on disk already; only session state (activated venvs, exports) has to be replayed
+        for stage in completed:
+            for step in self.checkpoint.scripts.get(stage, []):
+                if changes_environment(step["command"]):
+                    cwd = step.get("cwd") or os.path.abspath(self.work_dir)
+                    self.shell_executor.run(f"cd {shlex.quote(cwd)} && {step['command']}")
+
+    def _resume_stage(self, groupchat: CustomGroupChat):
+        agent, self.resume_agent = self.resume_agent, None
+        # from here on retries are built from stored_messages, as after any other stage boundary
+        self._release_messages(groupchat)
+        for stage in self.checkpoint.completed_stages:
+            self.progress.update(self.add_task_if_not_exists(*STAGE_TASKS[stage]), advance=100)
+        self.add_task_if_not_exists(*STAGE_TASKS[agent.name])
+        return agent, self.stored_messages
+
+    def _replay_artifacts(self, extracted_desc: str) -> bool:
+        """
+        Replay the verified stage scripts cached for this spec instead of running the stage agents.
+        Returns True if every stage's script (and with it the tests) succeeded again.
+        """
+        if self.artifact_cache is None:
+            return False
+        key = self.artifact_cache.key_for(extracted_desc, self.env_type)
+        entry = self.artifact_cache.get(key) if key is not None else None
+        stages = [agent.name for agent in self._stage_agents()]
+        if entry is None or not all(entry.scripts.get(stage) for stage in stages):
+            self.artifact_cache_status = "miss"
+            return False
+
+        self.console.print("[cyan]Found verified scripts for this project spec, replaying them...[/cyan]")
+        scripts = {}
+        for stage in stages:
+            task = self.add_task_if_not_exists(*STAGE_TASKS[stage])
+            steps = entry.script(stage, self.work_dir)
+            # the sequential shell keeps the cwd between commands, as in the run the scripts were recorded in
+            commands = [{"command": f"cd {shlex.quote(step['cwd'])} && {step['command']}" if step["cwd"] else step["command"]}
+                        for step in steps]
+            started = time.time()
+            with self.tracer.span(stage, "stage", replayed=True) as span:
+                result = self.shell_executor.execute_commands(commands)
+                if not result.succeeded:
+                    span.status = "error"
+            if self.transcripts is not None:
+                self.transcripts.add_stage(self.run_id, stage, 1, started, result.succeeded, result.exit_code, replayed=True)
+            if not result.succeeded:
+                self.artifact_cache.invalidate(key)
+                self.artifact_cache_status = "invalidated"
+                self.console.print(f"[yellow]Replayed {stage} script failed at `{result.failed_command}`; "
+                                   f"dropped the cached scripts, generating the project with the agents...[/yellow]")
+                return False
+            scripts[stage] = steps
+            self.progress.update(task, advance=100)
+
+        self.artifact_cache.record_hit(entry)
+        self.artifact_cache_status = "hit"
+        self.stage_scripts = scripts
+        if self.checkpoint is not None:
+            self.checkpoint.completed_stages = stages
+            self.checkpoint.scripts = dict(scripts)
+        self.finished = True
+        return True
+
+    def _store_artifacts(self, extracted_desc: str):
+        # only runs whose every stage succeeded are verified
+        if self.artifact_cache is None or not self.finished or self.artifact_cache_status == "hit":
+            return
+        # a stage without recorded commands (e.g. one that answered without any) would replay as an empty script
+        if not all(self.stage_scripts.get(agent.name) for agent in self._stage_agents()):
+            return
+        try:
+            key = self.artifact_cache.store(extracted_desc, self.env_type, self.stage_scripts, self.work_dir)
+            if key is not None and self.similar_run_hints:
+                index = SpecIndex.open(self.artifact_cache)
+                index.add(key, self.env_type, run_tokens(self.artifact_cache.get(key)))
+                index.save()
+        except OSError as e:
+            self.console.print(f"[yellow]Could not store the verified scripts: {e}[/yellow]")
+
+    def _add_similar_run_hints(self, extracted_desc: str):
+        """Give every stage agent the script the closest verified run of a similar spec executed in its stage."""
+        spec = canonical_spec(extracted_desc)
+        if not self.similar_run_hints or spec is None:
+            return
+        stages = [agent.name for agent in self._stage_agents()]
+        index = SpecIndex.open(self.artifact_cache)
+        if index.dirty:
+            index.save()        # keep the runs other processes stored indexed for the next lookup
+        for key, similarity in index.query(spec_tokens(spec), self.env_type, k=3):
+            entry = self.artifact_cache.get(key)
+            if entry is not None and all(entry.scripts.get(stage) for stage in stages):
+                break
+        else:
+            return
+        for agent in self._stage_agents():
+            hint = similar_run_hint(entry, agent.name, similarity)
+            if hint is not None:
+                agent.update_system_message(agent.system_message + "\n" + hint)
+        self.similar_run = {"key": key, "similarity": round(similarity, 3)}
+        self.console.print(f"[cyan]Starting from the verified scripts of a similar project spec "
+                           f"(similarity {similarity:.0%})...[/cyan]")
 
     def speaker_selection_function_docker(self, lastspeaker: Agent, groupchat: CustomGroupChat):
 
         last_message = groupchat.messages[-1]["content"]
-        def clear_and_extract_summary(grp_messages: List[Dict]):
-            # todo - handle case when extract_summary gives None
-            return {
-                'name': grp_messages[-2]["name"],
-                'content': f"Summary from {grp_messages[-2]["name"]}:\n" + extract_summary(grp_messages[-2]["content"]),
-                'role': "assistant"
-            }
                 
         if lastspeaker is self.initializer:
-            task3 = self.add_task_if_not_exists(3,"[dark_orange3]Adding the boileplate code... 🪄")
+            if self.resume_agent is not None:
+                return self._resume_stage(groupchat)
+            task3 = self.add_task_if_not_exists(*STAGE_TASKS["TemplateAgent"])
             self.stored_messages.append(groupchat.messages[0])
             return self.template_agent,groupchat.messages
         elif lastspeaker is self.template_agent:
@@ -201,34 +625,35 @@ class MultiAgentSystem:
         #     return HumanProxyGroup,groupchat.messages
         elif lastspeaker is self.human_proxy_group:
             if groupchat.messages[-2]["name"] == "TemplateAgent":
-                if "exitcode: 0" in last_message:
-                    self.stored_messages.append(clear_and_extract_summary(groupchat.messages))
-                    groupchat.messages.clear()
+                if self._stage_succeeded(last_message):
+                    self._complete_stage(groupchat.messages)
+                    self._release_messages(groupchat)
                     self.progress.update(self.tasks[3][1], advance=100)
-                    task4 = self.add_task_if_not_exists(4,"[dark_orange3]Adding the test files...  🧪")
+                    task4 = self.add_task_if_not_exists(*STAGE_TASKS["TesterAgent"])
                     return self.tester_agent,self.stored_messages
                 else:
-                    return self.template_agent,groupchat.messages
+                    return self.template_agent,self._retry_messages(groupchat, self.template_agent)
             elif groupchat.messages[-2]["name"] == "TesterAgent":
-                if "exitcode: 0" in last_message:
+                if self._stage_succeeded(last_message):
                     # progress.stop()
-                    self.stored_messages.append(clear_and_extract_summary(groupchat.messages))
-                    groupchat.messages.clear()
+                    self._complete_stage(groupchat.messages)
+                    self._release_messages(groupchat)
                     self.progress.update(self.tasks[4][1], advance=100)
-                    task5 = self.add_task_if_not_exists(5,"[dark_orange3]Adding the Docker files...  🐳")
+                    task5 = self.add_task_if_not_exists(*STAGE_TASKS["DockerAgent"])
                     return self.docker_agent,self.stored_messages
                 else:
-                    return self.tester_agent,groupchat.messages
+                    return self.tester_agent,self._retry_messages(groupchat, self.tester_agent)
             elif groupchat.messages[-2]["name"] == "DockerAgent":
-                if "exitcode: 0" in last_message:
-                    self.stored_messages.append(clear_and_extract_summary(groupchat.messages))
-                    groupchat.messages.clear()
+                if self._stage_succeeded(last_message):
+                    self._complete_stage(groupchat.messages)
+                    self._release_messages(groupchat)
                     self.progress.update(self.tasks[5][1], advance=100)
                     self.progress.stop()
+                    self.finished = True
                     # task6 = add_task_if_not_exists(6,"[dark_orange3]Building and running the Docker container...  🚀")
                     return None,None
                 else:
-                    return self.docker_agent,groupchat.messages
+                    return self.docker_agent,self._retry_messages(groupchat, self.docker_agent)
             # elif groupchat.messages[-2]["name"] == "ComposeAgent":
             #     return ComposeAgent,groupchat.messages
                 # if "TERMINATE" in last_message:
@@ -240,16 +665,11 @@ class MultiAgentSystem:
 
     def speaker_selection_function_normal(self, last_speaker: Agent, groupchat: CustomGroupChat): 
         last_message = groupchat.messages[-1]["content"]
-        def clear_and_extract_summary(grp_messages: List[Dict]):
-            # todo - handle case when extract_summary gives None
-            return {
-                'name': grp_messages[-2]["name"],
-                'content': f"Summary from {grp_messages[-2]["name"]}:\n" + extract_summary(grp_messages[-2]["content"]),
-                'role': "assistant"
-            }
                 
         if last_speaker is self.initializer:
-            task3 = self.add_task_if_not_exists(3,"[dark_orange3]Adding the boileplate code... 🪄")
+            if self.resume_agent is not None:
+                return self._resume_stage(groupchat)
+            task3 = self.add_task_if_not_exists(*STAGE_TASKS["TemplateAgent"])
             self.stored_messages.append(groupchat.messages[0])
             return self.template_agent,groupchat.messages
         elif last_speaker is self.template_agent:
@@ -258,76 +678,417 @@ class MultiAgentSystem:
             return self.human_proxy_group,groupchat.messages
         elif last_speaker is self.human_proxy_group:
             if groupchat.messages[-2]["name"] == "TemplateAgent":
-                if "exitcode: 0" in last_message:
-                    self.stored_messages.append(clear_and_extract_summary(groupchat.messages))
-                    groupchat.messages.clear()
+                if self._stage_succeeded(last_message):
+                    self._complete_stage(groupchat.messages)
+                    self._release_messages(groupchat)
                     self.progress.update(self.tasks[3][1], advance=100)
-                    task4 = self.add_task_if_not_exists(4,"[dark_orange3]Adding the test files...  🧪")
+                    task4 = self.add_task_if_not_exists(*STAGE_TASKS["TesterAgent"])
                     return self.tester_agent,self.stored_messages
                 else:
-                    return self.template_agent,groupchat.messages
+                    return self.template_agent,self._retry_messages(groupchat, self.template_agent)
             elif groupchat.messages[-2]["name"] == "TesterAgent":
-                if "exitcode: 0" in last_message:
+                if self._stage_succeeded(last_message):
                     self.progress.update(self.tasks[4][1], advance=100)
                     self.progress.stop()
-                    self.stored_messages.append(clear_and_extract_summary(groupchat.messages))
-                    groupchat.messages.clear()
+                    self._complete_stage(groupchat.messages)
+                    self._release_messages(groupchat)
+                    self.finished = True
                     return None,None
                 else:
-                    return self.tester_agent,groupchat.messages
+                    return self.tester_agent,self._retry_messages(groupchat, self.tester_agent)
                 
     def speaker_selection_function(self, last_speaker: Agent, groupchat: CustomGroupChat):
         try:
+            self._record_message(groupchat)       # before a stage boundary clears groupchat.messages
             if self.env_type == "normal":
-                return self.speaker_selection_function_normal(last_speaker, groupchat)
+                result = self.speaker_selection_function_normal(last_speaker, groupchat)
             elif self.env_type == "docker":
-                return self.speaker_selection_function_docker(last_speaker, groupchat)
+                result = self.speaker_selection_function_docker(last_speaker, groupchat)
+            if self.llm_cache is not None and result and result[0] is not None:
+                self.llm_cache.stage = result[0].name      # attribute cache hits/misses to the next speaker's stage
+            if self.stream_monitor is not None:
+                self.stream_monitor.active_stage = result[0].name if result and result[0] is not None else None
+            self._trace_turn(result)
+            self._start_attempt(result)
+            if self.drafter is not None:
+                self._pipeline_next_stage(last_speaker, groupchat, result)
+            return result
         except Exception as e:
             self.console.print(f"[red]Error in speaker selection: {str(e)}[/red]")
             return None, None
 
-    def run(self, project_name: str, project_description: str):
+    def _trace_turn(self, result):
+        """End the group chat round that just finished and start the next speaker's, in its stage's span."""
+        self.tracer.exit(self._round_span)
+        self._round_span = None
+        speaker = result[0] if result else None
+        if speaker is None:
+            return
+        if speaker.name in STAGE_TASKS:
+            if self._stage_span is None or self._stage_span.name != speaker.name:
+                self.tracer.exit(self._stage_span, "error")       # left without completing (not expected)
+                self._stage_span = self.tracer.enter(speaker.name, "stage", attempts=0)
+            self._stage_span.set(attempts=self._stage_span.attrs["attempts"] + 1)
+        self._rounds += 1
+        self._round_span = self.tracer.enter(speaker.name, "round", round=self._rounds)
+
+    def _record_run_start(self, project_name: str, extracted_desc: str):
+        if self.transcripts is not None:
+            self.transcripts.start_run(self.run_id, project_name, self.env_type, extracted_desc)
+
+    def _record_message(self, groupchat: CustomGroupChat):
+        """Store the message the group chat just appended (speaker selection runs after every append)."""
+        if self.transcripts is None or not groupchat.messages:
+            return
+        # proposals and their execution results belong to the stage attempt in progress
+        self._message_seq += 1
+        self.transcripts.add_message(self.run_id, self._message_seq, self._current_stage,
+                                     self._stage_attempts.get(self._current_stage), groupchat.messages[-1])
+
+    def _start_attempt(self, result):
+        speaker = result[0] if result else None
+        if speaker is not None and speaker.name in STAGE_TASKS:
+            self._current_stage = speaker.name
+            self._stage_attempts[speaker.name] += 1
+            self._attempt_started[speaker.name] = time.time()
+
+    def _record_attempt(self, stage: Optional[str], result: ExecutionResult):
+        if self.transcripts is None or stage not in STAGE_TASKS:
+            return
+        attempt = self._stage_attempts.get(stage)
+        self.transcripts.add_stage(self.run_id, stage, attempt, self._attempt_started.get(stage), result.succeeded,
+                                   result.exit_code)
+        self.transcripts.add_executions(self.run_id, stage, attempt, result.commands)
+
+    def _end_transcript(self):
+        if self.transcripts is None:
+            return
+        self.transcripts.end_run(self.run_id, self.finished, self.artifact_cache_status)
+        # batch workers exit without running atexit handlers
+        if not self.transcripts.flush(timeout=TRANSCRIPT_FLUSH_TIMEOUT):
+            self.console.print(f"[yellow]The transcript of run {self.run_id} is still being written to "
+                               f"{self.transcripts.path}.[/yellow]")
+
+    def _begin_trace(self, project_name: str, checkpoint: Optional[Checkpoint]):
+        # a resumed run appends to the trace of the run it continues
+        self.tracer = Tracer(self.trace_dir, checkpoint.run_id if checkpoint is not None else self.run_id)
+        self._run_span = self.tracer.enter("run", "run", project=project_name, env_type=self.env_type,
+                                           resumed=checkpoint is not None)
+
+    def _end_trace(self):
+        self.tracer.exit(self._stage_span, "error")       # a stage that did not complete
+        self.tracer.exit(self._run_span, "ok" if self.finished else "error", finished=self.finished,
+                         artifact_cache=self.artifact_cache_status)
+        self.tracer.close()
+        if self.tracer.path is not None:
+            self.console.print(f"[cyan]Trace: {self.tracer.path}[/cyan]")
+
+    def _pipeline_next_stage(self, last_speaker: Agent, groupchat: CustomGroupChat, result):
+        next_agent = self.next_stage.get(last_speaker)
+        if next_agent is not None and result and result[0] is self.human_proxy_group:
+            # the proposal is about to be executed: draft the next stage from the messages it gets on success
+            draft_messages = self.stored_messages + [self._summary_message(groupchat.messages[-1])]
+            self.drafter.start(next_agent, draft_messages, self.group_chat_manager)
+        elif last_speaker is self.human_proxy_group:
+            # the stage failed (or the chat ended): drafts of stages that are not up next are stale
+            for agent in self.next_stage.values():
+                if not result or result[0] is not agent:
+                    self.drafter.discard(agent)
+
+    def _report_cache_stats(self):
+        if self.llm_cache is None:
+            return
+        stats = self.llm_cache.stats()
+        if stats:
+            table = Table(title="LLM response cache", title_justify="left")
+            table.add_column("Stage")
+            table.add_column("Hits", justify="right")
+            table.add_column("Misses", justify="right")
+            table.add_column("Hit rate", justify="right")
+            for stage, counts in stats.items():
+                table.add_row(stage, str(counts["hits"]), str(counts["misses"]), f"{counts['hit_rate']:.0%}")
+            self.console.print(table)
+        self.llm_cache.close()
+
+    def _report_context_stats(self):
+        stats = {stage: counts for stage, counts in self.context_budgeter.stats().items() if counts["saved"]}
+        if stats:
+            table = Table(title="Retry context compaction", title_justify="left")
+            table.add_column("Stage")
+            table.add_column("Retries", justify="right")
+            table.add_column("Tokens before", justify="right")
+            table.add_column("Tokens sent", justify="right")
+            table.add_column("Saved", justify="right")
+            for stage, counts in stats.items():
+                table.add_row(stage, str(counts["compactions"]), str(counts["tokens_before"]),
+                              str(counts["tokens_after"]), str(counts["saved"]))
+            self.console.print(table)
+
+    def _report_reexecution_stats(self):
+        stats = self.execution_ledger.stats() if self.execution_ledger is not None else {}
+        if stats:
+            table = Table(title="Incremental re-execution", title_justify="left")
+            table.add_column("Stage")
+            table.add_column("Commands skipped", justify="right")
+            table.add_column("Saved (s)", justify="right")
+            for stage, counts in stats.items():
+                table.add_row(stage, str(counts["reused"]), f"{counts['saved_s']:.1f}")
+            self.console.print(table)
+
+    def _report_speculation_stats(self):
+        if self.drafter is None:
+            return
+        stats = self.drafter.stats()
+        if stats:
+            table = Table(title="Speculative stage drafts", title_justify="left")
+            table.add_column("Stage")
+            table.add_column("Drafts", justify="right")
+            table.add_column("Committed", justify="right")
+            table.add_column("Discarded", justify="right")
+            table.add_column("Saved (s)", justify="right")
+            for stage, counts in stats.items():
+                table.add_row(stage, str(counts["drafts"]), str(counts["committed"]), str(counts["discarded"]),
+                              f"{counts['saved_s']:.1f}")
+            self.console.print(table)
+        self.drafter.close()
+
+    def _report_routing_stats(self):
+        if self.model_router is None:
+            return
+        requests = self.model_router.requests()
+        if requests:
+            stats = self.model_router.stats()
+            table = Table(title="Model routing", title_justify="left")
+            table.add_column("Stage")
+            table.add_column("Model")
+            table.add_column("Requests", justify="right")
+            table.add_column("p50 (s)", justify="right")
+            table.add_column("p95 (s)", justify="right")
+            table.add_column("Success", justify="right")
+            for (stage, model), count in sorted(requests.items()):
+                s = stats.get(stage, {}).get(model)
+                table.add_row(stage, model, str(count), *((f"{s['p50']:.1f}", f"{s['p95']:.1f}", f"{s['success_rate']:.0%}")
+                                                         if s else ("-", "-", "-")))
+            self.console.print(table)
+        try:
+            self.model_router.save()
+        except OSError as e:
+            self.console.print(f"[yellow]Could not save the model statistics: {e}[/yellow]")
+
+    def _show_stream_status(self, stage: str, status: Optional[str]):
+        if stage in STAGE_TASKS and STAGE_TASKS[stage][0] in self.tasks:
+            description, task = self.tasks[STAGE_TASKS[stage][0]]
+            self.progress.update(task, description=f"{description} [dim]{escape(status)}[/dim]" if status else description)
+
+    def _report_streaming_stats(self):
+        if self.stream_monitor is None:
+            return
+        stats = self.stream_monitor.stats()
+        if stats:
+            table = Table(title="Streamed replies", title_justify="left")
+            table.add_column("Stage")
+            table.add_column("Replies", justify="right")
+            table.add_column("Tokens", justify="right")
+            table.add_column("Generation (s)", justify="right")
+            table.add_column("First command (s)", justify="right")
+            table.add_column("Run early", justify="right")
+            table.add_column("Overlap (s)", justify="right")
+            for stage, counts in stats.items():
+                early = counts["early_replies"]
+                # without streaming the first command starts when the generation is complete
+                first = counts["first_command_s"] / early if early else counts["generation_s"] / max(1, counts["replies"])
+                table.add_row(stage, str(counts["replies"]), str(counts["tokens"]), f"{counts['generation_s']:.1f}",
+                              f"{first:.1f}", str(counts["early_commands"]), f"{counts['overlap_s']:.1f}")
+            self.console.print(table)
+
+    def _report_hedging_stats(self):
+        if self.hedger is None:
+            return
+        stats = self.hedger.stats()
+        if stats:
+            table = Table(title="Request hedging", title_justify="left")
+            table.add_column("Model")
+            table.add_column("Requests", justify="right")
+            table.add_column("Hedged", justify="right")
+            table.add_column("Hedge won", justify="right")
+            table.add_column("Over budget", justify="right")
+            table.add_column("Extra cost ($)", justify="right")
+            for model, counts in stats.items():
+                table.add_row(model, str(counts["requests"]), str(counts["hedged"]), str(counts["hedge_won"]),
+                              str(counts["denied"]), f"{counts['extra_cost']:.4f}")
+            self.console.print(table)
+        self.hedger.close()
+
+    def _report_docker_timings(self):
+        timings = self.docker_timings
+        if timings:
+            table = Table(title="Docker builds", title_justify="left")
+            table.add_column("Image")
+            for phase in DOCKER_PHASES:
+                table.add_column(f"{phase.capitalize()} (s)", justify="right")
+            table.add_column("Context (MB)", justify="right")
+            for entry in timings:
+                context_mb = f"{entry['context_bytes'] / 1024 ** 2:.1f}" if "context_bytes" in entry else "-"
+                table.add_row(entry["image"], *(f"{entry[p]:.1f}" if p in entry else "-" for p in DOCKER_PHASES), context_mb)
+            self.console.print(table)
+
+    # run() and a_run() differ only in how they call autogen (initiate_chat or await a_initiate_chat);
+    # everything around those calls lives in the helpers below, shared by both
+
+    def _begin_run(self, project_name: str, checkpoint: Optional[Checkpoint]) -> bool:
+        """Start tracing and create the base agents; True if the checkpointed run has nothing left to do."""
+        self._begin_trace(project_name, checkpoint)
+        self.docker_timings = []
+        self._docker_timings_token = collect_docker_timings(self.docker_timings)
+        self._create_base_agents()
+        if self.monitor_agents:
+            import agentops
+            agentops.init(agentops_api_key)
+        if checkpoint is not None and checkpoint.finished:
+            self.console.print(f"[green]Run {checkpoint.run_id} already finished.[/green]")
+            self.finished = True
+            return True
+        return False
+
+    def _begin_extraction(self, project_name: str, project_description: str):
+        """The message for info_extracter, and its stage span."""
+        # First, handle all user interactions without progress display
+        self.console.print("[cyan]Gathering project information...[/cyan]")
+        if self.llm_cache is not None:
+            self.llm_cache.stage = self.extract_info_agent.name
+        chat_input = f"Project Name: {project_name}\nProject Description: {project_description}"
+        # entered (not a with block) so completions autogen runs in an executor thread find it in tracer.scope
+        return chat_input, self.tracer.enter(self.extract_info_agent.name, "stage")
+
+    def _extraction_failed(self, extract_span, error: Exception) -> bool:
+        self.tracer.exit(extract_span, "error", error=f"{type(error).__name__}: {error}")
+        self.console.print(f"[red]Error during information extraction: {str(error)}[/red]")
+        return False
+
+    def _end_extraction(self, extract_span, project_name: str, project_description: str) -> str:
+        self.tracer.exit(extract_span)
+        extracted_desc = extract_description(self.extract_info_agent.last_message()["content"])
+        self._start_checkpoint(project_name, project_description, extracted_desc)
+        return extracted_desc
+
+    def _prepare_pipeline(self):
+        """Create the stage agents and the group chat (inside the progress display)."""
+        self.console.print("\n[cyan]Starting project generation...[/cyan]")
+        task1 = self.add_task(1, "[dark_orange3]Waking up the agents... 🤖")
+        self._create_agents()
+        self._setup_group_chat()
+        if self.checkpoint is not None:
+            self._prepare_resume()
+        self.progress.update(task1, advance=100)
+
+    def _end_run(self):
+        if self.monitor_agents:
+            import agentops
+            agentops.end_session("Success")
+        if self.stream_monitor is not None:
+            self.stream_monitor.close()
+        self.shell_executor.stop()
+        if self.checkpoint is not None:
+            self.checkpoint.finished = self.finished
+            self._save_checkpoint()
+        self._report_cache_stats()
+        self._report_context_stats()
+        self._report_docker_timings()
+        if self._docker_timings_token is not None:
+            stop_collecting_docker_timings(self._docker_timings_token)
+            self._docker_timings_token = None
+        self._report_speculation_stats()
+        self._report_reexecution_stats()
+        self._report_routing_stats()
+        self._report_hedging_stats()
+        self._report_streaming_stats()
+        if self.group_chat is not None:
+            self._release_messages(self.group_chat)      # a chat that ended within a stage
+        self._end_transcript()
+        self._end_trace()
+
+    def run(self, project_name: str, project_description: str,
+            checkpoint: Optional[Checkpoint] = None) -> bool:
+        """Run the whole pipeline. Returns True if every stage finished with exit code 0."""
         try:
-            self._create_base_agents()
-            if self.monitor_agents:
-                agentops.init(agentops_api_key)
-            
-            # First, handle all user interactions without progress display
-            self.console.print("[cyan]Gathering project information...[/cyan]")
-            chat_input = f"Project Name: {project_name}\nProject Description: {project_description}"
-            
-            try:
-                self.human_proxy.initiate_chat(
-                    recipient=self.extract_info_agent,
-                    message=chat_input,
-                    silent=True
-                )
-            except Exception as e:
-                self.console.print(f"[red]Error during information extraction: {str(e)}[/red]")
-                return
-
-            extracted_desc = extract_description(self.extract_info_agent.last_message()["content"])
+            if self._begin_run(project_name, checkpoint):
+                return True
+            # a resumed run already has the extracted description; everything else asks info_extracter
+            extracted_desc = self._restore_checkpoint(checkpoint) if checkpoint is not None else None
+            if extracted_desc is None:
+                chat_input, extract_span = self._begin_extraction(project_name, project_description)
+                try:
+                    self.human_proxy.initiate_chat(
+                        recipient=self.extract_info_agent,
+                        message=chat_input,
+                        cache=self.llm_cache,
+                        silent=True
+                    )
+                except Exception as e:
+                    return self._extraction_failed(extract_span, e)
+                extracted_desc = self._end_extraction(extract_span, project_name, project_description)
+            self._record_run_start(project_name, extracted_desc)
 
             with self.progress:
-                self.console.print("\n[cyan]Starting project generation...[/cyan]")
-                
-                # Setup agents
-                task1 = self.add_task(1, "[dark_orange3]Waking up the agents... 🤖")
-                self._create_agents()
-                self._setup_group_chat()
-                self.progress.update(task1, advance=100)
+                self._prepare_pipeline()
+                # a spec that was generated before is replayed from its verified scripts, without the agents
+                replayed = checkpoint is None and self._replay_artifacts(extracted_desc)
+                try:
+                    if not replayed:
+                        self._add_similar_run_hints(extracted_desc)
+                        self.initializer.initiate_chat(
+                            self.group_chat_manager,
+                            message=extracted_desc,
+                            cache=self.llm_cache,
+                            silent=True
+                        )
+                        self._store_artifacts(extracted_desc)
+                except Exception as e:
+                    self.console.print(f"[red]Error during agent conversation: {str(e)}[/red]")
+        except Exception as e:
+            self.console.print(f"[red]Error during execution: {str(e)}[/red]")
+        finally:
+            self._end_run()
+        return self.finished
 
-                # Start the group chat
+    async def a_run(self, project_name: str, project_description: str,
+                    checkpoint: Optional[Checkpoint] = None) -> bool:
+        """Async counterpart of run(). Many sessions can be awaited concurrently on one event loop."""
+        try:
+            if self._begin_run(project_name, checkpoint):
+                return True
+            extracted_desc = self._restore_checkpoint(checkpoint) if checkpoint is not None else None
+            if extracted_desc is None:
+                chat_input, extract_span = self._begin_extraction(project_name, project_description)
                 try:
-                    self.initializer.initiate_chat(
-                        self.group_chat_manager,
-                        message=extracted_desc,
+                    await self.human_proxy.a_initiate_chat(
+                        recipient=self.extract_info_agent,
+                        message=chat_input,
+                        cache=self.llm_cache,
                         silent=True
                     )
+                except Exception as e:
+                    return self._extraction_failed(extract_span, e)
+                extracted_desc = self._end_extraction(extract_span, project_name, project_description)
+            self._record_run_start(project_name, extracted_desc)
+
+            with self.progress:
+                self._prepare_pipeline()
+                replayed = checkpoint is None and await asyncio.to_thread(self._replay_artifacts, extracted_desc)
+                try:
+                    if not replayed:
+                        self._add_similar_run_hints(extracted_desc)
+                        await self.initializer.a_initiate_chat(
+                            self.group_chat_manager,
+                            message=extracted_desc,
+                            cache=self.llm_cache,
+                            silent=True
+                        )
+                        self._store_artifacts(extracted_desc)
                 except Exception as e:
                     self.console.print(f"[red]Error during agent conversation: {str(e)}[/red]")
         except Exception as e:
             self.console.print(f"[red]Error during execution: {str(e)}[/red]")
         finally:
-            if self.monitor_agents:
-                agentops.end_session("Success")
+            self._end_run()
+        return self.finished
@@ -0,0 +1,320 @@
+"""
+Runs a structured command list with commands that touch no common path concurrently; anything it cannot
+parse is a barrier.
+"""
+import os
+import shlex
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Set
+from structured_output import CommandOutcome, ExecutionResult
+from Tracer import record_span
+
+# commands that create a directory named by their first positional argument
+SCAFFOLDERS = {
+    ("npx", "create-react-app"), ("npx", "create-next-app"), ("npx", "degit"), ("npm", "create"),
+    ("django-admin", "startproject"), ("cargo", "new"), ("rails", "new"), ("dotnet", "new"),
+    ("flutter", "create"), ("git", "clone"),
+}
+NODE_PACKAGE_MANAGERS = {"npm", "yarn", "pnpm"}
+PIP_COMMANDS = {"pip", "pip3"}
+READ_ONLY_COMMANDS = {"echo", "printf", "cat", "ls", "pwd", "which", "head", "tail", "grep", "true"}
+ROOT = os.sep           # barrier: overlaps with every path
+GLOBAL_PIP = "<global-site-packages>"
+
+
+@dataclass
+class PlannedCommand:
+    index: int
+    command: str
+    comment: str = ""
+    cwd: str = ""
+    prelude: List[str] = field(default_factory=list)
+    reads: Set[str] = field(default_factory=set)
+    writes: Set[str] = field(default_factory=set)
+    requires: Set[str] = field(default_factory=set)   # paths that must already exist (cwd, activated venv)
+    deps: Set[int] = field(default_factory=set)
+    runnable: bool = True                               # False for pure state changes (cd/source/export)
+
+
+@dataclass
+class CommandResult:
+    index: int
+    command: str
+    exit_code: Optional[int]
+    output: str = ""
+    started_at: float = 0.0     # seconds since the run started
+    duration: float = 0.0
+    skipped: bool = False
+
+
+@dataclass
+class ParallelRunResult:
+    exit_code: int
+    results: List[CommandResult]
+    wall_time: float
+
+    @property
+    def serial_time(self) -> float:
+        return sum(r.duration for r in self.results)
+
+    def to_execution_result(self) -> ExecutionResult:
+        failed = next((r for r in self.results if not r.skipped and r.exit_code not in (0, None)), None)
+        return ExecutionResult(
+            exit_code=self.exit_code,
+            output=self.output,
+            failed_command=failed.command if failed else None,
+            duration=self.wall_time,
+            commands=[
+                CommandOutcome(command=r.command, exit_code=r.exit_code, duration=r.duration, skipped=r.skipped)
+                for r in self.results
+            ],
+        )
+
+    @property
+    def output(self) -> str:
+        parts = []
+        for r in self.results:
+            if r.skipped:
+                parts.append(f"$ {r.command}\n(skipped: a command it depends on failed)")
+            else:
+                parts.append(f"$ {r.command}\n[exit {r.exit_code}, {r.duration:.2f}s]\n{r.output.rstrip()}")
+        return "\n".join(parts)
+
+
+def split_segments(command: str) -> List[str]:
+    """Split a command line on top-level `&&`, `;` and newlines, ignoring separators inside quotes."""
+    segments, current, quote, i = [], [], None, 0
+    while i < len(command):
+        ch = command[i]
+        if quote:
+            if ch == "\\" and quote == '"' and i + 1 < len(command):
+                current.append(command[i:i + 2])
+                i += 2
+                continue
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+        elif command.startswith("&&", i) or ch in (";", "\n"):
+            segments.append("".join(current))
+            current = []
+            i += 2 if ch == "&" else 1
+            continue
+        current.append(ch)
+        i += 1
+    segments.append("".join(current))
+    return [s.strip() for s in segments if s.strip()]
+
+
+def _overlap(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    if a.startswith("<") or b.startswith("<"):
+        return False
+    return a.startswith(b.rstrip(os.sep) + os.sep) or b.startswith(a.rstrip(os.sep) + os.sep)
+
+
+def _contains(parent: str, child: str) -> bool:
+    if parent.startswith("<") or child.startswith("<"):
+        return parent == child
+    return parent == child or child.startswith(parent.rstrip(os.sep) + os.sep)
+
+
+class CommandPlanner:
+    """Resolves cwd, prelude and read/write sets for a command list and derives the dependency graph."""
+
+    def __init__(self, work_dir: str):
+        self.work_dir = os.path.abspath(work_dir)
+
+    def _path(self, cwd: str, path: str) -> str:
+        return os.path.normpath(os.path.join(cwd, os.path.expanduser(path)))
+
+    def plan(self, commands: Sequence) -> List[PlannedCommand]:
+        cwd, prelude, venv = self.work_dir, [], None
+        planned = []
+        for index, item in enumerate(commands):
+            text = item["command"] if isinstance(item, dict) else item.command
+            comment = item.get("comment", "") if isinstance(item, dict) else getattr(item, "comment", "")
+            cmd = PlannedCommand(index=index, command=text, comment=comment, cwd=cwd, prelude=list(prelude))
+            cmd.requires.add(cwd)
+            if venv:
+                cmd.requires.add(venv)
+            state_only = True
+            for segment in split_segments(text):
+                try:
+                    tokens = shlex.split(segment, comments=True)
+                except ValueError:
+                    tokens = None
+                if not tokens:
+                    if tokens is None:
+                        cmd.writes.add(ROOT)
+                        state_only = False
+                    continue
+                program = os.path.basename(tokens[0])
+                if program == "cd":
+                    target = tokens[1] if len(tokens) > 1 else "~"
+                    if target == "-":
+                        cmd.writes.add(ROOT)
+                        state_only = False
+                        continue
+                    cwd = self._path(cwd, target)
+                    cmd.requires.add(cwd)
+                    continue
+                if program in ("source", ".") and len(tokens) > 1:
+                    script = self._path(cwd, tokens[1])
+                    cmd.reads.add(script)
+                    prelude.append(f"source {shlex.quote(script)}")
+                    if script.endswith(os.path.join("bin", "activate")):
+                        venv = os.path.dirname(os.path.dirname(script))
+                        cmd.requires.add(venv)
+                    continue
+                if program == "export" or ("=" in tokens[0] and len(tokens) == 1 and not tokens[0].startswith("=")):
+                    prelude.append(segment)
+                    continue
+                state_only = False
+                self._effects(cmd, tokens, program, cwd, venv)
+            # the cwd/prelude in effect AFTER this command is what the next one starts from
+            cmd.runnable = not state_only
+            planned.append(cmd)
+        self._link(planned)
+        return planned
+
+    def _effects(self, cmd: PlannedCommand, tokens: List[str], program: str, cwd: str, venv: Optional[str]):
+        args = tokens[1:]
+        # redirections and tee write their target, wherever they appear
+        for i, token in enumerate(tokens):
+            if token in (">", ">>", "2>", "&>") and i + 1 < len(tokens):
+                cmd.writes.add(self._path(cwd, tokens[i + 1]))
+            elif token.startswith(">") and len(token) > 1 and not token.startswith(">&"):
+                cmd.writes.add(self._path(cwd, token.lstrip(">")))
+        if "tee" in tokens:
+            cmd.writes.update(self._path(cwd, t) for t in tokens[tokens.index("tee") + 1:] if not t.startswith("-"))
+        positional = [a for a in args if not a.startswith("-") and not a.startswith(">") and a not in (">", ">>", "|")]
+
+        if program in ("mkdir", "touch", "rm", "rmdir"):
+            cmd.writes.update(self._path(cwd, a) for a in positional)
+        elif program in ("cp", "mv") and len(positional) >= 2:
+            cmd.reads.update(self._path(cwd, a) for a in positional[:-1])
+            cmd.writes.add(self._path(cwd, positional[-1]))
+        elif program in ("python", "python3") and args[:2] == ["-m", "venv"] and len(args) > 2:
+            cmd.writes.add(self._path(cwd, args[-1]))
+        elif program == "virtualenv" and positional:
+            cmd.writes.add(self._path(cwd, positional[-1]))
+        elif program in PIP_COMMANDS or (program in ("python", "python3") and args[:2] == ["-m", "pip"]):
+            cmd.writes.add(venv or GLOBAL_PIP)
+            for i, a in enumerate(args):
+                if a in ("-r", "--requirement") and i + 1 < len(args):
+                    cmd.reads.add(self._path(cwd, args[i + 1]))
+            if "freeze" in args and not any(t in (">", ">>") or t.startswith(">") for t in tokens):
+                cmd.writes.discard(venv or GLOBAL_PIP)
+                cmd.reads.add(venv or GLOBAL_PIP)
+        elif len(tokens) > 1 and (program, tokens[1]) in SCAFFOLDERS:
+            names = [a for a in tokens[2:] if not a.startswith("-")]
+            if program == "git" and names:
+                # git clone <url> [<dir>]
+                names = names[1:] or [os.path.splitext(os.path.basename(names[0]))[0]]
+            elif program == "npm":
+                names = names[1:]      # npm create <template> <name>
+            cmd.writes.add(self._path(cwd, names[0]) if names else cwd)
+        elif program in NODE_PACKAGE_MANAGERS or program == "npx":
+            cmd.writes.add(cwd)          # package.json, lock file and node_modules of this directory
+        elif program in READ_ONLY_COMMANDS and not cmd.writes:
+            cmd.reads.update(self._path(cwd, a) for a in positional if program not in ("echo", "printf"))
+        elif not cmd.writes:
+            cmd.writes.add(cwd)          # unknown command: assume it may touch anything below its directory
+
+    @staticmethod
+    def _link(planned: List[PlannedCommand]):
+        for j, later in enumerate(planned):
+            for earlier in planned[:j]:
+                if not earlier.runnable:
+                    continue
+                if (
+                    any(_overlap(w, p) for w in earlier.writes for p in later.writes | later.reads)
+                    or any(_overlap(w, r) for w in later.writes for r in earlier.reads)
+                    or any(_contains(w, q) for w in earlier.writes for q in later.requires)
+                ):
+                    later.deps.add(earlier.index)
+
+
+class ParallelCommandExecutor:
+    """
+    Runs a structured command list, executing independent commands concurrently.
+
+    :param work_dir: directory relative paths and the first command are resolved against.
+    :param max_workers: upper bound on commands running at the same time.
+    :param timeout: seconds a single command may run.
+    """
+
+    def __init__(self, work_dir: str = ".", max_workers: int = 4, timeout: int = 600, shell: str = "/bin/bash"):
+        self.work_dir = os.path.abspath(work_dir)
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.shell = shell
+        self.planner = CommandPlanner(self.work_dir)
+
+    def _run_one(self, cmd: PlannedCommand, t0: float) -> CommandResult:
+        started = time.perf_counter()
+        script = "\n".join(cmd.prelude + [cmd.command])
+        try:
+            proc = subprocess.run(
+                [self.shell, "-c", script], cwd=cmd.cwd, stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace", timeout=self.timeout,
+            )
+            exit_code, output = proc.returncode, proc.stdout
+        except subprocess.TimeoutExpired as e:
+            exit_code = 124
+            output = (e.stdout or "") if isinstance(e.stdout, str) else ""
+            output += f"\nTimeout: the command did not finish within {self.timeout}s."
+        except OSError as e:            # e.g. the directory it should run in does not exist
+            exit_code, output = 1, str(e)
+        return CommandResult(cmd.index, cmd.command, exit_code, output, started - t0, time.perf_counter() - started)
+
+    def run(self, commands: Sequence) -> ParallelRunResult:
+        os.makedirs(self.work_dir, exist_ok=True)
+        planned = self.planner.plan(commands)
+        t0 = time.perf_counter()
+        results: Dict[int, CommandResult] = {}
+        for cmd in planned:
+            if not cmd.runnable:
+                results[cmd.index] = CommandResult(cmd.index, cmd.command, 0)
+        pending = {cmd.index: cmd for cmd in planned if cmd.runnable}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+            while pending or running:
+                for index in sorted(pending):
+                    cmd = pending[index]
+                    dep_results = [results.get(d) for d in cmd.deps]
+                    if any(r is not None and (r.skipped or r.exit_code != 0) for r in dep_results):
+                        results[index] = CommandResult(index, cmd.command, None, skipped=True)
+                        del pending[index]
+                    elif all(r is not None for r in dep_results):
+                        running[pool.submit(self._run_one, cmd, t0)] = index
+                        del pending[index]
+                if not running:
+                    continue
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    results[index] = future.result()
+
+        ordered = [results[i] for i in range(len(planned))]
+        failed = next((r for r in ordered if not r.skipped and r.exit_code not in (0, None)), None)
+        return ParallelRunResult(failed.exit_code if failed else 0, ordered, time.perf_counter() - t0)
+
+    def execute_commands(self, commands: Sequence, stage: Optional[str] = None) -> ExecutionResult:
+        """
+        Same interface as PersistentShellExecutor.execute_commands. stage is accepted for compatibility only:
+        commands running concurrently cannot be attributed workspace effects, so there is no incremental re-execution.
+        """
+        started = time.time()
+        run = self.run(commands)
+        for r in run.results:
+            if not r.skipped and r.duration:
+                record_span("exec", "exec", r.duration, start=started + r.started_at,
+                            status="ok" if r.exit_code == 0 else "error", command=r.command, exit_code=r.exit_code)
+        return run.to_execution_result()
@@ -0,0 +1,109 @@
+"""
+Content-addressed LLM response cache for initiate_chat(cache=...), keyed on the model, the normalized
+messages and the request options.
+"""
+import hashlib
+import json
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import diskcache
+
+DEFAULT_MAX_SIZE_BYTES = 1024 ** 3          # 1 GiB
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60      # a week
+
+
+def _normalize_text(text: str) -> str:
+    # line endings and trailing whitespace do not change what the model sees in any meaningful way
+    return "\n".join(line.rstrip() for line in text.replace("\r\n", "\n").split("\n")).strip()
+
+
+def _normalize_message(message: Dict) -> Dict:
+    normalized = {"role": message.get("role")}
+    content = message.get("content")
+    if isinstance(content, str):
+        normalized["content"] = _normalize_text(content)
+    elif content is not None:
+        normalized["content"] = content
+    for key in ("name", "tool_calls", "tool_call_id", "function_call"):
+        if message.get(key) is not None:
+            normalized[key] = message[key]
+    return normalized
+
+
+def derive_key(autogen_key: str) -> str:
+    """Map autogen's request key to a sha256 over model, normalized messages, temperature and other options."""
+    try:
+        params = json.loads(autogen_key)
+    except (TypeError, ValueError):
+        return hashlib.sha256(str(autogen_key).encode("utf-8")).hexdigest()
+    if not isinstance(params, dict):
+        return hashlib.sha256(autogen_key.encode("utf-8")).hexdigest()
+
+    messages: List[Dict] = params.get("messages") or []
+    material = {
+        "model": params.get("model"),
+        "temperature": params.get("temperature"),
+        "messages": [_normalize_message(m) for m in messages if isinstance(m, dict)],
+        "options": {k: v for k, v in params.items() if k not in ("model", "temperature", "messages")},
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    LLM completion cache with LRU eviction, a size cap, a TTL and per-stage hit/miss counters.
+
+    :param directory: where the cache lives on disk; safe to share between processes.
+    :param max_size_bytes: least recently used entries are culled once the store grows past this.
+    :param ttl_seconds: entries expire after this many seconds (None keeps them until evicted).
+    """
+
+    def __init__(self, directory: str, max_size_bytes: int = DEFAULT_MAX_SIZE_BYTES,
+                 ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS):
+        self.directory = str(directory)
+        self.ttl_seconds = ttl_seconds
+        self._store = diskcache.Cache(
+            self.directory,
+            size_limit=max_size_bytes,
+            eviction_policy="least-recently-used",
+        )
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0})
+        self.stage = "default"
+
+    # AbstractCache protocol ---------------------------------------------------------------
+
+    def get(self, key: str, default: Optional[Any] = None) -> Optional[Any]:
+        value = self._store.get(derive_key(key), default=None)
+        with self._lock:
+            self._stats[self.stage]["hits" if value is not None else "misses"] += 1
+        return default if value is None else value
+
+    def set(self, key: str, value: Any) -> None:
+        self._store.set(derive_key(key), value, expire=self.ttl_seconds)
+
+    def close(self) -> None:
+        self._store.close()
+
+    def __enter__(self) -> "ResponseCache":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        # autogen enters/exits the cache around every request; the store stays open for reuse
+        return None
+
+    # stats --------------------------------------------------------------------------------
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Hit/miss counters per stage, with the hit rate."""
+        with self._lock:
+            return {
+                stage: {**counts, "hit_rate": counts["hits"] / max(1, counts["hits"] + counts["misses"])}
+                for stage, counts in self._stats.items()
+            }
+
+    def volume(self) -> int:
+        """Current size of the store on disk, in bytes."""
+        return self._store.volume()
@@ -0,0 +1,297 @@
+"""
+MinHash/LSH index of the verified runs in the artifact cache, used to hint each stage agent with the script
+of the closest run of a similar spec.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from ArtifactCache import ArtifactCache, ArtifactEntry, normalize_dependency, is_dependency_key
+from helper_functions import atomic_write
+from ParallelCommandExecutor import split_segments
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 128
+NUM_BANDS = 32                      # 32 bands of 4 rows: runs with a Jaccard similarity of ~0.45+ usually collide
+MERSENNE_PRIME = (1 << 31) - 1
+DEFAULT_MIN_SIMILARITY = 0.5
+INDEX_FILE = "spec_index.npz"
+MAX_HINT_CHARS = 6000               # per stage; longer scripts are cut, the agent still sees how they start
+SIGNATURE_CHUNK = 4096              # token sets hashed per NumPy batch
+
+_INSTALL = re.compile(
+    r"^(?:sudo\s+)?(?:pip3?|python3?\s+-m\s+pip|uv\s+pip|poetry|npm|pnpm|yarn|cargo|go|gem|composer)\s+"
+    r"(?:install|add|i|get|require)\b(?P<args>.*)$"
+)
+_REQUIREMENTS_HEREDOC = re.compile(r"requirements[\w.-]*\.txt.*<<-?\s*['\"]?(?P<end>\w+)|<<-?\s*['\"]?(?P<end2>\w+)['\"]?.*requirements[\w.-]*\.txt")
+_WORD = re.compile(r"[a-z0-9][a-z0-9+#.-]*")
+
+HINT_TEMPLATE = """
+A verified run for a similar project spec (estimated similarity {similarity:.0%}) completed your stage successfully.
+Its spec was:
+{spec}
+and these are the commands it executed in your stage, in order:
+{commands}
+Start from this known-good script: keep what also fits the current spec and change only what the current spec needs.
+"""
+
+
+def _dependency_name(dependency: str) -> str:
+    # "flask-sqlalchemy>=3.0" -> "flask-sqlalchemy"; scoped npm packages keep their leading "@"
+    return re.split(r"(?<=.)[<>=!~^@:]", normalize_dependency(dependency))[0]
+
+
+def spec_tokens(spec: Dict) -> Set[str]:
+    """Tokens of a canonical spec (see ArtifactCache.canonical_spec)."""
+    tokens = set()
+
+    def visit(key: str, value, dependency: bool):
+        if isinstance(value, dict):
+            for k, v in value.items():
+                visit(k, v, dependency or is_dependency_key(k))
+        elif isinstance(value, list):
+            for item in value:
+                visit(key, item, dependency)
+        elif isinstance(value, str) and value:
+            if dependency:
+                tokens.add(f"dep:{_dependency_name(value)}")
+            else:
+                tokens.update(f"{key}:{word}" for word in _WORD.findall(value))
+        elif value is not None:
+            tokens.add(f"{key}:{value}")
+
+    visit("", spec, False)
+    return tokens
+
+
+def script_tokens(scripts: Dict[str, List[Dict]]) -> Set[str]:
+    """`dep:<name>` for the packages the stage scripts installed or listed in a requirements file."""
+    tokens = set()
+    for steps in scripts.values():
+        for step in steps:
+            heredoc_end = None
+            for segment in split_segments(step["command"]):
+                if heredoc_end is not None:
+                    if segment == heredoc_end:
+                        heredoc_end = None
+                    elif not segment.startswith("#"):
+                        tokens.add(f"dep:{_dependency_name(segment)}")
+                    continue
+                heredoc = _REQUIREMENTS_HEREDOC.search(segment)
+                if heredoc is not None:
+                    heredoc_end = heredoc.group("end") or heredoc.group("end2")
+                    continue
+                install = _INSTALL.match(segment)
+                if install is not None:
+                    for arg in install.group("args").split():
+                        if not arg.startswith("-") and "/" not in arg.lstrip("@") and not arg.endswith(".txt"):
+                            tokens.add(f"dep:{_dependency_name(arg.strip(chr(39) + chr(34)))}")
+    return tokens
+
+
+def run_tokens(entry: ArtifactEntry) -> Set[str]:
+    return spec_tokens(entry.spec) | script_tokens(entry.scripts)
+
+
+@lru_cache(maxsize=1 << 16)
+def _token_hash(token: str) -> int:
+    # stable across processes, unlike hash(); tokens repeat a lot across runs (dep:flask, language_preferences:python)
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little") % MERSENNE_PRIME
+
+
+def token_hashes(tokens: Iterable[str]) -> np.ndarray:
+    return np.fromiter((_token_hash(t) for t in tokens), dtype=np.uint64)
+
+
+class MinHasher:
+    """h_i(x) = (a_i * x + b_i) mod p for NUM_PERM random (a_i, b_i); a signature is the per-i minimum over a set."""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        generator = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = generator.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = generator.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signatures(self, token_sets: Sequence[Iterable[str]]) -> np.ndarray:
+        """(len(token_sets), num_perm) uint32 signatures; an empty set gets the all-max signature."""
+        result = np.full((len(token_sets), self.num_perm), MERSENNE_PRIME, dtype=np.uint32)
+        for start in range(0, len(token_sets), SIGNATURE_CHUNK):
+            hashes = [token_hashes(tokens) for tokens in token_sets[start:start + SIGNATURE_CHUNK]]
+            lengths = np.array([len(h) for h in hashes])
+            if not lengths.any():
+                continue
+            flat = np.concatenate(hashes)
+            # a, x < 2**31, so a * x + b stays well inside uint64
+            permuted = (self.a[:, None] * flat[None, :] + self.b[:, None]) % np.uint64(MERSENNE_PRIME)
+            non_empty = np.flatnonzero(lengths)
+            offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))[non_empty]
+            result[start + non_empty] = np.minimum.reduceat(permuted, offsets, axis=1).T.astype(np.uint32)
+        return result
+
+    def signature(self, tokens: Iterable[str]) -> np.ndarray:
+        return self.signatures([list(tokens)])[0]
+
+
+class SpecIndex:
+    """
+    MinHash/LSH index of verified runs, keyed by their artifact cache key.
+
+    :param directory: where the index is saved (the artifact cache directory); None keeps it in memory.
+    :param num_bands: LSH bands; num_perm / num_bands rows each. More bands find less similar runs.
+    :param min_similarity: candidates with a lower estimated Jaccard similarity are not returned.
+    """
+
+    def __init__(self, directory: Optional[str] = None, num_perm: int = NUM_PERM, num_bands: int = NUM_BANDS,
+                 min_similarity: float = DEFAULT_MIN_SIMILARITY):
+        if num_perm % num_bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of num_bands ({num_bands})")
+        self.directory = directory
+        self.hasher = MinHasher(num_perm)
+        self.num_bands = num_bands
+        self.min_similarity = min_similarity
+        self.keys: List[str] = []
+        self.env_types: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self._pending: List[np.ndarray] = []
+        self._alive = np.empty(0, dtype=bool)
+        self._tables: Optional[Tuple[np.ndarray, np.ndarray]] = None     # per band: sorted band hashes, row ids
+        self.dirty = False          # changed since it was loaded or saved
+        rows = num_perm // num_bands
+        self._band_multipliers = np.random.default_rng(2).integers(1, 1 << 62, size=rows, dtype=np.uint64) | np.uint64(1)
+
+    def __len__(self) -> int:
+        return int(self._alive.sum())
+
+    # building -------------------------------------------------------------------------------
+
+    def add_many(self, keys: Sequence[str], env_types: Sequence[str], token_sets: Sequence[Iterable[str]]):
+        """Add (or replace) runs; the LSH tables are rebuilt on the next query."""
+        signatures = self.hasher.signatures(token_sets)
+        for key in keys:
+            self.remove(key)
+        for key, env_type in zip(keys, env_types):
+            self._positions[key] = len(self.keys)
+            self.keys.append(key)
+            self.env_types.append(env_type)
+        self._pending.append(signatures)
+        self._alive = np.concatenate((self._alive, np.ones(len(keys), dtype=bool)))
+        self._tables = None
+        self.dirty = True
+
+    def add(self, key: str, env_type: str, tokens: Iterable[str]):
+        self.add_many([key], [env_type], [list(tokens)])
+
+    def remove(self, key: str):
+        position = self._positions.pop(key, None)
+        if position is not None:
+            self._alive[position] = False
+            self.dirty = True
+
+    def _band_hashes(self, signatures: np.ndarray) -> np.ndarray:
+        rows = signatures.reshape(len(signatures), self.num_bands, len(self._band_multipliers)).astype(np.uint64)
+        return (rows * self._band_multipliers).sum(axis=2)        # wraps mod 2**64, which is fine for a hash
+
+    def _build_tables(self):
+        if self._pending:
+            self._signatures = np.concatenate([self._signatures] + self._pending)
+            self._pending = []
+        band_hashes = self._band_hashes(self._signatures).T        # (bands, N)
+        order = np.argsort(band_hashes, axis=1, kind="stable")
+        self._tables = (np.take_along_axis(band_hashes, order, axis=1), order)
+
+    # querying -------------------------------------------------------------------------------
+
+    def query(self, tokens: Iterable[str], env_type: Optional[str] = None, k: int = 1) -> List[Tuple[str, float]]:
+        """Up to k (key, estimated similarity) of the closest runs, most similar first."""
+        if not len(self.keys):
+            return []
+        if self._tables is None:
+            self._build_tables()
+        signature = self.hasher.signature(tokens)
+        query_bands = self._band_hashes(signature[None, :])[0]
+        sorted_hashes, row_ids = self._tables
+        candidates = []
+        for band in range(self.num_bands):
+            left = np.searchsorted(sorted_hashes[band], query_bands[band], side="left")
+            right = np.searchsorted(sorted_hashes[band], query_bands[band], side="right")
+            if right > left:
+                candidates.append(row_ids[band, left:right])
+        if not candidates:
+            return []
+        candidates = np.unique(np.concatenate(candidates))
+        candidates = candidates[self._alive[candidates]]
+        if env_type is not None:
+            candidates = np.array([c for c in candidates if self.env_types[c] == env_type], dtype=np.int64)
+        if not len(candidates):
+            return []
+        similarity = (self._signatures[candidates] == signature).mean(axis=1)
+        best = np.argsort(-similarity, kind="stable")[:k]
+        return [(self.keys[candidates[i]], float(similarity[i])) for i in best if similarity[i] >= self.min_similarity]
+
+    # persistence ----------------------------------------------------------------------------
+
+    def save(self):
+        """Write the live entries to <directory>/spec_index.npz (atomically)."""
+        if self.directory is None:
+            return
+        if self._pending:
+            self._build_tables()
+        alive = np.flatnonzero(self._alive)
+        os.makedirs(self.directory, exist_ok=True)
+        with atomic_write(os.path.join(self.directory, INDEX_FILE), binary=True) as f:
+            np.savez(f, signatures=self._signatures[alive], keys=np.array(self.keys)[alive],
+                     env_types=np.array(self.env_types)[alive])
+        self.dirty = False
+
+    @classmethod
+    def open(cls, cache: ArtifactCache, **kwargs) -> "SpecIndex":
+        """
+        Load the index saved next to the artifact cache's entries, then add the entries it does not know yet
+        (stored by other processes) and drop the ones that were invalidated.
+        """
+        index = cls(cache.directory, **kwargs)
+        path = os.path.join(cache.directory, INDEX_FILE)
+        if os.path.exists(path):
+            try:
+                with np.load(path, allow_pickle=False) as saved:
+                    if saved["signatures"].shape[1] == index.hasher.num_perm:
+                        index.keys = [str(key) for key in saved["keys"]]
+                        index.env_types = [str(env) for env in saved["env_types"]]
+                        index._positions = {key: i for i, key in enumerate(index.keys)}
+                        index._signatures = saved["signatures"]
+                        index._alive = np.ones(len(index.keys), dtype=bool)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("rebuilding unreadable spec index %s: %s", path, e)
+
+        stored = set(cache.keys())
+        for key in set(index._positions) - stored:
+            index.remove(key)
+        new_entries = [entry for entry in (cache.get(key) for key in stored - set(index._positions)) if entry is not None]
+        if new_entries:
+            index.add_many([e.key for e in new_entries], [e.env_type for e in new_entries],
+                           [run_tokens(e) for e in new_entries])
+            logger.info("indexed %d new verified runs", len(new_entries))
+        return index
+
+
+def similar_run_hint(entry: ArtifactEntry, stage: str, similarity: float) -> Optional[str]:
+    """Few-shot hint for stage from a similar verified run, or None if that run has no script for it."""
+    steps = entry.scripts.get(stage)
+    if not steps:
+        return None
+    lines = []
+    for number, step in enumerate(steps, 1):
+        where = f" (in {step['cwd']})" if step.get("cwd") not in (None, ".") else ""
+        lines.append(f"{number}.{where}\n{step['command']}")
+    commands = "\n".join(lines)
+    if len(commands) > MAX_HINT_CHARS:
+        commands = commands[:MAX_HINT_CHARS] + "\n[... rest of the script omitted]"
+    return HINT_TEMPLATE.format(similarity=similarity, spec=json.dumps(entry.spec, indent=2), commands=commands)
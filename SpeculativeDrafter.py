@@ -0,0 +1,139 @@
+"""
+Drafts the next stage agent's reply while the current stage's commands run; the draft is served if the
+stage succeeds and the agent is given the same messages.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from autogen import Agent, ConversableAgent
+
+logger = logging.getLogger(__name__)
+
+
+def messages_digest(messages: List[Dict]) -> str:
+    material = [(m.get("role"), m.get("name"), m.get("content")) for m in messages]
+    return hashlib.sha256(json.dumps(material, default=str).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Draft:
+    agent: ConversableAgent
+    digest: str
+    future: Future
+    started: float
+    finished: Optional[float] = None
+
+
+class SpeculativeDrafter:
+    """Starts, serves and discards speculative drafts of the next stage agent's reply."""
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="speculative_draft")
+        self._drafts: Dict[str, Draft] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"drafts": 0, "committed": 0, "discarded": 0, "saved_s": 0.0}
+        )
+
+    def register(self, agent: ConversableAgent):
+        """Let agent answer from a matching draft instead of calling its LLM."""
+        agent.register_reply([Agent, None], self._serve_draft)
+        # in async chats, wait for the draft without blocking the event loop (checked before the sync variant)
+        agent.register_reply([Agent, None], self._a_serve_draft, ignore_async_in_sync_chat=True)
+
+    def start(self, agent: ConversableAgent, messages: List[Dict], sender: Agent):
+        """Start generating agent's reply to messages in the background."""
+        messages = [dict(m) for m in messages]
+        self.discard(agent)
+        draft = Draft(agent=agent, digest=messages_digest(messages), future=Future(), started=time.perf_counter())
+
+        def generate():
+            try:
+                # exclude the draft replies themselves, so the LLM is actually called
+                reply = agent.generate_reply(messages=messages, sender=sender,
+                                             exclude=[self._serve_draft, self._a_serve_draft])
+            except Exception as e:
+                draft.finished = time.perf_counter()
+                draft.future.set_exception(e)
+            else:
+                draft.finished = time.perf_counter()
+                draft.future.set_result(reply)
+
+        with self._lock:
+            self._drafts[agent.name] = draft
+            self._stats[agent.name]["drafts"] += 1
+        self._executor.submit(generate)
+        logger.debug("started a speculative draft for %s", agent.name)
+
+    def discard(self, agent: ConversableAgent):
+        """Drop agent's pending draft (its stage input changed, e.g. because the stage before it failed)."""
+        with self._lock:
+            draft = self._drafts.pop(agent.name, None)
+            if draft is not None:
+                self._stats[agent.name]["discarded"] += 1
+
+    def _take(self, recipient: ConversableAgent, messages: Optional[List[Dict]]) -> Optional[Draft]:
+        with self._lock:
+            draft = self._drafts.pop(recipient.name, None)
+            if draft is None:
+                return None
+            if messages is None or messages_digest(messages) != draft.digest:
+                self._stats[recipient.name]["discarded"] += 1
+                return None
+            return draft
+
+    def _commit(self, recipient: ConversableAgent, draft: Draft, requested: float, reply):
+        if reply is None:
+            return False, None
+        duration = draft.finished - draft.started
+        saved = max(0.0, min(duration, requested - draft.started))
+        with self._lock:
+            stats = self._stats[recipient.name]
+            stats["committed"] += 1
+            stats["saved_s"] += saved
+        logger.debug("served the speculative draft of %s, %.1fs saved", recipient.name, saved)
+        return True, reply
+
+    def _serve_draft(self, recipient: ConversableAgent, messages: Optional[List[Dict]] = None,
+                     sender: Optional[Agent] = None, config=None):
+        draft = self._take(recipient, messages)
+        if draft is None:
+            return False, None
+        requested = time.perf_counter()
+        try:
+            reply = draft.future.result()
+        except Exception as e:
+            logger.warning("speculative draft of %s failed: %s", recipient.name, e)
+            return False, None
+        return self._commit(recipient, draft, requested, reply)
+
+    async def _a_serve_draft(self, recipient: ConversableAgent, messages: Optional[List[Dict]] = None,
+                             sender: Optional[Agent] = None, config=None):
+        draft = self._take(recipient, messages)
+        if draft is None:
+            return False, None
+        requested = time.perf_counter()
+        try:
+            reply = await asyncio.wrap_future(draft.future)
+        except Exception as e:
+            logger.warning("speculative draft of %s failed: %s", recipient.name, e)
+            return False, None
+        return self._commit(recipient, draft, requested, reply)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage (agent name) counters: drafts started, committed, discarded and wall-clock seconds saved."""
+        with self._lock:
+            return {stage: dict(counts) for stage, counts in self._stats.items()}
+
+    def close(self):
+        with self._lock:
+            self._drafts.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,326 @@
+"""
+Streams the stage agents' replies and runs each proposed command in the session shell as soon as its object
+in the partial JSON is complete.
+"""
+import contextvars
+import json
+import logging
+import queue
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from autogen.oai.client import OpenAIClient, OpenAIWrapper
+from openai import OpenAI
+from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+from openai.types.completion_usage import CompletionUsage
+
+from CustomCodeExecutor import PersistentShellExecutor
+from ExecutionLedger import ExecutionLedger
+from structured_output import ExecutionResult
+
+logger = logging.getLogger(__name__)
+
+STATUS_INTERVAL = 0.1       # seconds between progress view updates while tokens arrive
+_COMMANDS_ARRAY = re.compile(r'"commands"\s*:\s*\[')
+
+
+class CommandStream:
+    """Incremental scanner returning the commands of a streamed CommandResponse as their objects complete."""
+
+    def __init__(self):
+        self.text = ""
+        self._pos: Optional[int] = None     # next character of the commands array to scan (None: not reached yet)
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._start = 0
+
+    def feed(self, delta: str) -> List[str]:
+        """Add streamed text; returns the commands it completed."""
+        self.text += delta
+        if self._done:
+            return []
+        if self._pos is None:
+            if self.text.strip() and not self.text.lstrip().startswith("{"):
+                self._done = True       # free-text answer: its code blocks are run once it is complete
+                return []
+            match = _COMMANDS_ARRAY.search(self.text)
+            if match is None:
+                return []
+            self._pos = match.end()
+        commands, text = [], self.text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    command = self._command(text[self._start:i + 1])
+                    if command is None:
+                        self._done = True       # keep the order: nothing after an unreadable command runs early
+                        break
+                    commands.append(command)
+            elif char == "]" and self._depth == 0:
+                self._done = True
+                break
+        self._pos = len(text)
+        return commands
+
+    @staticmethod
+    def _command(item: str) -> Optional[str]:
+        try:
+            command = json.loads(item).get("command")
+        except (ValueError, AttributeError):
+            return None
+        return command if isinstance(command, str) and command.strip() else None
+
+
+class StreamedReply:
+    """One streamed completion of a stage agent; its commands are executed as they complete if an executor is given."""
+
+    def __init__(self, monitor: "StreamMonitor", stage: str, executor: Optional[PersistentShellExecutor]):
+        self.monitor = monitor
+        self.stage = stage
+        self.executor = executor
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.tokens = 0
+        self.commands = CommandStream()
+        self.executed: List[str] = []       # commands handed to the executor, in order
+        self.running: Optional[str] = None
+        self.result: Optional[ExecutionResult] = None
+        self.first_command: Optional[float] = None
+        self.executed_until: Optional[float] = None
+        self._idle = 0.0        # time the executor waited for the next command to be generated
+        self._aborted = False
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def feed(self, delta: str):
+        self.tokens += 1
+        for command in self.commands.feed(delta):
+            if self.executor is None:
+                continue
+            self.executed.append(command)
+            self._queue.put(command)
+            if self._thread is None:
+                # in the caller's context, so the commands are traced below the span of the agent's turn
+                self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._execute,),
+                                                name=f"early_{self.stage}", daemon=True)
+                self._thread.start()
+        self.monitor._show(self)
+
+    def end(self, ok: bool):
+        """The completion is complete (ok) or failed, in which case its commands that did not start yet are dropped."""
+        self.finished = time.perf_counter()
+        if ok:
+            self._queue.put(None)
+        else:
+            self.abort()
+        self.monitor._finished(self)
+
+    def abort(self):
+        """Run no further commands (the ones running finish)."""
+        self._aborted = True
+        self._queue.put(None)
+
+    def _commands(self) -> Iterator[str]:
+        while True:
+            waiting = time.perf_counter()
+            command = self._queue.get()
+            if self.first_command is not None:
+                self._idle += time.perf_counter() - waiting
+            if command is None or self._aborted:
+                return
+            if self.first_command is None:
+                self.first_command = time.perf_counter()
+            self.running = command
+            yield command
+
+    def _execute(self):
+        try:
+            self.result = self.executor.execute_stream(self._commands(), stage=self.stage)
+        except Exception as e:
+            logger.warning("early execution of the %s commands failed: %s", self.stage, e)
+        finally:
+            self.running = None
+            self.executed_until = time.perf_counter()
+
+    def wait(self) -> Optional[ExecutionResult]:
+        if self._thread is not None:
+            self._thread.join()
+        return self.result
+
+    @property
+    def overlap(self) -> float:
+        """Seconds of command execution that ran while the completion was still being generated."""
+        if self.first_command is None or self.finished is None or self.executed_until is None:
+            return 0.0
+        return max(0.0, min(self.finished, self.executed_until) - self.first_command - self._idle)
+
+
+class StreamMonitor:
+    """
+    Streamed replies of a session's stage agents: progress display, early command execution and statistics.
+
+    :param executor: shell the commands run in while their reply is generated (None: streaming to the display only).
+    :param ledger: with incremental re-execution, a stage that has succeeded commands in the ledger is not run early.
+    :param on_status: called with (stage, status) as tokens arrive, and with (stage, None) when the reply is complete.
+    """
+
+    def __init__(self, executor: Optional[PersistentShellExecutor] = None, ledger: Optional[ExecutionLedger] = None,
+                 on_status: Optional[Callable[[str, Optional[str]], None]] = None):
+        self.executor = executor
+        self.ledger = ledger
+        self.on_status = on_status
+        self.active_stage: Optional[str] = None     # the stage whose reply is requested now (not a draft)
+        self._replies: Dict[str, StreamedReply] = {}
+        self._shown: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"replies": 0, "tokens": 0, "generation_s": 0.0, "early_replies": 0, "early_commands": 0,
+                     "first_command_s": 0.0, "overlap_s": 0.0}
+        )
+
+    def begin(self, stage: str) -> StreamedReply:
+        """Start a streamed reply of stage; a reply of the stage that was not collected is dropped."""
+        executor = self.executor
+        if stage != self.active_stage or (self.ledger is not None and self.ledger.entries(stage)):
+            executor = None
+        reply = StreamedReply(self, stage, executor)
+        with self._lock:
+            previous = self._replies.pop(stage, None)
+            if executor is not None:
+                self._replies[stage] = reply
+        if previous is not None:
+            # e.g. the model failed mid-stream and autogen falls back to the next one: let its running command end
+            previous.abort()
+            previous.wait()
+        return reply
+
+    def _show(self, reply: StreamedReply):
+        if self.on_status is None or reply.stage != self.active_stage:
+            return
+        now = time.perf_counter()
+        if now - self._shown.get(reply.stage, 0.0) < STATUS_INTERVAL:
+            return
+        self._shown[reply.stage] = now
+        status = f"{reply.tokens} tokens"
+        if reply.running is not None:
+            status += f" · running `{reply.running.splitlines()[0][:60]}`"
+        self.on_status(reply.stage, status)
+
+    def _finished(self, reply: StreamedReply):
+        with self._lock:
+            stats = self._stats[reply.stage]
+            stats["replies"] += 1
+            stats["tokens"] += reply.tokens
+            stats["generation_s"] += reply.finished - reply.started
+        if self.on_status is not None and reply.stage == self.active_stage:
+            self.on_status(reply.stage, None)
+
+    def collect(self, stage: str, commands: List[str]) -> Optional[ExecutionResult]:
+        """
+        Wait for the early execution of stage's latest reply and return its result, or None if nothing was run
+        early or what was run is not exactly commands (the reply's final command list).
+        """
+        with self._lock:
+            reply = self._replies.pop(stage, None)
+        if reply is None or not reply.executed:
+            return None
+        result = reply.wait()
+        with self._lock:
+            stats = self._stats[stage]
+            stats["early_replies"] += 1
+            stats["early_commands"] += len(reply.executed)
+            stats["first_command_s"] += (reply.first_command or reply.started) - reply.started
+            stats["overlap_s"] += reply.overlap
+        if result is None or reply.executed != list(commands):
+            logger.warning("the %s commands run early do not match its proposal; running the proposal", stage)
+            return None
+        return result
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Per-stage counters: streamed replies, tokens and generation seconds, and of the replies whose commands ran
+        early, their number and commands, summed seconds to the first command and summed overlap.
+        """
+        with self._lock:
+            return {stage: dict(counts) for stage, counts in self._stats.items()}
+
+    def close(self):
+        """Stop the early executions that were not collected (the run ended)."""
+        with self._lock:
+            replies, self._replies = list(self._replies.values()), {}
+        for reply in replies:
+            reply.abort()
+            reply.wait()
+
+
+class StreamingOpenAIClient(OpenAIClient):
+    """autogen model client that streams a stage agent's chat completions through a StreamMonitor."""
+
+    def __init__(self, config: Dict[str, Any], monitor: StreamMonitor, stage: str, **kwargs):
+        openai_config = {k: v for k, v in config.items() if k in OpenAIWrapper.openai_kwargs}
+        super().__init__(OpenAI(**openai_config))
+        self._monitor = monitor
+        self._stage = stage
+
+    def create(self, params: Dict[str, Any]):
+        params = {k: v for k, v in params.items() if k != "model_client_cls"}
+        # the stage agents have no tools; anything else is left to OpenAIClient, unstreamed
+        if "messages" not in params or params.get("n", 1) != 1 or params.get("tools") or params.get("functions"):
+            return super().create({**params, "stream": False})
+        reply = self._monitor.begin(self._stage)
+        try:
+            response = self._stream(params, reply)
+        except BaseException:
+            reply.end(False)
+            raise
+        reply.end(True)
+        return response
+
+    def _stream(self, params: Dict[str, Any], reply: StreamedReply) -> ChatCompletion:
+        stream = self._oai_client.chat.completions.create(
+            **{**params, "stream": True, "stream_options": {"include_usage": True}}
+        )
+        parts, finish_reason, usage, last = [], None, None, None
+        for chunk in stream:
+            last = chunk
+            if chunk.usage is not None:
+                usage = chunk.usage
+            for choice in chunk.choices:
+                if choice.delta.content:
+                    parts.append(choice.delta.content)
+                    reply.feed(choice.delta.content)
+                finish_reason = choice.finish_reason or finish_reason
+        if last is None:
+            raise RuntimeError(f"empty completion stream for {self._stage}")
+        if usage is None:
+            usage = CompletionUsage(prompt_tokens=0, completion_tokens=reply.tokens, total_tokens=reply.tokens)
+        return ChatCompletion(
+            id=last.id,
+            model=last.model,
+            created=last.created,
+            object="chat.completion",
+            choices=[Choice(index=0, finish_reason=finish_reason or "stop", logprobs=None,
+                            message=ChatCompletionMessage(role="assistant", content="".join(parts)))],
+            usage=usage,
+        )
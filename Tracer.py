@@ -0,0 +1,261 @@
+"""
+Offline tracing of a run as nested spans (run > stage > round > llm / execute > exec), one JSONL file per run
+in the trace directory.
+"""
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from autogen import Agent, runtime_logging
+from autogen.logger.base_logger import BaseLogger
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRACE_DIR = os.path.join(".cache", "traces")
+MAX_ATTR_CHARS = 300
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_agent_tracers: "weakref.WeakKeyDictionary[Agent, Tracer]" = weakref.WeakKeyDictionary()
+_install_lock = threading.Lock()
+
+
+def _clip(value: Any) -> Any:
+    if isinstance(value, str) and len(value) > MAX_ATTR_CHARS:
+        return value[:MAX_ATTR_CHARS] + "..."
+    return value
+
+
+class Span:
+    """A timed operation; ended spans are written by their tracer."""
+
+    def __init__(self, tracer: "Tracer", name: str, kind: str, parent: Optional["Span"], start: Optional[float] = None,
+                 **attrs):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start = time.time() if start is None else start
+        self.end_time: Optional[float] = None
+        self.status = "ok"
+        self.attrs = {key: _clip(value) for key, value in attrs.items()}
+
+    @property
+    def open(self) -> bool:
+        return self.end_time is None
+
+    def set(self, **attrs):
+        self.attrs.update({key: _clip(value) for key, value in attrs.items()})
+
+    def end(self, status: Optional[str] = None, end: Optional[float] = None, **attrs):
+        if not self.open:
+            return
+        self.set(**attrs)
+        if status is not None:
+            self.status = status
+        self.end_time = time.time() if end is None else end
+        self.tracer._write(self)
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.tracer.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": round(self.start, 6),
+            "end": round(self.end_time, 6),
+            "duration": round(self.end_time - self.start, 6),
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+
+
+class Tracer:
+    """
+    Span factory and JSONL writer of one run.
+
+    :param directory: where the trace files live (None: spans are created but not written).
+    :param trace_id: the run id; the file is <directory>/<trace_id>.jsonl.
+    """
+
+    def __init__(self, directory: Optional[str], trace_id: str):
+        self.trace_id = trace_id
+        self.path = os.path.join(directory, f"{trace_id}.jsonl") if directory else None
+        self.scope: List[Span] = []         # open run/stage/round spans, innermost last
+        self._file = None
+        self._lock = threading.Lock()
+        if self.path is not None:
+            install_trace_logger()
+
+    # spans ----------------------------------------------------------------------------------
+
+    def _parent(self) -> Optional[Span]:
+        current = _current_span.get()
+        if current is not None and current.tracer is self and current.open:
+            return current
+        return next((span for span in reversed(self.scope) if span.open), None)
+
+    def start(self, name: str, kind: str, **attrs) -> Span:
+        """Start a span below the current one; end it with span.end()."""
+        return Span(self, name, kind, self._parent(), **attrs)
+
+    def enter(self, name: str, kind: str, **attrs) -> Span:
+        """
+        Start a span that stays current until it is ended, for spans that do not fit a with block (a stage starts
+        and ends in different speaker selections). The spans below it end first.
+        """
+        span = self.start(name, kind, **attrs)
+        self.scope.append(span)
+        _current_span.set(span)
+        return span
+
+    def exit(self, span: Optional[Span], status: Optional[str] = None, **attrs):
+        """End an entered span (and any span entered below it that is still open)."""
+        if span is None or span not in self.scope:
+            return
+        index = self.scope.index(span)
+        for inner in reversed(self.scope[index:]):
+            inner.end(status if inner is span else None, **(attrs if inner is span else {}))
+        del self.scope[index:]
+        _current_span.set(self.scope[-1] if self.scope else None)
+
+    @contextmanager
+    def span(self, name: str, kind: str, **attrs) -> Iterator[Span]:
+        span = self.start(name, kind, **attrs)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.end("error", error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def bind(self, *agents: Agent):
+        """Attribute the completions of agents to this tracer when they run outside the chat's context."""
+        for agent in agents:
+            _agent_tracers[agent] = self
+
+    # output ---------------------------------------------------------------------------------
+
+    def _write(self, span: Span):
+        if self.path is None:
+            return
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            try:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(line + "\n")
+                self._file.flush()
+            except OSError as e:
+                logger.warning("could not write trace span to %s: %s", self.path, e)
+
+    def close(self):
+        """End the spans that are still open (the run was interrupted) and close the file."""
+        if self.scope:
+            self.exit(self.scope[0], "error")
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def record_span(name: str, kind: str, duration: float, start: Optional[float] = None, status: str = "ok", **attrs):
+    """Record a finished span of `duration` seconds (ending now unless start is given) below the current span."""
+    parent = _current_span.get()
+    if parent is None:
+        return
+    end = time.time() if start is None else start + duration
+    span = Span(parent.tracer, name, kind, parent, start=end - duration, **attrs)
+    span.end(status, end=end)
+
+
+class TraceLogger(BaseLogger):
+    """autogen runtime logger recording every chat completion (cached or not) as an llm span."""
+
+    def __init__(self, previous: Optional[BaseLogger] = None):
+        self.previous = previous
+
+    def start(self) -> str:
+        return uuid.uuid4().hex        # a previous logger was started when it was installed
+
+    def log_chat_completion(self, invocation_id, client_id, wrapper_id, source: Union[str, Agent], request: Dict,
+                            response, is_cached: int, cost: float, start_time: str) -> None:
+        if self.previous is not None:
+            self.previous.log_chat_completion(invocation_id, client_id, wrapper_id, source, request, response,
+                                              is_cached, cost, start_time)
+        parent = _current_span.get()
+        tracer = parent.tracer if parent is not None else _agent_tracers.get(source) if isinstance(source, Agent) else None
+        if tracer is None:
+            return
+        end = time.time()
+        try:
+            start = datetime.datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S.%f").replace(
+                tzinfo=datetime.timezone.utc).timestamp()
+        except (TypeError, ValueError):
+            start = end
+        usage = getattr(response, "usage", None)
+        attrs = {
+            "agent": source.name if isinstance(source, Agent) else str(source),
+            "model": getattr(response, "model", None) or request.get("model"),
+            "tokens_in": getattr(usage, "prompt_tokens", 0) or 0,
+            "tokens_out": getattr(usage, "completion_tokens", 0) or 0,
+            "cached": bool(is_cached),
+            "cost": cost or 0.0,
+        }
+        if isinstance(response, str):      # autogen logs failed requests with the error as the response
+            attrs["error"] = response
+        span = Span(tracer, "llm", "llm", parent if parent is not None else tracer._parent(), start=start, **attrs)
+        span.end("error" if isinstance(response, str) else "ok", end=end)
+
+    def log_new_agent(self, agent, init_args: Dict[str, Any]) -> None:
+        if self.previous is not None:
+            self.previous.log_new_agent(agent, init_args)
+
+    def log_event(self, source, name: str, **kwargs: Dict[str, Any]) -> None:
+        if self.previous is not None:
+            self.previous.log_event(source, name, **kwargs)
+
+    def log_new_wrapper(self, wrapper, init_args) -> None:
+        if self.previous is not None:
+            self.previous.log_new_wrapper(wrapper, init_args)
+
+    def log_new_client(self, client, wrapper, init_args: Dict[str, Any]) -> None:
+        if self.previous is not None:
+            self.previous.log_new_client(client, wrapper, init_args)
+
+    def log_function_use(self, source, function, args: Dict[str, Any], returns: Any) -> None:
+        if self.previous is not None:
+            self.previous.log_function_use(source, function, args, returns)
+
+    def stop(self) -> None:
+        if self.previous is not None:
+            self.previous.stop()
+
+    def get_connection(self):
+        return self.previous.get_connection() if self.previous is not None else None
+
+
+def install_trace_logger():
+    """Route autogen's runtime logging through a TraceLogger (once per process)."""
+    with _install_lock:
+        if isinstance(runtime_logging.autogen_logger, TraceLogger) and runtime_logging.logging_enabled():
+            return
+        previous = runtime_logging.autogen_logger if runtime_logging.logging_enabled() else None
+        runtime_logging.start(logger=TraceLogger(previous))
@@ -0,0 +1,285 @@
+"""
+Append-only SQLite store of the runs' group chat transcripts (runs, stages, messages, content-addressed
+contents, executions), written in batches by a background thread.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ArtifactCache import canonical_spec, is_dependency_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRANSCRIPT_DB = os.path.join(".cache", "transcripts.db")
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 0.5        # seconds a queued row waits at most before it is committed
+MAX_STACK_PARTS = 6
+KNOWN_HASHES = 4096         # content hashes the writer remembers; older ones are looked up by SQLite again
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    project_name TEXT,
+    env_type TEXT,
+    stack TEXT,
+    spec_hash TEXT,
+    started REAL,
+    ended REAL,
+    finished INTEGER,
+    artifact_cache TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE TABLE IF NOT EXISTS stages (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    attempt INTEGER NOT NULL,
+    started REAL,
+    ended REAL,
+    exit_code INTEGER,
+    succeeded INTEGER NOT NULL,
+    replayed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS stages_run ON stages (run_id, stage);
+CREATE TABLE IF NOT EXISTS contents (
+    hash TEXT PRIMARY KEY,
+    content TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    stage TEXT,
+    attempt INTEGER,
+    name TEXT,
+    role TEXT,
+    content_hash TEXT,
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS messages_run ON messages (run_id, seq);
+CREATE TABLE IF NOT EXISTS executions (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    stage TEXT,
+    attempt INTEGER,
+    command TEXT,
+    exit_code INTEGER,
+    duration REAL,
+    reused INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS executions_run ON executions (run_id, stage);
+"""
+
+_stores: Dict[str, "TranscriptStore"] = {}
+_stores_lock = threading.Lock()
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def stack_of(description: Optional[str]) -> Optional[str]:
+    """`python+flask+sqlalchemy`: the languages, then the dependency names of an extracted spec."""
+    spec = canonical_spec(description)
+    if not spec:
+        return None
+    languages, dependencies = [], []
+    for key, value in spec.items():
+        values = value if isinstance(value, list) else [value]
+        if "language" in key:
+            languages += [str(v) for v in values if isinstance(v, str)]
+        elif is_dependency_key(key):
+            # names without versions or extras: `flask>=3.0` and `flask` are the same stack
+            dependencies += [re.split(r"[<>=!~^@\[\s]", v, maxsplit=1)[0] for v in values if isinstance(v, str)]
+    parts = list(dict.fromkeys(p for p in languages + sorted(dependencies) if p and p != "none"))
+    return "+".join(parts[:MAX_STACK_PARTS]) or None
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class TranscriptStore:
+    """
+    Transcript database of one file, written by a background thread (use TranscriptStore.open to share it between
+    the sessions of a process).
+    """
+
+    def __init__(self, path: str = DEFAULT_TRANSCRIPT_DB, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL, known_hashes: int = KNOWN_HASHES):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0                     # rows committed
+        self.deduplicated = 0                # message contents that were stored already
+        self._queue: "queue.Queue[Optional[Tuple]]" = queue.Queue()
+        # recent contents this process committed, not offered to SQLite again (LRU, used by the writer thread only)
+        self._known_hashes: "OrderedDict[str, None]" = OrderedDict()
+        self._max_known_hashes = known_hashes
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(_connect(path)) as connection:
+            connection.executescript(SCHEMA)
+        self._writer = threading.Thread(target=self._write_loop, name="transcript_writer", daemon=True)
+        self._writer.start()
+
+    @classmethod
+    def open(cls, path: str = DEFAULT_TRANSCRIPT_DB) -> "TranscriptStore":
+        """The process' store of `path`, created on first use and flushed at exit."""
+        key = os.path.abspath(path)
+        with _stores_lock:
+            if key not in _stores:
+                _stores[key] = cls(path)
+                atexit.register(_stores[key].close)
+            return _stores[key]
+
+    # recording (called from the chat, only queues the rows) ---------------------------------
+
+    def start_run(self, run_id: str, project_name: str, env_type: str, description: Optional[str]):
+        # a resumed run keeps the row of the run it continues
+        self._queue.put(("run", (run_id, project_name, env_type, stack_of(description),
+                                 content_hash(description) if description else None, time.time()), description))
+
+    def end_run(self, run_id: str, finished: bool, artifact_cache: Optional[str] = None):
+        self._queue.put(("end", (time.time(), int(finished), artifact_cache, run_id), None))
+
+    def add_message(self, run_id: str, seq: int, stage: Optional[str], attempt: Optional[int], message: Dict):
+        content = message.get("content")
+        content = content if isinstance(content, str) or content is None else str(content)
+        self._queue.put(("message", (run_id, seq, stage, attempt, message.get("name"), message.get("role"),
+                                     time.time()), content))
+
+    def add_stage(self, run_id: str, stage: str, attempt: int, started: Optional[float], succeeded: bool,
+                  exit_code: Optional[int] = None, replayed: bool = False):
+        self._queue.put(("stage", (run_id, stage, attempt, started, time.time(), exit_code, int(succeeded),
+                                   int(replayed)), None))
+
+    def add_executions(self, run_id: str, stage: Optional[str], attempt: Optional[int], outcomes: List):
+        """outcomes: the CommandOutcome list of an ExecutionResult."""
+        now = time.time()
+        for outcome in outcomes:
+            self._queue.put(("execution", (run_id, stage, attempt, outcome.command, outcome.exit_code,
+                                           outcome.duration, int(outcome.reused), int(outcome.skipped), now), None))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far is committed. Returns False on timeout."""
+        done = threading.Event()
+        self._queue.put(("flush", done, None))
+        return done.wait(timeout)
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=10)
+
+    # writing (background thread) ------------------------------------------------------------
+
+    def _write_loop(self):
+        connection = _connect(self.path)
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None and batch[-1][0] != "flush" and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            rows = [item for item in batch if item is not None and item[0] != "flush"]
+            if rows:
+                try:
+                    with connection:
+                        self._write(connection, rows)
+                    self.written += len(rows)
+                except sqlite3.Error as e:
+                    logger.warning("could not write %d transcript rows to %s: %s", len(rows), self.path, e)
+            for item in batch:
+                if item is not None and item[0] == "flush":
+                    item[1].set()
+        connection.close()
+
+    def _store_content(self, connection: sqlite3.Connection, content: Optional[str]) -> Optional[str]:
+        if content is None:
+            return None
+        digest = content_hash(content)
+        if digest in self._known_hashes:
+            self._known_hashes.move_to_end(digest)
+            self.deduplicated += 1
+            return digest
+        if connection.execute("INSERT OR IGNORE INTO contents (hash, content) VALUES (?, ?)",
+                              (digest, content)).rowcount == 0:
+            self.deduplicated += 1          # stored by an earlier process (or forgotten here since)
+        self._known_hashes[digest] = None
+        if len(self._known_hashes) > self._max_known_hashes:
+            self._known_hashes.popitem(last=False)
+        return digest
+
+    def _write(self, connection: sqlite3.Connection, rows: List[Tuple]):
+        executions, stages = [], []
+        for kind, values, content in rows:
+            if kind == "message":
+                digest = self._store_content(connection, content)
+                connection.execute("INSERT INTO messages (run_id, seq, stage, attempt, name, role, created, content_hash)"
+                                   " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", values + (digest,))
+            elif kind == "execution":
+                executions.append(values)
+            elif kind == "stage":
+                stages.append(values)
+            elif kind == "run":
+                self._store_content(connection, content)
+                connection.execute("INSERT OR IGNORE INTO runs (run_id, project_name, env_type, stack, spec_hash, started)"
+                                   " VALUES (?, ?, ?, ?, ?, ?)", values)
+            elif kind == "end":
+                connection.execute("UPDATE runs SET ended = ?, finished = ?, artifact_cache = ? WHERE run_id = ?", values)
+        connection.executemany("INSERT INTO executions (run_id, stage, attempt, command, exit_code, duration, reused,"
+                               " skipped, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", executions)
+        connection.executemany("INSERT INTO stages (run_id, stage, attempt, started, ended, exit_code, succeeded,"
+                               " replayed) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", stages)
+
+    # queries --------------------------------------------------------------------------------
+
+    def _read(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(f"file:{os.path.abspath(self.path)}?mode=ro", uri=True, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def retry_counts(self, since: float, until: Optional[float] = None, env_type: Optional[str] = None) -> List[Dict]:
+        """
+        Per stack and stage, over the runs started in [since, until): runs that reached the stage, attempts,
+        retries (attempts after the first) and the share of runs that completed it. Replayed stages are left out.
+        """
+        query = """
+            SELECT r.stack AS stack, s.stage AS stage, COUNT(DISTINCT s.run_id) AS runs, COUNT(*) AS attempts,
+                   COUNT(*) - COUNT(DISTINCT s.run_id) AS retries,
+                   COUNT(DISTINCT CASE WHEN s.succeeded THEN s.run_id END) AS completed
+            FROM stages s JOIN runs r ON r.run_id = s.run_id
+            WHERE r.started >= ? AND r.started < ? AND NOT s.replayed {env}
+            GROUP BY r.stack, s.stage
+            ORDER BY retries DESC, runs DESC
+        """.format(env="AND r.env_type = ?" if env_type else "")
+        params = [since, until if until is not None else float("inf")] + ([env_type] if env_type else [])
+        with closing(self._read()) as connection:
+            return [dict(row) for row in connection.execute(query, params)]
+
+    def transcript(self, run_id: str) -> Iterator[Dict]:
+        """The messages of a run in order, streamed from the database."""
+        with closing(self._read()) as connection:
+            rows = connection.execute(
+                "SELECT m.seq, m.stage, m.attempt, m.name, m.role, m.created, c.content FROM messages m"
+                " LEFT JOIN contents c ON c.hash = m.content_hash WHERE m.run_id = ? ORDER BY m.seq", (run_id,))
+            for row in rows:
+                yield dict(row)
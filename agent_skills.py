@@ -1,11 +1,27 @@
-from typing import Annotated,Tuple
+from typing import Annotated,List,Optional,Tuple
 from rich.prompt import Prompt
 from rich.console import Console
 from pathlib import Path
-import docker
-from docker.errors import BuildError, APIError
+from collections import deque
+from contextvars import ContextVar, Token
+import json
 import os
+import shutil
 import subprocess
+import threading
+import time
+
+from BuildContext import BuildContext,merge_dockerignore,prepare_build_context
+from ContainerPool import get_container_pool
+from Tracer import record_span
+
+COMPOSE_TIMEOUT = 300           # seconds run_docker_compose_up waits for the stack to become ready
+COMPOSE_LOG_LINES = 200         # log lines kept for the agent
+COMPOSE_POLL_INTERVAL = 2
+COMPOSE_SETTLE_SECONDS = 5      # a service without healthcheck counts as ready after running this long
+DOCKER_POOL_SIZE = 10           # HTTP connections each pooled Docker client keeps to the daemon
+DOCKER_PHASES = ("context", "build", "start", "exec", "teardown")
+TEST_COMMAND_LABEL = "code-catalyst.test"     # image label with the command that runs the generated tests
 
 
 def ask_human(question: Annotated[str, "The question you want to ask the user about the missing info."]) -> Annotated[str, "Answer"]:
@@ -25,6 +41,15 @@ def ask_human(question: Annotated[str, "The question you want to ask the user ab
     # answer = ask_human("Do you have any port-configuration to be made?")
     # print(f"The expert answered: {answer}")
 
+def ask_human_headless(question: Annotated[str, "The question you want to ask the user about the missing info."]) -> Annotated[str, "Answer"]:
+    """
+    Non-interactive stand-in for ask_human used in batch mode, where no user is attached to the terminal.
+
+    :param question: The question the agent wanted to ask.
+    :return: An instruction to continue with sensible defaults.
+    """
+    return "The user is not available. Choose sensible, widely used defaults for the missing information and state them explicitly."
+
 def write_to_file(filename: Annotated[str,"The filename in which you have to store the file with extension if any"], content: Annotated[str,"Content to be written to the file."]) -> Annotated[str,"Console data"]:
     """
     Function to write content to a file and save it on the machine.
@@ -55,101 +80,377 @@ def write_to_file(filename: Annotated[str,"The filename in which you have to sto
 
 # todo - if working_dir of agent changes change here also
 def run_docker_compose_up(
-        project_dir:Annotated[str,"relative path to the project directory starting with './project_code' and ending with / eg: (./project_code/project_name/) "]
+        project_dir:Annotated[str,"relative path to the project directory starting with './project_code' and ending with / eg: (./project_code/project_name/) "],
+        timeout:Annotated[int,"seconds to wait for the services to become healthy/ready"]=COMPOSE_TIMEOUT,
     ) -> Annotated[Tuple[str, int],"returns the error if any and the error code"]:
     """
     Run Docker Compose to build and start services.
 
+    The stack is started detached (`up -d`) and its logs are followed into a fixed-size ring buffer while the
+    service states are polled. The call returns as soon as every service is healthy (or running, for services
+    without a healthcheck) and leaves the stack running; a failing service or the deadline tears it down again.
+
     Args:
         project_dir (str): The directory containing the Docker Compose project.
+        timeout (int): Seconds to wait for the services to become ready.
 
     Returns:
-        Tuple[str, int]: A tuple containing the output or error message and the error code.
+        Tuple[str, int]: A tuple containing a bounded log excerpt (or error message) and the error code.
     """
+    if not os.path.isdir(project_dir):
+        return f"Error: project directory '{project_dir}' not found", 1
+
+    compose = _compose_command()
+    if compose is None:
+        return "Error: neither 'docker compose' nor 'docker-compose' is available", 127
+
+    console = Console()
+    logs = LogRingBuffer()
+    deadline = time.monotonic() + timeout
+    merge_dockerignore(project_dir)     # keep venv/, node_modules/, .git out of the build contexts
+
+    console.print(f"[bold green]Starting the services in '{project_dir}'...[/bold green]")
+    up = subprocess.Popen(compose + ["up", "-d", "--build"], cwd=project_dir, stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT, text=True, errors="replace")
+    pump = _follow(up, logs)
     try:
-        os.chdir(project_dir)
-    except FileNotFoundError as fnf_error:
-        return str(fnf_error), 1  # Directory not found error
+        exit_code = up.wait(timeout=max(0.0, deadline - time.monotonic()))
+    except subprocess.TimeoutExpired:
+        up.kill()
+        up.wait()
+        _compose_down(compose, project_dir)
+        return logs.excerpt(f"Error: 'up' did not finish within {timeout}s"), 124
+    pump.join()
+    if exit_code != 0:
+        return logs.excerpt(f"Error: 'up' failed with exit code {exit_code}"), exit_code
 
-    commands = ["docker compose up", "docker-compose up"]
-    
-    for command in commands:
+    follower = subprocess.Popen(compose + ["logs", "--follow", "--no-color"], cwd=project_dir,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace")
+    _follow(follower, logs)
+    try:
+        ready, problem = _wait_until_ready(compose, project_dir, deadline)
+    finally:
+        follower.terminate()
+        follower.wait()
+
+    if ready:
+        console.print("[bold green]All services are up.[/bold green]")
+        return logs.excerpt("All services are up and running (stack left running in the background).") + "\nTERMINATE", 0
+
+    console.print(f"[bold red]{problem}[/bold red]")
+    _compose_down(compose, project_dir)
+    return logs.excerpt(f"Error: {problem}"), 124 if problem.startswith("timed out") else 1
+
+
+class LogRingBuffer:
+    """Keeps only the last max_lines lines (each cut to max_line_length) of a log stream, counting what was dropped."""
+
+    def __init__(self, max_lines: int = COMPOSE_LOG_LINES, max_line_length: int = 500):
+        self.lines = deque(maxlen=max_lines)
+        self.max_line_length = max_line_length
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def append(self, line: str):
+        line = line.rstrip("\n")
+        if len(line) > self.max_line_length:
+            line = line[:self.max_line_length] + " [...]"
+        with self._lock:
+            self.lines.append(line)
+            self.total += 1
+
+    def excerpt(self, headline: str) -> str:
+        with self._lock:
+            dropped = self.total - len(self.lines)
+            body = list(self.lines)
+        if dropped:
+            body.insert(0, f"[... {dropped} earlier log lines omitted ...]")
+        return "\n".join([headline, *body])
+
+
+def _compose_command() -> Optional[List[str]]:
+    if shutil.which("docker") and subprocess.run(["docker", "compose", "version"], stdout=subprocess.DEVNULL,
+                                                 stderr=subprocess.DEVNULL).returncode == 0:
+        return ["docker", "compose"]
+    if shutil.which("docker-compose"):
+        return ["docker-compose"]
+    return None
+
+
+def _follow(process: subprocess.Popen, logs: LogRingBuffer) -> threading.Thread:
+    def pump():
+        for line in process.stdout:
+            logs.append(line)
+    thread = threading.Thread(target=pump, daemon=True)
+    thread.start()
+    return thread
+
+
+def _compose_down(compose: List[str], project_dir: str):
+    subprocess.run(compose + ["down"], cwd=project_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _service_states(compose: List[str], project_dir: str) -> List[dict]:
+    result = subprocess.run(compose + ["ps", "--all", "--format", "json"], cwd=project_dir,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    text = result.stdout.strip()
+    if not text:
+        return []
+    # older compose versions print one JSON array, newer ones one JSON object per line
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _wait_until_ready(compose: List[str], project_dir: str, deadline: float) -> Tuple[bool, str]:
+    """Poll the service states until all are ready, one fails, or the deadline passes."""
+    running_since = {}
+    while time.monotonic() < deadline:
         try:
-            result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            return result.stdout.decode('utf-8')+"\nTERMINATE", 0  # Success
-        except subprocess.CalledProcessError as e:
-            stderr_output = e.stderr.decode('utf-8')
-            if "command not found" in stderr_output:
-                continue  # Try the next command
+            services = _service_states(compose, project_dir)
+        except ValueError:
+            services = []
+        now = time.monotonic()
+        ready = bool(services)
+        for service in services:
+            name = service.get("Service") or service.get("Name", "?")
+            state, health = service.get("State", ""), service.get("Health", "")
+            if health == "unhealthy":
+                return False, f"service '{name}' is unhealthy"
+            if state == "exited":
+                if service.get("ExitCode", 0) != 0:
+                    return False, f"service '{name}' exited with code {service.get('ExitCode')}"
+                continue        # one-shot service (e.g. migrations) that finished cleanly
+            if state != "running":
+                ready = False
+                continue
+            running_since.setdefault(name, now)
+            if health:
+                ready = ready and health == "healthy"
             else:
-                return stderr_output, e.returncode  # Return error message and error code
+                # no healthcheck: ready once the service stayed up for a moment
+                ready = ready and now - running_since[name] >= COMPOSE_SETTLE_SECONDS
+        if ready:
+            return True, ""
+        time.sleep(COMPOSE_POLL_INTERVAL)
+    return False, "timed out waiting for the services to become healthy"
 
-    return "Error: Both 'docker compose up' and 'docker-compose up' failed", 1
-    
 
-def build_and_test_docker_image(
-        project_dir:Annotated[str,"path to the project directory"],
-        image_name:Annotated[str,"name of the Docker image to build"],
-        container_name:Annotated[str,"name of the Docker container to run"],
-        host_port:Annotated[str,"host port to map to the container port"],
-        container_port:Annotated[str,"container port to map to the host port"],
-        command:Annotated[str," full command to be executed which runs the test files generated"]
-    )-> Annotated[str,"Output"]:
+_docker_clients = {}
+_docker_clients_lock = threading.Lock()
+_docker_available = {}
+
+# per-phase timings of the image test runs (run_image_tests) of the current session (collect_docker_timings);
+# a context variable, like the tracer's current span, so concurrent sessions of a process keep theirs apart
+_docker_timings: ContextVar[Optional[List[dict]]] = ContextVar("docker_timings", default=None)
+
+
+def collect_docker_timings(timings: List[dict]) -> Token:
     """
-    Function to build image and run tests inside the container.
+    Append the timings of the image test runs made in this context (and the tasks and threads it starts) to
+    `timings` until stop_collecting_docker_timings(token). Runs outside of it are not recorded.
+    """
+    return _docker_timings.set(timings)
 
-    :param project_dir
-    :param image_name
-    :param container_name
-    :param host_port 
-    :param container_port
-    :param command
-    :return output
+
+def stop_collecting_docker_timings(token: Token):
+    _docker_timings.reset(token)
+
+
+def get_docker_client():
+    """
+    Process-wide Docker client, one per daemon (DOCKER_HOST). Clients are thread safe and keep a pool of
+    HTTP connections to the daemon, so every tool call and session in the process shares them.
+    """
+    import docker  # deferred: the docker SDK is only needed once a build is requested
+
+    host = os.environ.get("DOCKER_HOST", "")
+    with _docker_clients_lock:
+        client = _docker_clients.get(host)
+        if client is None:
+            client = docker.from_env(max_pool_size=DOCKER_POOL_SIZE)
+            _docker_clients[host] = client
+        return client
+
+
+def _stream_build(client, context: BuildContext, image_name: str, console: Console, logs: LogRingBuffer,
+                  timings: dict) -> Tuple[bool, str]:
+    """
+    Build the image from the prepared context tarball, streaming the progress as it happens. The time until the
+    daemon answers is recorded as the context upload time.
+
+    The build goes through the docker CLI when it is installed, not through the pooled client: the docker SDK only
+    drives the classic builder (its build endpoint has no BuildKit session), which rejects the
+    `RUN --mount=type=cache` lines the DockerAgent is told to write. The CLI talks to the same daemon (DOCKER_HOST
+    is passed on) and is given the same cached context tarball on stdin. Without the CLI the pooled client's
+    low-level API builds with the classic builder.
+    """
+    started = time.perf_counter()
+
+    def output(line):
+        if "upload" not in timings:
+            timings["upload"] = round(time.perf_counter() - started, 3)
+        logs.append(line)
+        console.print(line.rstrip(), style="dim", markup=False, highlight=False)
+
+    with open(context.path, "rb") as tarball:
+        if shutil.which("docker"):
+            process = subprocess.Popen(
+                ["docker", "build", "--progress=plain", "-t", image_name, "-"],
+                stdin=tarball, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace",
+                env={**os.environ, "DOCKER_BUILDKIT": "1"},
+            )
+            for line in process.stdout:
+                output(line)
+            exit_code = process.wait()
+            return exit_code == 0, f"docker build exited with code {exit_code}"
+
+        for chunk in client.api.build(fileobj=tarball, custom_context=True, tag=image_name, rm=True, decode=True):
+            if "error" in chunk:
+                output(chunk["error"])
+                return False, chunk["error"].strip()
+            line = chunk.get("stream", "").rstrip()
+            if line:
+                output(line)
+    return True, ""
+
+
+def _format_timings(timings: dict) -> str:
+    phases = ", ".join(f"{phase} {timings[phase]:.1f}s" for phase in DOCKER_PHASES if phase in timings)
+    if "context_bytes" in timings:
+        reused = ", reused" if timings["context_reused"] else ""
+        phases += f" (context {timings['context_bytes'] / 1024 ** 2:.1f} MB{reused}, upload {timings.get('upload', 0):.1f}s)"
+    return f"Timings: {phases}"
+
+
+def docker_available() -> bool:
+    """Whether the docker SDK is installed and the daemon (DOCKER_HOST) answers; checked once per daemon."""
+    host = os.environ.get("DOCKER_HOST", "")
+    if host not in _docker_available:
+        try:
+            get_docker_client().ping()
+            _docker_available[host] = True
+        except Exception:
+            _docker_available[host] = False
+    return _docker_available[host]
+
+
+def run_image_tests(project_dir: str, image_name: str, command: Optional[str] = None,
+                    container_port: Optional[str] = None, container_name: Optional[str] = None) -> Tuple[str, int]:
+    """
+    Build the image of project_dir and run the tests inside a warm container of it from the ContainerPool.
+
+    Without a command, the one in the image's TEST_COMMAND_LABEL label is run. The time spent in each phase
+    (context, build, start, exec, teardown) is part of the output and recorded in the timings of the session
+    (collect_docker_timings).
+
+    :return: the output and the exit code: the tests', or 1 when the image could not be built or tested.
     """
+    import docker  # deferred: the docker SDK is only needed once a build is requested
+
     console = Console()
-    client = docker.from_env()
+    logs = LogRingBuffer()
+    project_dir = os.path.abspath(project_dir)
+    timings = {"project_dir": project_dir, "image": image_name}
+    session_timings = _docker_timings.get()
+    if session_timings is not None:
+        session_timings.append(timings)
+    pooled, ports_line = None, ""
+
+    def phase(name, started):
+        timings[name] = round(time.perf_counter() - started, 3)
+        record_span(f"docker.{name}", "docker", timings[name], image=image_name)
 
     try:
+        client = get_docker_client()
+
         # Build the Docker image
         console.print(f"[bold green]Building the Docker image '{image_name}'...[/bold green]")
-        image, build_logs = client.images.build(path=project_dir, tag=image_name)
-        for log in build_logs:
-            console.print(log.get('stream', '').strip())
-
-        # Run the container
-        console.print(f"[bold green]Running the container '{container_name}'...[/bold green]")
-        container = client.containers.run(
-            image=image_name,
-            name=container_name,
-            ports={f'{container_port}/tcp': host_port},
-            detach=True
-        )
-
-        # Execute the tests inside the container
-        console.print(f"[bold green]Running tests inside the container...[/bold green]")
-        test_result = container.exec_run(command)
-        console.print(test_result.output.decode())
-
-        # Stop and remove the container
-        console.print(f"[bold green]Stopping and removing the container '{container_name}'...[/bold green]")
-        container.stop()
-        container.remove()
-
-        console.print("[bold green]Docker image built and tests executed successfully.[/bold green]")
-        return "Docker image built and tests executed successfully.TERMINATE"
-
-    except docker.errors.BuildError as build_err:
-        console.print(f"[bold red]Error during image build: {build_err}[/bold red]")
-        return f"Error during image build: {build_err}"
+        context = prepare_build_context(project_dir)
+        timings.update(context=context.prepare_s, context_bytes=context.size, context_reused=context.reused)
+        record_span("docker.context", "docker", context.prepare_s, image=image_name, bytes=context.size, reused=context.reused)
+        started = time.perf_counter()
+        built, error = _stream_build(client, context, image_name, console, logs, timings)
+        phase("build", started)
+        if command is None and built:
+            command = (client.images.get(image_name).labels or {}).get(TEST_COMMAND_LABEL)
+            if not command:
+                built, error = False, f"the image has no {TEST_COMMAND_LABEL} label with the command that runs the tests"
+        if not built:
+            console.print(f"[bold red]Error during image build: {error}[/bold red]")
+            result = logs.excerpt(f"Error during image build: {error}")
+        else:
+            # Take a warm container of the image from the pool (started cold only if none is idle)
+            console.print(f"[bold green]Running the container '{container_name or image_name}'...[/bold green]")
+            started = time.perf_counter()
+            pooled = get_container_pool().acquire(image_name, ports=[container_port] if container_port else [])
+            container = pooled.container
+            phase("start", started)
+            host_ports = pooled.host_ports
+            if host_ports:
+                ports_line = f"Ports (container -> host): {', '.join(f'{c} -> {h}' for c, h in host_ports.items())}"
+                console.print(ports_line)
+
+            # Execute the tests inside the container
+            console.print(f"[bold green]Running tests inside the container...[/bold green]")
+            started = time.perf_counter()
+            test_result = container.exec_run(["sh", "-c", command])
+            phase("exec", started)
+            test_output = test_result.output.decode(errors="replace")
+            console.print(test_output)
+            timings["exit_code"] = test_result.exit_code
+
+            if test_result.exit_code != 0:
+                console.print(f"[bold red]Tests failed with exit code {test_result.exit_code}.[/bold red]")
+                result = f"Tests failed with exit code {test_result.exit_code}:\n{test_output}"
+            else:
+                console.print("[bold green]Docker image built and tests executed successfully.[/bold green]")
+                result = "Docker image built and tests executed successfully."
+            if ports_line:
+                result = f"{result}\n{ports_line}"
+
     except docker.errors.ContainerError as container_err:
         console.print(f"[bold red]Error during container execution: {container_err}[/bold red]")
-        return f"Error during container execution: {container_err}"
+        result = f"Error during container execution: {container_err}"
     except docker.errors.DockerException as docker_err:
         console.print(f"[bold red]General Docker error: {docker_err}[/bold red]")
-        return f"General Docker error: {docker_err}"
+        result = f"General Docker error: {docker_err}"
     except Exception as e:
         console.print(f"[bold red]An unexpected error occurred: {e}[/bold red]")
-        return f"An unexpected error occurred: {e}"
+        result = f"An unexpected error occurred: {e}"
+
+    # Hand the container back to the pool; its workspace is reset in the background
+    if pooled is not None:
+        started = time.perf_counter()
+        if "exit_code" in timings:
+            get_container_pool().release(pooled)
+        else:
+            get_container_pool().discard(pooled)       # something went wrong around the exec: do not reuse it
+        phase("teardown", started)
+
+    console.print(_format_timings(timings))
+    return f"{result}\n{_format_timings(timings)}", timings.get("exit_code", 1)
+
+
+def build_and_test_docker_image(
+        project_dir:Annotated[str,"path to the project directory"],
+        image_name:Annotated[str,"name of the Docker image to build"],
+        container_name:Annotated[str,"name of the Docker container to run (only shown in the logs: pooled containers are named by the pool)"],
+        container_port:Annotated[Optional[str],"container port to publish; docker picks a free host port for it, which is reported"],
+        command:Annotated[str," full command to be executed which runs the test files generated"]
+    )-> Annotated[str,"Output"]:
+    """
+    Function to build image and run tests inside the container (see run_image_tests).
+
+    :param project_dir
+    :param image_name
+    :param container_name
+    :param container_port
+    :param command
+    :return output
+    """
+    output, exit_code = run_image_tests(project_dir, image_name, command, container_port, container_name)
+    return output + "\nTERMINATE" if exit_code == 0 else output
 
     # Example usage of the function:
-    # build_and_test_docker_image("project_name","image_name","container_name","8080","8080","pytests tests")
+    # build_and_test_docker_image("project_name","image_name","container_name","8080","pytests tests")
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from rich.console import Console
+from rich.progress import Progress, SpinnerColumn, TimeElapsedColumn, TextColumn, BarColumn, MofNCompleteColumn
+
+from helper_functions import atomic_write
+
+ENV_TYPES = ("normal", "docker")
+
+
+def load_specs(spec_file: Path) -> List[Dict]:
+    """
+    Load the batch specification.
+
+    `.yaml`/`.yml` files must contain a list of mappings, anything else is read as JSONL (one object per line).
+    Every entry needs `project_name` and `project_description`; `env_type` defaults to "normal".
+    """
+    text = Path(spec_file).read_text(encoding="utf-8")
+    if Path(spec_file).suffix.lower() in (".yaml", ".yml"):
+        import yaml
+        entries = yaml.safe_load(text) or []
+    else:
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    if not isinstance(entries, list):
+        raise ValueError(f"{spec_file} must contain a list of project specs.")
+
+    specs = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not entry.get("project_name") or not entry.get("project_description"):
+            raise ValueError(f"Entry {index} in {spec_file} needs both 'project_name' and 'project_description'.")
+        env_type = entry.get("env_type", "normal")
+        if env_type not in ENV_TYPES:
+            raise ValueError(f"Entry {index} in {spec_file} has env_type '{env_type}', expected one of {ENV_TYPES}.")
+        specs.append({
+            "index": index,
+            "project_name": str(entry["project_name"]),
+            "project_description": str(entry["project_description"]),
+            "env_type": env_type,
+        })
+    return specs
+
+
+def workspace_for(workspace_root: Path, spec: Dict) -> Path:
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "-", spec["project_name"]).strip("-").lower() or "project"
+    return Path(workspace_root) / f"{spec['index']:03d}-{slug}"
+
+
+def _new_result(spec: Dict, workspace: Path) -> Dict:
+    return {
+        **spec,
+        "workspace": str(workspace),
+        "log": str(workspace / "run.log"),
+        "status": "failed",
+        "duration_s": None,
+        "error": None,
+        "docker_timings": [],
+        "artifact_cache": None,
+        "similar_run": None,
+        "trace": None,
+    }
+
+
+def _new_agent_system(spec: Dict, api_key: str, workspace: Path, console: Console, system_options: Optional[Dict]):
+    # imported in the worker so the parent process stays light
+    from MultiAgentSystem import MultiAgentSystem
+
+    return MultiAgentSystem(
+        api_key,
+        console,
+        env_type=spec["env_type"],
+        work_dir=str(workspace),
+        headless=True,
+        **(system_options or {}),
+    )
+
+
+def run_spec(spec: Dict, api_key: str, workspace_root: str, system_options: Optional[Dict] = None) -> Dict:
+    """Worker entry point: run one spec in its own workspace and return its report entry."""
+    workspace = workspace_for(Path(workspace_root), spec).resolve()
+    workspace.mkdir(parents=True, exist_ok=True)
+    result = _new_result(spec, workspace)
+
+    start = time.perf_counter()
+    with open(result["log"], "w", encoding="utf-8") as log_file:
+        console = Console(file=log_file, force_terminal=False, width=120)
+        try:
+            agent_system = _new_agent_system(spec, api_key, workspace, console, system_options)
+            finished = agent_system.run(spec["project_name"], spec["project_description"])
+            result["docker_timings"] = agent_system.docker_timings
+            result["artifact_cache"] = agent_system.artifact_cache_status
+            result["similar_run"] = agent_system.similar_run
+            result["trace"] = agent_system.tracer.path
+            if finished:
+                result["status"] = "success"
+            else:
+                result["error"] = "Pipeline did not complete all stages, see the run log."
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = f"{type(e).__name__}: {e}"
+            console.print(traceback.format_exc())
+    result["duration_s"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+async def arun_spec(spec: Dict, api_key: str, workspace_root: str, system_options: Optional[Dict] = None) -> Dict:
+    """Async variant of run_spec, using MultiAgentSystem.a_run."""
+    workspace = workspace_for(Path(workspace_root), spec).resolve()
+    workspace.mkdir(parents=True, exist_ok=True)
+    result = _new_result(spec, workspace)
+
+    start = time.perf_counter()
+    with open(result["log"], "w", encoding="utf-8") as log_file:
+        # one Console per session: rich allows a single live progress display per console
+        console = Console(file=log_file, force_terminal=False, width=120)
+        try:
+            agent_system = _new_agent_system(spec, api_key, workspace, console, system_options)
+            finished = await agent_system.a_run(spec["project_name"], spec["project_description"])
+            result["docker_timings"] = agent_system.docker_timings
+            result["artifact_cache"] = agent_system.artifact_cache_status
+            result["similar_run"] = agent_system.similar_run
+            result["trace"] = agent_system.tracer.path
+            if finished:
+                result["status"] = "success"
+            else:
+                result["error"] = "Pipeline did not complete all stages, see the run log."
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = f"{type(e).__name__}: {e}"
+            console.print(traceback.format_exc())
+    result["duration_s"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def run_specs_async(specs: List[Dict], api_key: str, workspace_root: str, sessions: int,
+                    system_options: Optional[Dict] = None) -> List[Dict]:
+    """Worker entry point: run several specs as concurrent sessions sharing one event loop."""
+    async def _run_all():
+        semaphore = asyncio.Semaphore(sessions)
+
+        async def _run_one(spec):
+            async with semaphore:
+                return await arun_spec(spec, api_key, workspace_root, system_options)
+
+        return await asyncio.gather(*(_run_one(spec) for spec in specs))
+
+    return asyncio.run(_run_all())
+
+
+def write_report(report_path: Path, results: List[Dict], total_s: float):
+    results = sorted(results, key=lambda r: r["index"])
+    report = {
+        "total": len(results),
+        "succeeded": sum(r["status"] == "success" for r in results),
+        "failed": sum(r["status"] != "success" for r in results),
+        "wall_time_s": round(total_s, 3),
+        "results": results,
+    }
+    report_path = Path(report_path)
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_write(report_path) as f:
+        json.dump(report, f, indent=4)
+    return report
+
+
+def _error_result(spec: Dict, workspace_root: Path, error: Exception) -> Dict:
+    # the worker process itself died (e.g. killed or out of memory)
+    return {**spec, "workspace": str(workspace_for(workspace_root, spec)), "log": None,
+            "status": "error", "duration_s": None, "error": f"{type(error).__name__}: {error}"}
+
+
+def run_batch(specs: List[Dict], api_key: str, workspace_root: Path, report_path: Path, workers: int, console: Console,
+              sessions_per_worker: int = 1, system_options: Optional[Dict] = None) -> Dict:
+    """
+    Run every spec through MultiAgentSystem on a bounded pool of worker processes.
+
+    With sessions_per_worker > 1 each worker gets a share of the specs and runs them as concurrent
+    async sessions on a single event loop instead of one spec at a time.
+    system_options are passed through to every MultiAgentSystem (e.g. cache_dir).
+    The report file is rewritten after each finished spec (or share) so partial results survive an interrupted batch.
+    """
+    Path(workspace_root).mkdir(parents=True, exist_ok=True)
+    results = []
+    start = time.perf_counter()
+    progress = Progress(
+        SpinnerColumn(finished_text="✅"),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TimeElapsedColumn(),
+        console=console,
+    )
+    with progress, ProcessPoolExecutor(max_workers=workers) as pool:
+        task = progress.add_task(f"[dark_orange3]Running {len(specs)} projects on {workers} workers...", total=len(specs))
+        if sessions_per_worker > 1:
+            shares = [specs[i::workers] for i in range(workers) if specs[i::workers]]
+            futures = {pool.submit(run_specs_async, share, api_key, str(workspace_root), sessions_per_worker, system_options): share for share in shares}
+        else:
+            futures = {pool.submit(run_spec, spec, api_key, str(workspace_root), system_options): [spec] for spec in specs}
+        for future in as_completed(futures):
+            try:
+                finished = future.result()
+                finished = finished if isinstance(finished, list) else [finished]
+            except Exception as e:
+                finished = [_error_result(spec, workspace_root, e) for spec in futures[future]]
+            for result in finished:
+                results.append(result)
+                style = "green" if result["status"] == "success" else "red"
+                progress.console.print(f"[{style}]{result['status']:>7}[/{style}] {result['project_name']} ({result['duration_s']}s)")
+                progress.update(task, advance=1)
+            write_report(report_path, results, time.perf_counter() - start)
+    return write_report(report_path, results, time.perf_counter() - start)
@@ -0,0 +1,270 @@
+"""
+End-to-end benchmark of whole MultiAgentSystem runs against the mock OpenAI server (mock_openai_server.py).
+
+Runs the fixture specs (benchmarks/fixtures/e2e_specs.jsonl) in normal and docker mode as 1, 8 and 64 concurrent
+async sessions on one event loop (what `main.py batch --sessions-per-worker` does in each worker) and reports per
+concurrency level:
+  - end-to-end wall time and the p50 / p95 session time,
+  - run_chat bookkeeping: wall time in CustomGroupChatManager.(a_)run_chat outside the speakers' replies (speaker
+    selection, stage completion, message appends and sends), per group chat round; with many sessions it includes
+    waiting for the shared event loop,
+  - per-stage wall time, from the sessions' traces,
+  - peak traced Python memory (tracemalloc) and the process' max RSS.
+
+    python benchmarks/e2e_benchmark.py --concurrency 1 8 64 --latency lognormal:0.2,0.5
+
+The LLM replies are scripted by the server, so the pipeline always succeeds; without a docker daemon (or without
+--docker-build) the docker stage writes its Dockerfile and skips the build. Exits with status 1 if a session fails,
+the bookkeeping per round at the lowest concurrency is over budget or the peak memory per session is over budget,
+so it can be used as a CI gate.
+"""
+import argparse
+import json
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from collections import defaultdict
+from contextvars import ContextVar
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from batch_runner import load_specs, run_specs_async  # noqa: E402
+from helper_functions import percentile  # noqa: E402
+from trace_report import load_spans, stage_breakdown  # noqa: E402
+
+FIXTURE_SPECS = Path(__file__).resolve().parent / "fixtures" / "e2e_specs.jsonl"
+MOCK_SERVER = Path(__file__).resolve().parent / "mock_openai_server.py"
+
+_in_reply: ContextVar[bool] = ContextVar("in_reply", default=False)
+
+
+class RunChatProbe:
+    """Wall time spent in the group chat managers' run_chat and in the speaker replies it waited for."""
+
+    def __init__(self):
+        self.chat_s = 0.0
+        self.reply_s = 0.0
+        self.rounds = 0
+
+    def reset(self):
+        self.chat_s, self.reply_s, self.rounds = 0.0, 0.0, 0
+
+    @property
+    def bookkeeping_ms_per_round(self) -> float:
+        return (self.chat_s - self.reply_s) / max(1, self.rounds) * 1000
+
+    def install(self):
+        """Wrap the methods; run_chat is registered as a reply function, so this must happen before managers exist."""
+        from autogen import ConversableAgent
+        from CustomGroupChat import CustomGroupChatManager
+
+        probe = self
+        run_chat, a_run_chat = CustomGroupChatManager.run_chat, CustomGroupChatManager.a_run_chat
+        generate_reply, a_generate_reply = ConversableAgent.generate_reply, ConversableAgent.a_generate_reply
+
+        def timed_run_chat(self, messages=None, sender=None, config=None):
+            start = time.perf_counter()
+            try:
+                return run_chat(self, messages, sender, config)
+            finally:
+                probe.chat_s += time.perf_counter() - start
+
+        async def timed_a_run_chat(self, messages=None, sender=None, config=None):
+            start = time.perf_counter()
+            try:
+                return await a_run_chat(self, messages, sender, config)
+            finally:
+                probe.chat_s += time.perf_counter() - start
+
+        def timed_generate_reply(self, messages=None, sender=None, **kwargs):
+            # only a speaker's reply to the manager, not the nested call of HumanProxyGroup's threaded reply
+            if not isinstance(sender, CustomGroupChatManager) or _in_reply.get():
+                return generate_reply(self, messages, sender, **kwargs)
+            token, start = _in_reply.set(True), time.perf_counter()
+            try:
+                return generate_reply(self, messages, sender, **kwargs)
+            finally:
+                probe.reply_s += time.perf_counter() - start
+                probe.rounds += 1
+                _in_reply.reset(token)
+
+        async def timed_a_generate_reply(self, messages=None, sender=None, **kwargs):
+            if not isinstance(sender, CustomGroupChatManager) or _in_reply.get():
+                return await a_generate_reply(self, messages, sender, **kwargs)
+            token, start = _in_reply.set(True), time.perf_counter()
+            try:
+                return await a_generate_reply(self, messages, sender, **kwargs)
+            finally:
+                probe.reply_s += time.perf_counter() - start
+                probe.rounds += 1
+                _in_reply.reset(token)
+
+        CustomGroupChatManager.run_chat = timed_run_chat
+        CustomGroupChatManager.a_run_chat = timed_a_run_chat
+        ConversableAgent.generate_reply = timed_generate_reply
+        ConversableAgent.a_generate_reply = timed_a_generate_reply
+
+
+def docker_daemon_available() -> bool:
+    if shutil.which("docker") is None:
+        return False
+    try:
+        return subprocess.run(["docker", "info"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              timeout=10).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+def start_mock_server(args, docker_build: bool):
+    command = [sys.executable, str(MOCK_SERVER), "--latency", args.latency, "--token-delay", str(args.token_delay),
+               "--fail-rate", str(args.fail_rate), "--seed", str(args.seed), "--log-kb", str(args.log_kb)]
+    if args.replies:
+        command += ["--replies", args.replies]
+    if docker_build:
+        command.append("--docker-build")
+    # a separate process, so the server's threads neither share the GIL with the sessions nor show up in tracemalloc
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    line = server.stdout.readline().strip()
+    if not line.startswith("listening on "):
+        server.kill()
+        raise RuntimeError(f"mock server did not start: {line!r}")
+    return server, line[len("listening on "):]
+
+
+def server_requests(base_url: str) -> int:
+    with urllib.request.urlopen(f"{base_url}/stats", timeout=10) as response:
+        return json.load(response)["requests"]
+
+
+def run_level(fixtures, mode: str, sessions: int, base_url: str, probe: RunChatProbe, args):
+    specs = [{**fixtures[i % len(fixtures)], "index": i} for i in range(sessions)]
+    with tempfile.TemporaryDirectory(prefix="e2e-bench-") as root:
+        system_options = {
+            "base_url": base_url,
+            "cache_dir": None,
+            "artifact_cache_dir": None,
+            "model_stats_path": None,
+            "trace_dir": str(Path(root) / "traces"),
+            "transcript_db": str(Path(root) / "transcripts.db"),
+            "streaming": args.stream,
+            "speculative": args.speculative,
+        }
+        probe.reset()
+        requests_before = server_requests(base_url)
+        tracemalloc.start()
+        start = time.perf_counter()
+        results = run_specs_async(specs, "sk-benchmark", str(Path(root) / "workspaces"), sessions, system_options)
+        wall_s = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stage_s = defaultdict(list)
+        for result in results:
+            if result.get("trace") and Path(result["trace"]).is_file():
+                for name, totals in stage_breakdown(load_spans(result["trace"])).items():
+                    stage_s[name].append(totals["duration"])
+        durations = [r["duration_s"] for r in results if r["duration_s"] is not None]
+        return {
+            "mode": mode,
+            "sessions": sessions,
+            "succeeded": sum(r["status"] == "success" for r in results),
+            "errors": sorted({r["error"] for r in results if r["status"] != "success" and r["error"]}),
+            "wall_s": wall_s,
+            "session_p50_s": statistics.median(durations) if durations else 0.0,
+            "session_p95_s": percentile(durations, 0.95) if durations else 0.0,
+            "requests": server_requests(base_url) - requests_before,
+            "rounds": probe.rounds,
+            "bookkeeping_ms_per_round": probe.bookkeeping_ms_per_round,
+            "stage_s": {name: statistics.mean(values) for name, values in stage_s.items()},
+            "peak_mb": peak / 1024 ** 2,
+        }
+
+
+def print_level(level):
+    print(f"\n{level['mode']} x {level['sessions']} sessions")
+    print(f"  succeeded            : {level['succeeded']:>8} / {level['sessions']}")
+    print(f"  end-to-end           : {level['wall_s']:8.2f} s   ({level['sessions'] / level['wall_s']:.2f} sessions/s)")
+    print(f"  session p50 / p95    : {level['session_p50_s']:8.2f} s / {level['session_p95_s']:.2f} s")
+    print(f"  llm requests         : {level['requests']:>8}   ({level['rounds']} group chat rounds)")
+    print(f"  run_chat bookkeeping : {level['bookkeeping_ms_per_round']:8.2f} ms per round")
+    for name, seconds in level["stage_s"].items():
+        print(f"  stage {name:<15}: {seconds:8.2f} s   (mean per session)")
+    print(f"  peak traced memory   : {level['peak_mb']:8.1f} MB   ({level['peak_mb'] / level['sessions']:.1f} MB per session)")
+    for error in level["errors"]:
+        print(f"  error                : {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=["normal", "docker"], default=["normal", "docker"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 64], help="concurrent sessions per level")
+    parser.add_argument("--specs", default=str(FIXTURE_SPECS), help="fixture specs (JSONL or YAML, as for `batch`)")
+    parser.add_argument("--latency", default="fixed:0.05", help="mock reply latency, e.g. lognormal:0.8,0.5")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--replies", help="recorded replies (JSONL) instead of the scripted ones")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of first stage attempts that fail")
+    parser.add_argument("--log-kb", type=int, default=0, help="size of the install log each stage script prints")
+    parser.add_argument("--docker-build", action="store_true", help="really build the images if a daemon is present")
+    parser.add_argument("--stream", action="store_true", help="run the sessions with streamed stage replies")
+    parser.add_argument("--speculative", action="store_true", help="run the sessions with speculative drafting")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--bookkeeping-budget-ms", type=float, default=50.0,
+                        help="max run_chat bookkeeping per round at the lowest concurrency")
+    parser.add_argument("--memory-budget-mb", type=float, default=64.0, help="max peak traced memory per session")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    fixtures = load_specs(Path(args.specs))
+    docker_build = args.docker_build and docker_daemon_available()
+    if args.docker_build and not docker_build:
+        print("no docker daemon: the docker stage is stubbed")
+    probe = RunChatProbe()
+    probe.install()
+
+    levels = []
+    server, base_url = start_mock_server(args, docker_build)
+    try:
+        print(f"mock server {base_url}, latency {args.latency}")
+        for mode in args.modes:
+            mode_fixtures = [spec for spec in fixtures if spec["env_type"] == mode]
+            if not mode_fixtures:
+                print(f"\nno {mode} specs in {args.specs}")
+                continue
+            for sessions in sorted(args.concurrency):
+                levels.append(run_level(mode_fixtures, mode, sessions, base_url, probe, args))
+                print_level(levels[-1])
+    finally:
+        server.terminate()
+        server.wait()
+    print(f"\nmax RSS                : {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:8.1f} MB")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(levels, indent=4), encoding="utf-8")
+
+    failures = []
+    for level in levels:
+        name = f"{level['mode']} x {level['sessions']}"
+        if level["succeeded"] < level["sessions"]:
+            failures.append(f"{name}: {level['sessions'] - level['succeeded']} sessions did not finish")
+        if level["peak_mb"] / level["sessions"] > args.memory_budget_mb:
+            failures.append(f"{name}: {level['peak_mb'] / level['sessions']:.1f} MB peak memory per session")
+    for mode in args.modes:
+        lowest = min((l for l in levels if l["mode"] == mode), key=lambda l: l["sessions"], default=None)
+        if lowest is not None and lowest["bookkeeping_ms_per_round"] > args.bookkeeping_budget_ms:
+            failures.append(f"{mode}: run_chat bookkeeping {lowest['bookkeeping_ms_per_round']:.2f} ms per round")
+    if failures:
+        print("\nE2E REGRESSION:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nend-to-end runs within budget")
+
+
+if __name__ == "__main__":
+    main()
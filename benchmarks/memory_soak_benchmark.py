@@ -0,0 +1,117 @@
+"""
+Memory soak test: many sequential MultiAgentSystem sessions in one process, against the mock OpenAI server.
+
+A batch worker runs session after session; whatever a session leaves referenced (execution logs in agent histories,
+caches keyed by message content) adds up over a long batch. This runs the fixture specs as --sessions sequential
+sessions (one after the other, as `main.py batch` does in a worker), with every stage script printing an install log
+of --log-kb KB and --fail-rate of the first attempts failing (so retries resend the logs), and reports after each
+--report-every sessions:
+  - the process' current and max RSS,
+  - what the message store (MessageStore.py) still holds: nothing, once a session is over.
+
+    python benchmarks/memory_soak_benchmark.py --sessions 100 --log-kb 256
+
+The max RSS rises over the first few dozen sessions while the allocators (Python's, glibc's per-thread arenas,
+OpenSSL's, tiktoken's) settle, then has to stay flat: exits with status 1 if a session fails, the message store holds
+contents between sessions or the max RSS grows by more than --growth-budget-mb after the --warmup sessions, so it can
+be used as a CI gate.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from batch_runner import load_specs, run_specs_async  # noqa: E402
+from e2e_benchmark import FIXTURE_SPECS, start_mock_server  # noqa: E402
+from MessageStore import get_message_store  # noqa: E402
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        return max_rss_mb()       # not Linux: only the peak is known
+
+
+def max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["normal", "docker"], default="normal")
+    parser.add_argument("--sessions", type=int, default=100, help="sequential sessions")
+    parser.add_argument("--specs", default=str(FIXTURE_SPECS), help="fixture specs (JSONL or YAML, as for `batch`)")
+    parser.add_argument("--log-kb", type=int, default=256, help="size of the install log each stage script prints")
+    parser.add_argument("--fail-rate", type=float, default=0.3, help="share of first stage attempts that fail")
+    parser.add_argument("--latency", default="fixed:0", help="mock reply latency, e.g. lognormal:0.8,0.5")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--warmup", type=int, default=30, help="sessions before the max RSS is expected to be flat")
+    parser.add_argument("--growth-budget-mb", type=float, default=16.0,
+                        help="max growth of the max RSS from the end of the warm-up to the last session")
+    parser.add_argument("--report-every", type=int, default=10)
+    args = parser.parse_args()
+    args.token_delay, args.replies = 0.0, None        # what start_mock_server expects besides the above
+
+    fixtures = [spec for spec in load_specs(Path(args.specs)) if spec["env_type"] == args.mode]
+    if not fixtures:
+        print(f"no {args.mode} specs in {args.specs}")
+        sys.exit(1)
+    store = get_message_store()
+    failures, warm_max_rss = [], None
+
+    server, base_url = start_mock_server(args, docker_build=False)
+    try:
+        print(f"mock server {base_url}, {args.log_kb} KB logs, fail rate {args.fail_rate}")
+        print(f"{'sessions':>8}{'rss':>11}{'max rss':>11}{'held':>7}{'s/session':>11}")
+        with tempfile.TemporaryDirectory(prefix="soak-bench-") as root:
+            system_options = {
+                "base_url": base_url,
+                "cache_dir": None,
+                "artifact_cache_dir": None,
+                "model_stats_path": None,
+                "trace_dir": None,
+                "transcript_db": str(Path(root) / "transcripts.db"),
+            }
+            start = time.perf_counter()
+            for i in range(args.sessions):
+                spec = {**fixtures[i % len(fixtures)], "index": i}
+                result = run_specs_async([spec], "sk-benchmark", str(Path(root) / "workspaces"), 1, system_options)[0]
+                if result["status"] != "success":
+                    failures.append(f"session {i}: {result['status']} {result.get('error') or ''}".strip())
+                held = store.stats()
+                if held["contents"]:
+                    failures.append(f"session {i}: the message store still holds {held['contents']} contents "
+                                    f"({held['chars'] / 1024 ** 2:.1f} M chars)")
+                if i + 1 == args.warmup:
+                    warm_max_rss = max_rss_mb()
+                if (i + 1) % args.report_every == 0 or i + 1 == args.sessions:
+                    elapsed = (time.perf_counter() - start) / (i + 1)
+                    print(f"{i + 1:>8}{current_rss_mb():8.1f} MB{max_rss_mb():8.1f} MB{held['contents']:>7}"
+                          f"{elapsed:11.2f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"\nmessage store: {json.dumps(store.stats())}")
+    if warm_max_rss is not None:
+        growth = max_rss_mb() - warm_max_rss
+        print(f"max RSS growth after {args.warmup} sessions: {growth:.1f} MB")
+        if growth > args.growth_budget_mb:
+            failures.append(f"max RSS grew by {growth:.1f} MB after the warm-up")
+    if failures:
+        print("\nMEMORY SOAK REGRESSION:\n  " + "\n  ".join(failures[:20]))
+        sys.exit(1)
+    print("\nmemory flat within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Micro-benchmark of the message scanner (MessageScanner.py) on multi-megabyte execution logs.
+
+Builds messages the size of long `npm install` / `pip install` logs:
+  - an ExecutionResult (HumanProxyGroup's report) whose output is the log,
+  - a free-text reply that quotes the log and carries code blocks and a summary section,
+and times, per message, what the readers of a round did separately before (the termination check splitting the
+whole content into lines, the stage check and the context budgeter decoding the JSON once each as a command
+response and as an execution result, summary regex, autogen's code block extraction) against one cold scan and
+the scan of a content the message store holds (warm, as for the messages of a group chat):
+
+    python benchmarks/message_scan_benchmark.py --sizes-mb 1 4 16 --repeat 5
+
+Exits with status 1 if a cold scan is slower than the separate readers together or a cached scan is over budget,
+so it can be used as a CI gate.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from autogen.coding import MarkdownCodeExtractor  # noqa: E402
+
+from MessageScanner import scan_message  # noqa: E402
+from MessageStore import get_message_store  # noqa: E402
+from helper_functions import extract_summary  # noqa: E402
+from pydantic import ValidationError  # noqa: E402
+
+from structured_output import CommandResponse, ExecutionResult, load_message_json  # noqa: E402
+
+PACKAGES = ["react", "webpack", "babel-core", "eslint", "typescript", "lodash", "express", "jest", "rollup", "vite"]
+
+
+def install_log(rng: random.Random, size: int) -> str:
+    lines, total = [], 0
+    while total < size:
+        package = rng.choice(PACKAGES)
+        line = rng.choice([
+            f"npm http fetch GET 200 https://registry.npmjs.org/{package} {rng.randint(5, 900)}ms (cache miss)",
+            f"npm WARN deprecated {package}@{rng.randint(1, 9)}.{rng.randint(0, 20)}.0: this version is no longer supported",
+            f"added {rng.randint(1, 400)} packages, and audited {rng.randint(400, 2000)} packages in {rng.randint(1, 60)}s",
+            f"  ├─┬ {package}@{rng.randint(1, 9)}.{rng.randint(0, 30)}.{rng.randint(0, 9)}",
+        ])
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines)
+
+
+def legacy_parse(content: str, model, required_key: str):
+    """How each reader decoded a structured message on its own before the scanner."""
+    data = load_message_json(content)
+    if data is None or required_key not in data:
+        return None
+    try:
+        return model.model_validate(data)
+    except ValidationError:
+        return None
+
+
+def legacy_readers(content: str):
+    """What the readers of one round computed separately before the scanner."""
+    any("TERMINATE" in line.upper() for line in content.splitlines()[-15:])
+    legacy_parse(content, ExecutionResult, "exit_code")         # stage check
+    legacy_parse(content, CommandResponse, "commands")          # context budgeter: proposal?
+    legacy_parse(content, ExecutionResult, "exit_code")         # context budgeter: execution result?
+    extract_summary(content)
+    MarkdownCodeExtractor().extract_code_blocks(content)
+
+
+def timed(function, content: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(content)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-mb", nargs="+", type=float, default=[1, 4, 16], help="log sizes")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per measurement (median reported)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--warm-budget-ms", type=float, default=1.0, help="max time of a cached scan")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    store = get_message_store()
+    failures = []
+    print(f"{'message':<28}{'legacy readers':>16}{'cold scan':>12}{'warm scan':>12}{'speedup/round':>15}")
+    for size_mb in args.sizes_mb:
+        log = install_log(rng, int(size_mb * 1024 ** 2))
+        messages = {
+            f"execution result {size_mb:g} MB": ExecutionResult(exit_code=1, output=log,
+                                                                failed_command="npm install").model_dump_json(),
+            f"free text {size_mb:g} MB": (f"The install failed:\n```\n{log}\n```\nFix:\n```bash\nnpm ci\n```\n"
+                                          "Summary:\nreinstalled the dependencies from the lockfile"),
+        }
+        for name, content in messages.items():
+            legacy_ms = timed(legacy_readers, content, args.repeat)
+            cold_ms = timed(scan_message, content, args.repeat)       # not held: scanned on every call
+            store.hold(content)
+            scan_message(content)
+            warm_ms = timed(scan_message, content, args.repeat)
+            store.release([content])
+            print(f"{name:<28}{legacy_ms:13.1f} ms{cold_ms:9.1f} ms{warm_ms:9.3f} ms{legacy_ms / max(cold_ms, 1e-6):14.1f}x")
+            if cold_ms > legacy_ms:
+                failures.append(f"{name}: cold scan {cold_ms:.1f} ms, separate readers {legacy_ms:.1f} ms")
+            if warm_ms > args.warm_budget_ms:
+                failures.append(f"{name}: cached scan {warm_ms:.3f} ms")
+
+    # the scan is what every later round pays: holding the content keeps it off the hot path until it is released
+    print(f"\nmessage store after the releases: {json.dumps(store.stats())}")
+    if failures:
+        print("\nMESSAGE SCAN REGRESSION:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nmessage scans within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+OpenAI-compatible stand-in server for the offline benchmarks.
+
+Answers `POST /v1/chat/completions` (plain and streamed) with scripted or recorded replies after a latency drawn
+from a configurable distribution, so whole MultiAgentSystem runs can be timed without a live LLM:
+
+    python benchmarks/mock_openai_server.py --port 8000 --latency lognormal:0.8,0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8000/v1 python main.py
+
+The agent a request is for is read from its system message ("You are TesterAgent. ..."). Scripted replies are
+cheap, always-passing command lists for the normal and the docker pipeline; the docker stage only builds the image
+when --docker-build is given (a daemon is present), otherwise it writes the Dockerfile and skips the build. With
+--log-kb, every stage script also prints an install log of that size (random, so no two logs are equal).
+Recorded replies (--replies) are a JSONL file of {"agent": ..., "content": ...} lines; the n-th reply recorded for
+an agent answers its n-th attempt in a session (the last one repeats), so concurrent sessions get the same script.
+
+Latency specs: `0.5` or `fixed:0.5`, `uniform:LOW,HIGH`, `lognormal:MEDIAN,SIGMA` (seconds); with --token-delay,
+streamed replies are sent in small chunks that far apart. `GET /stats` returns the request counts per agent.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+AGENT_PATTERN = re.compile(r"You are (\w+)\.")
+AGENT_ALIASES = {"TemplateCodeAgent": "TemplateAgent"}     # the docker template prompt's name for TemplateAgent
+STREAM_CHUNK_CHARS = 16
+
+APP_SOURCE = "def add(a, b):\n    return a + b\n"
+TEST_SOURCE = ("import unittest\n\nfrom app import add\n\n\nclass AddTest(unittest.TestCase):\n"
+               "    def test_add(self):\n        self.assertEqual(add(1, 2), 3)\n")
+DOCKERFILE = "FROM python:3.11-slim\nWORKDIR /app\nCOPY . .\nLABEL code-catalyst.test=\"python -m unittest discover -s tests\"\nCMD [\"python\", \"-m\", \"unittest\", \"discover\", \"-s\", \"tests\"]\n"
+
+
+class LatencyModel:
+    """Seconds to wait before answering, drawn from a fixed, uniform or lognormal distribution."""
+
+    def __init__(self, spec: str = "0", seed: Optional[int] = None):
+        kind, _, params = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+        values = [float(v) for v in params.split(",") if v.strip()]
+        if kind not in ("fixed", "uniform", "lognormal") or len(values) != (1 if kind == "fixed" else 2):
+            raise ValueError(f"bad latency spec {spec!r}: expected fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA")
+        self.spec = spec
+        self.kind = kind
+        self.values = values
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "fixed":
+                return self.values[0]
+            if self.kind == "uniform":
+                return self._rng.uniform(*self.values)
+            median, sigma = self.values
+            return self._rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+
+
+def _write(path: str, text: str) -> str:
+    return f"printf '%b' {json.dumps(text)} > {path}"
+
+
+def _command_reply(commands: List[str], summary: str) -> str:
+    return json.dumps({"commands": [{"command": c, "comment": ""} for c in commands], "summary": summary})
+
+
+class ScriptedReplies:
+    """Replies of a pipeline that succeeds at the first attempt (fail_rate: share of first attempts that fail)."""
+
+    def __init__(self, docker_build: bool = False, fail_rate: float = 0.0, seed: Optional[int] = None,
+                 log_kb: int = 0):
+        self.docker_build = docker_build
+        self.fail_rate = fail_rate
+        self.log_kb = log_kb
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _fails(self, attempt: int) -> bool:
+        with self._lock:
+            return attempt == 0 and self._rng.random() < self.fail_rate
+
+    def _log(self) -> List[str]:
+        # base64 of random bytes: log_kb KB of output lines
+        return [f"head -c {self.log_kb * 768} /dev/urandom | base64"] if self.log_kb else []
+
+    def reply(self, agent: str, system_message: str, attempt: int) -> str:
+        if agent == "TemplateAgent":
+            commands = ["mkdir -p project/tests", _write("project/app.py", APP_SOURCE),
+                        "echo > project/requirements.txt", *self._log()]
+            if self._fails(attempt):
+                commands.append("false")
+            return _command_reply(commands, "Created project/ with app.py and requirements.txt")
+        if agent == "TesterAgent":
+            return _command_reply([_write("project/tests/test_app.py", TEST_SOURCE), *self._log(),
+                                   "cd project && PYTHONPATH=. python3 -m unittest discover -s tests -q"],
+                                  "Added project/tests/test_app.py, the tests pass")
+        if agent == "DockerAgent":
+            build = ("cd project && docker build -q -t code-catalyst-bench ." if self.docker_build
+                     else "cd project && test -f Dockerfile && echo 'no docker daemon: build skipped'")
+            return _command_reply([_write("project/Dockerfile", DOCKERFILE), *self._log(), build],
+                                  "Added project/Dockerfile")
+        if "Docker" in system_message:        # docker mode's extracter answers with a markdown list
+            return ("1. **Project Name**:\n   - project\n\n2. **Programming Language**:\n   - Python\n\n"
+                    "3. **Dependencies and Requirements**:\n   - none\n\n5. **Base Image**:\n   - python:3.11-slim\n"
+                    "\nTERMINATE")
+        return ('{"project_type": "library", "language_preferences": ["Python"], "required_dependencies": [], '
+                '"special_configurations": []}\nTERMINATE')
+
+
+class RecordedReplies:
+    """Replies read from a JSONL recording; attempt n of an agent gets its n-th recorded reply."""
+
+    def __init__(self, path: str):
+        self.replies: Dict[str, List[str]] = defaultdict(list)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.replies[entry["agent"]].append(entry["content"])
+
+    def reply(self, agent: str, system_message: str, attempt: int) -> str:
+        recorded = self.replies.get(agent) or self.replies.get("*")
+        if not recorded:
+            raise KeyError(f"no recorded reply for {agent}")
+        return recorded[min(attempt, len(recorded) - 1)]
+
+
+def agent_of(messages: List[Dict]) -> str:
+    system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+    match = AGENT_PATTERN.search(system[:200])
+    name = match.group(1) if match else "info_extracter"
+    return AGENT_ALIASES.get(name, name)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    server: "MockOpenAIServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        messages = body.get("messages", [])
+        agent = agent_of(messages)
+        system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+        attempt = sum(1 for m in messages if m.get("name") == agent)      # its earlier proposals in the chat
+        try:
+            content = self.server.replies.reply(agent, system, attempt)
+        except KeyError as e:
+            self._send_json(500, {"error": {"message": str(e)}})
+            return
+        self.server.count(agent)
+        time.sleep(self.server.latency.sample())
+
+        model = body.get("model", "gpt-4o")
+        usage = {"prompt_tokens": sum(len(m.get("content") or "") for m in messages) // 4,
+                 "completion_tokens": max(1, len(content) // 4)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if body.get("stream"):
+            self._stream(model, content, usage, body.get("stream_options", {}).get("include_usage", False))
+            return
+        self._send_json(200, {
+            "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": usage,
+        })
+
+    def _stream(self, model: str, content: str, usage: Dict, include_usage: bool):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(choices, **extra):
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": choices, **extra}
+            self.wfile.write(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+            self.wfile.flush()
+
+        for i in range(0, len(content), STREAM_CHUNK_CHARS):
+            event([{"index": 0, "delta": {"content": content[i:i + STREAM_CHUNK_CHARS]}, "finish_reason": None}])
+            time.sleep(self.server.token_delay)
+        event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if include_usage:
+            event([], usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, port: int = 0, replies=None, latency: Optional[LatencyModel] = None, token_delay: float = 0.0):
+        super().__init__(("127.0.0.1", port), MockHandler)
+        self.replies = replies or ScriptedReplies()
+        self.latency = latency or LatencyModel()
+        self.token_delay = token_delay
+        self._requests = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def count(self, agent: str):
+        with self._lock:
+            self._requests[agent] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"requests": sum(self._requests.values()), "by_agent": dict(self._requests)}
+
+    def start(self) -> "MockOpenAIServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=0, help="port to listen on (0: any free port)")
+    parser.add_argument("--latency", default="0", help="latency distribution of a reply, see above")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between the chunks of a streamed reply")
+    parser.add_argument("--replies", help="JSONL recording to answer with instead of the scripted replies")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of scripted first attempts that fail")
+    parser.add_argument("--docker-build", action="store_true", help="scripted docker stage builds the image")
+    parser.add_argument("--log-kb", type=int, default=0, help="size of the install log each scripted stage prints")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    replies = (RecordedReplies(args.replies) if args.replies
+               else ScriptedReplies(docker_build=args.docker_build, fail_rate=args.fail_rate, seed=args.seed,
+                                    log_kb=args.log_kb))
+    server = MockOpenAIServer(args.port, replies, LatencyModel(args.latency, seed=args.seed), args.token_delay)
+    print(f"listening on {server.base_url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats()), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
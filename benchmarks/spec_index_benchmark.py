@@ -0,0 +1,141 @@
+"""
+Build and query benchmark for the MinHash/LSH spec index (SpecIndex.py).
+
+Generates synthetic verified runs (a canonical spec plus the packages their scripts installed), indexes them and
+queries near-duplicates: an indexed spec with one dependency added, removed or swapped, the way
+"Flask + Postgres" relates to "Flask + SQLAlchemy + Postgres". Reports signature and LSH table build times,
+save/load times, query latency percentiles and recall against exact Jaccard search over the same entries:
+
+    python benchmarks/spec_index_benchmark.py --entries 100000 --queries 1000
+
+Exits with status 1 if the p95 query latency is over budget or recall@1 is below the floor, so it can be used as a
+CI gate.
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from SpecIndex import SpecIndex, spec_tokens  # noqa: E402
+from helper_functions import percentile  # noqa: E402
+
+PROJECT_TYPES = ["web application", "rest api", "cli tool", "data pipeline", "machine learning service",
+                 "static site", "chat bot", "microservice", "desktop app", "game server"]
+LANGUAGES = ["python", "node.js", "typescript", "go", "rust", "java", "ruby", "php"]
+CONFIGURATIONS = ["virtual environment setup", "hot reload", "environment variables", "linting",
+                  "continuous integration", "database migrations", "https", "logging"]
+
+
+def dependency_vocabulary(size: int):
+    known = ["flask", "django", "fastapi", "sqlalchemy", "postgres", "psycopg2", "redis", "celery", "pytest",
+             "express", "react", "mongodb", "mongoose", "jest", "axios", "numpy", "pandas", "scikit-learn"]
+    return known + [f"package-{i}" for i in range(size - len(known))]
+
+
+def synthetic_run(rng: random.Random, dependencies):
+    deps = rng.sample(dependencies, rng.randint(3, 10))
+    spec = {
+        "project_type": rng.choice(PROJECT_TYPES),
+        "language_preferences": sorted(rng.sample(LANGUAGES, rng.randint(1, 2))),
+        "required_dependencies": sorted(deps),
+        "special_configurations": sorted(rng.sample(CONFIGURATIONS, rng.randint(0, 3))),
+    }
+    installed = {f"dep:{d}" for d in deps} | {f"dep:{d}" for d in rng.sample(dependencies, rng.randint(0, 2))}
+    return spec, spec_tokens(spec) | installed
+
+
+def near_duplicate(rng: random.Random, spec, dependencies):
+    deps = list(spec["required_dependencies"])
+    change = rng.choice(["add", "remove", "swap"]) if len(deps) > 3 else "add"
+    if change in ("remove", "swap"):
+        deps.remove(rng.choice(deps))
+    if change in ("add", "swap"):
+        deps.append(rng.choice(dependencies))
+    return {**spec, "required_dependencies": sorted(set(deps))}
+
+
+def jaccard(a, b):
+    return len(a & b) / max(1, len(a | b))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100_000, help="verified runs in the index")
+    parser.add_argument("--queries", type=int, default=1000, help="near-duplicate queries")
+    parser.add_argument("--exact-queries", type=int, default=50, help="queries also answered by exact Jaccard search")
+    parser.add_argument("--vocabulary", type=int, default=2000, help="distinct dependency names")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--query-budget-ms", type=float, default=20.0, help="max p95 query latency")
+    parser.add_argument("--min-recall", type=float, default=0.9, help="min recall@1 against exact search")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    dependencies = dependency_vocabulary(args.vocabulary)
+    runs = [synthetic_run(rng, dependencies) for _ in range(args.entries)]
+    keys = [f"run-{i}" for i in range(args.entries)]
+    token_sets = [tokens for _, tokens in runs]
+
+    index = SpecIndex()
+    start = time.perf_counter()
+    index.add_many(keys, ["normal"] * args.entries, token_sets)
+    signatures_s = time.perf_counter() - start
+    start = time.perf_counter()
+    index._build_tables()
+    tables_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        index.directory = directory
+        start = time.perf_counter()
+        index.save()
+        save_s = time.perf_counter() - start
+        size_mb = sum(p.stat().st_size for p in Path(directory).iterdir()) / 1024 ** 2
+
+    query_sources = [rng.randrange(args.entries) for _ in range(args.queries)]
+    queries = [spec_tokens(near_duplicate(rng, runs[i][0], dependencies)) for i in query_sources]
+    latencies, results = [], []
+    for tokens in queries:
+        start = time.perf_counter()
+        results.append(index.query(tokens, "normal", k=1))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # recall@1: the index returned a run at least as similar as the best one exact search finds
+    found, exact_ms = 0, []
+    checked = min(args.exact_queries, args.queries)
+    for tokens, result in zip(queries[:checked], results[:checked]):
+        start = time.perf_counter()
+        best = max(jaccard(tokens, other) for other in token_sets)
+        exact_ms.append((time.perf_counter() - start) * 1000)
+        if result and jaccard(tokens, token_sets[keys.index(result[0][0])]) >= best - 1e-9:
+            found += 1
+    recall = found / max(1, checked)
+    answered = sum(1 for result in results if result) / len(results)
+
+    p50, p95 = statistics.median(latencies), percentile(latencies, 0.95)
+    print(f"entries              : {args.entries:>10,}")
+    print(f"signatures           : {signatures_s:10.2f} s   ({signatures_s / args.entries * 1e6:.1f} us/entry)")
+    print(f"lsh tables           : {tables_s:10.2f} s")
+    print(f"save                 : {save_s:10.2f} s   ({size_mb:.1f} MB)")
+    print(f"query p50 / p95      : {p50:8.2f} ms / {p95:.2f} ms  (budget {args.query_budget_ms:.0f} ms)")
+    print(f"exact search         : {statistics.median(exact_ms):8.2f} ms per query (median of {checked})")
+    print(f"answered             : {answered:10.1%}")
+    print(f"recall@1 vs exact    : {recall:10.1%}  (floor {args.min_recall:.0%})")
+
+    failures = []
+    if p95 > args.query_budget_ms:
+        failures.append(f"p95 query latency {p95:.2f} ms")
+    if recall < args.min_recall:
+        failures.append(f"recall@1 {recall:.1%}")
+    if failures:
+        print("\nSPEC INDEX REGRESSION:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nspec index within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Startup-time benchmark for the code-catalyst CLI.
+
+Measures how long `import main` and `python main.py --help` take in a fresh
+interpreter and checks that the heavy packages (autogen, agentops, docker, ...)
+are NOT pulled in by the entry point. Exits with status 1 if the median time is
+over budget or a heavy module leaks into the startup path, so it can be used as
+a CI gate:
+
+    python benchmarks/startup_benchmark.py --runs 10 --import-budget-ms 400
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Modules that must only be imported once MultiAgentSystem actually runs.
+HEAVY_MODULES = [
+    "autogen",
+    "agentops",
+    "docker",
+    "openai",
+    "questionary",
+    "MultiAgentSystem",
+    "sys_msg_docker",
+    "sys_msg_normal",
+]
+
+LEAK_CHECK = (
+    "import sys, json, main; "
+    f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+)
+
+
+def time_command(args, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(args, cwd=REPO_ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def leaked_modules():
+    result = subprocess.run(
+        [sys.executable, "-c", LEAK_CHECK], cwd=REPO_ROOT, check=True, stdout=subprocess.PIPE, text=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=7, help="fresh interpreters to start per measurement")
+    parser.add_argument("--import-budget-ms", type=float, default=400.0, help="max median time for `import main`")
+    parser.add_argument("--help-budget-ms", type=float, default=600.0, help="max median time for `main.py --help`")
+    args = parser.parse_args()
+
+    baseline = statistics.median(time_command([sys.executable, "-c", "pass"], args.runs))
+    import_times = time_command([sys.executable, "-c", "import main"], args.runs)
+    help_times = time_command([sys.executable, "main.py", "--help"], args.runs)
+
+    import_ms = (statistics.median(import_times) - baseline) * 1000
+    help_ms = (statistics.median(help_times) - baseline) * 1000
+    leaks = leaked_modules()
+
+    print(f"interpreter baseline : {baseline * 1000:8.1f} ms")
+    print(f"import main          : {import_ms:8.1f} ms  (budget {args.import_budget_ms:.0f} ms)")
+    print(f"main.py --help       : {help_ms:8.1f} ms  (budget {args.help_budget_ms:.0f} ms)")
+    print(f"heavy modules loaded : {', '.join(leaks) if leaks else 'none'}")
+
+    failures = []
+    if import_ms > args.import_budget_ms:
+        failures.append(f"`import main` took {import_ms:.1f} ms")
+    if help_ms > args.help_budget_ms:
+        failures.append(f"`main.py --help` took {help_ms:.1f} ms")
+    if leaks:
+        failures.append(f"heavy modules imported at startup: {', '.join(leaks)}")
+
+    if failures:
+        print("\nSTARTUP REGRESSION:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nstartup within budget")
+
+
+if __name__ == "__main__":
+    main()
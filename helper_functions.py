@@ -1,4 +1,7 @@
 from string import Template
+from contextlib import contextmanager
+import json
+import os
 import re
 from sys_msg_docker import docker_team_intro
 from sys_msg_normal import normal_team_intro
@@ -7,20 +10,51 @@ from rich.prompt import Prompt
 
 console = Console()
 
-def extract_description(input_str):
-    start_marker = "json"
-    end_marker = "TERMINATE"
-    
-    start_index = input_str.find(start_marker)
-    end_index = input_str.find(end_marker, start_index)
+@contextmanager
+def atomic_write(path, binary=False):
+    # write a temporary file next to path and move it over path once the block is done,
+    # so readers (and other processes) see the old file or the new one, never half of it
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb" if binary else "w", encoding=None if binary else "utf-8") as f:
+            yield f
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def percentile(values, q):
+    # nearest-rank percentile, q in [0, 1]
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
 
-    if start_index == -1:
+def extract_json_object(input_str):
+    # first parseable JSON object in the text, whatever label or code fence surrounds it
+    decoder = json.JSONDecoder()
+    start_index = input_str.find("{")
+    while start_index != -1:
+        try:
+            obj, _ = decoder.raw_decode(input_str, start_index)
+            if isinstance(obj, dict):
+                return obj
+        except ValueError:
+            pass
+        start_index = input_str.find("{", start_index + 1)
+    return None
+
+def extract_description(input_str):
+    if not input_str:
         return "Project Description NOT found in the LLM response."
-    
-    if end_index == -1:
-        return input_str[start_index:]
-    
-    return input_str[start_index:end_index]
+
+    # normal mode: the extracter answers with a JSON object
+    description = extract_json_object(input_str)
+    if description is not None:
+        return json.dumps(description, indent=2)
+
+    # docker mode: a structured markdown list, ended by TERMINATE
+    end_index = input_str.find("TERMINATE")
+    description = (input_str if end_index == -1 else input_str[:end_index]).strip()
+    return description or "Project Description NOT found in the LLM response."
 
 # def extract_project_name(config_str: str) -> str:
 #     pattern = r"\*\*Project Name\*\*:\s*-\s*(.*)"
@@ -38,6 +72,9 @@ def get_sys_msg_normal(agent_msg:str):
     return temp.substitute(team_intro=normal_team_intro)
 
 def extract_summary(text):
+    if not text:
+        return None
+
     # Define the regular expression pattern to match the summary
     pattern = r'(?i)summary.*?\n(.*)'
     
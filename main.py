@@ -1,16 +1,25 @@
 import typer
-import questionary
 from rich.console import Console
 from rich.panel import Panel
 from pathlib import Path
 import json
+import os
+from typing import List, Optional
 
-from MultiAgentSystem import MultiAgentSystem
+# questionary and MultiAgentSystem (autogen, agentops, docker, system prompts) are
+# imported inside the commands that need them so `--help` and the welcome panel
+# render without paying their import cost. See benchmarks/startup_benchmark.py.
 
 APP_NAME = "code-catalyst"
 CONFIG_DIR_PATH = Path(typer.get_app_dir(APP_NAME))
 CONFIG_FILE_PATH = CONFIG_DIR_PATH / "config.json"
 API_KEY_NAME = "API_KEY"
+DEFAULT_CACHE_DIR = CONFIG_DIR_PATH / "llm_cache"
+CHECKPOINT_DIR_PATH = CONFIG_DIR_PATH / "runs"
+DEFAULT_ARTIFACT_CACHE_DIR = CONFIG_DIR_PATH / "artifacts"
+MODEL_STATS_PATH = CONFIG_DIR_PATH / "model_stats.json"
+TRACE_DIR_PATH = CONFIG_DIR_PATH / "traces"
+TRANSCRIPT_DB_PATH = CONFIG_DIR_PATH / "transcripts.db"
 
 console = Console()
 app = typer.Typer()
@@ -57,6 +66,8 @@ def prompt_with_validation(prompt_func, message, *args, **kwargs):
             # console.print(Panel("[red]This question is mandatory. Please provide an answer.[/red]", expand=False))
 
 def check_api_key():
+    import questionary
+
     api_key = load_api_key()
     if not api_key:
         console.print(Panel("API key not found. Please enter your OpenAI API key", style="red", expand=False))
@@ -72,11 +83,15 @@ def check_api_key():
     return api_key
 
 def get_project_details():
+    import questionary
+
     project_name = prompt_with_validation(questionary.text, "Enter your project name:")
     project_description = prompt_with_validation(questionary.text, "Enter your project description:")
     return project_name, project_description
 
 def choose_dev_environment():
+    import questionary
+
     dev_env = prompt_with_validation(questionary.select, "Choose the development environment you want to setup:", choices=["normal", "docker"])
     return dev_env
 
@@ -84,15 +99,217 @@ def initiate_chat():
     # Replace this with the actual function call to initiate chat with multi-agents
     console.print(Panel("Initiating chat with multi-agents...", style="cyan", expand=False))
 
+def cache_option():
+    return typer.Option(DEFAULT_CACHE_DIR, help="Directory of the LLM response cache")
+
+def no_cache_option():
+    return typer.Option(False, "--no-cache", help="Disable the LLM response cache")
+
+def artifact_cache_option():
+    return typer.Option(DEFAULT_ARTIFACT_CACHE_DIR, help="Directory of the verified stage scripts, replayed for a project spec that was generated before")
+
+def no_artifact_cache_option():
+    return typer.Option(False, "--no-artifact-cache", help="Always generate with the agents, even for a project spec that was generated before")
+
+def no_similar_runs_option():
+    return typer.Option(False, "--no-similar-runs", help="Do not give the agents the scripts of a verified run with a similar project spec")
+
+def no_model_routing_option():
+    return typer.Option(False, "--no-model-routing", help="Try the configured models in their fixed order for every agent")
+
+def model_policy_option():
+    return typer.Option(None, "--model-policy", metavar="AGENT=MODEL[,MODEL...]",
+                        help="Models an agent may use, most preferred first (repeatable), e.g. TemplateAgent=gpt-4o,gpt-4o-mini")
+
+def routing_options(no_model_routing: bool, model_policy: Optional[List[str]]) -> dict:
+    from ModelRouter import parse_policies
+
+    try:
+        policies = parse_policies(model_policy or [])
+    except ValueError as e:
+        console.print(Panel(str(e), style="red", expand=False))
+        raise typer.Exit(code=1)
+    return {"model_routing": not no_model_routing, "model_policies": policies, "model_stats_path": str(MODEL_STATS_PATH)}
+
+def hedge_percentile_option():
+    return typer.Option(None, min=0.5, max=0.999, metavar="PERCENTILE",
+                        help="Resend an LLM request that runs longer than this latency percentile of its model, e.g. 0.95 (off by default)")
+
+def hedge_budget_option():
+    return typer.Option(0.1, min=0.0, help="Extra (hedged) LLM requests allowed per request sent")
+
+def hedge_max_cost_option():
+    return typer.Option(None, min=0.0, metavar="USD", help="Cap on the estimated extra spend of hedged LLM requests")
+
+def hedging_options(hedge_percentile: Optional[float], hedge_budget: float, hedge_max_cost: Optional[float]) -> dict:
+    return {"hedge_percentile": hedge_percentile, "hedge_budget": hedge_budget, "hedge_max_cost": hedge_max_cost}
+
+def stream_option():
+    return typer.Option(False, "--stream", help="Stream the agents' replies into the progress view and run their commands while the rest of the reply is generated")
+
+def no_trace_option():
+    return typer.Option(False, "--no-trace", help=f"Do not write the run's trace (spans of stages, LLM calls and commands) to {TRACE_DIR_PATH}")
+
+def no_transcripts_option():
+    return typer.Option(False, "--no-transcripts", help=f"Do not store the run's group chat transcript, stage attempts and commands in {TRANSCRIPT_DB_PATH}")
+
+def parallel_commands_option():
+    return typer.Option(1, min=1, help="Run independent generated commands concurrently on up to this many workers")
+
+def container_pool_option():
+    return typer.Option(2, min=0, help="Warm containers kept per image for the docker stage's test runs (0 disables the pool)")
+
+def speculative_option():
+    return typer.Option(False, "--speculative", help="Start drafting the next stage while the current stage's commands run")
+
+def no_incremental_option():
+    return typer.Option(False, "--no-incremental", help="Re-run every command of a retried stage, even those that already succeeded")
+
+def context_limit_option():
+    return typer.Option(12000, min=1000, help="Token ceiling for the context resent to an agent when its stage is retried")
+
 @app.command()
-def some_command():
+def some_command(cache_dir: Path = cache_option(), no_cache: bool = no_cache_option(),
+                 max_context_tokens: int = context_limit_option(), parallel_commands: int = parallel_commands_option(),
+                 container_pool_size: int = container_pool_option(), speculative: bool = speculative_option(),
+                 no_incremental: bool = no_incremental_option(), artifact_cache_dir: Path = artifact_cache_option(),
+                 no_artifact_cache: bool = no_artifact_cache_option(), no_similar_runs: bool = no_similar_runs_option(),
+                 no_model_routing: bool = no_model_routing_option(), model_policy: Optional[List[str]] = model_policy_option(),
+                 hedge_percentile: Optional[float] = hedge_percentile_option(), hedge_budget: float = hedge_budget_option(),
+                 hedge_max_cost: Optional[float] = hedge_max_cost_option(), stream: bool = stream_option(),
+                 no_trace: bool = no_trace_option(), no_transcripts: bool = no_transcripts_option(),
+                 resume: str = typer.Option(None, "--resume", metavar="RUN-ID", help="Continue an interrupted run from its last completed stage")):
     show_welcome_message()
+    routing = routing_options(no_model_routing, model_policy)
+    hedging = hedging_options(hedge_percentile, hedge_budget, hedge_max_cost)
     api_key = check_api_key()
-    project_name, project_description = get_project_details()
-    dev_env = choose_dev_environment()
 
-    agent_system = MultiAgentSystem(api_key,console,env_type=dev_env)
-    agent_system.run(project_name, project_description)
+    from Checkpoint import Checkpoint
+
+    checkpoint = None
+    if resume:
+        try:
+            checkpoint = Checkpoint.load(str(CHECKPOINT_DIR_PATH), resume)
+        except FileNotFoundError:
+            console.print(Panel(f"No checkpoint found for run '{resume}' in {CHECKPOINT_DIR_PATH}.", style="red", expand=False))
+            raise typer.Exit(code=1)
+        project_name, project_description, dev_env = checkpoint.project_name, checkpoint.project_description, checkpoint.env_type
+    else:
+        project_name, project_description = get_project_details()
+        dev_env = choose_dev_environment()
+
+    from MultiAgentSystem import MultiAgentSystem
+
+    agent_system = MultiAgentSystem(api_key,console,env_type=dev_env,cache_dir=None if no_cache else str(cache_dir),
+                                    context_token_limit=max_context_tokens,parallel_commands=parallel_commands,
+                                    container_pool_size=container_pool_size,speculative=speculative,
+                                    incremental=not no_incremental,checkpoint_dir=str(CHECKPOINT_DIR_PATH),
+                                    artifact_cache_dir=None if no_artifact_cache else str(artifact_cache_dir),
+                                    similar_run_hints=not no_similar_runs, **routing, **hedging, streaming=stream,
+                                    trace_dir=None if no_trace else str(TRACE_DIR_PATH),
+                                    transcript_db=None if no_transcripts else str(TRANSCRIPT_DB_PATH),
+                                    work_dir=checkpoint.work_dir if checkpoint else ".")
+    agent_system.run(project_name, project_description, checkpoint=checkpoint)
+
+@app.command()
+def batch(
+    spec_file: Path = typer.Argument(..., exists=True, dir_okay=False, help="JSONL or YAML list of {project_name, project_description, env_type}"),
+    workers: int = typer.Option(4, min=1, help="Maximum number of projects generated in parallel"),
+    workspace_root: Path = typer.Option(Path("batch_workspaces"), help="Each project gets its own workspace below this directory"),
+    report: Path = typer.Option(Path("batch_report.json"), help="Report file with results, timings and failures"),
+    sessions_per_worker: int = typer.Option(1, min=1, help="Concurrent async sessions sharing each worker's event loop"),
+    cache_dir: Path = cache_option(),
+    no_cache: bool = no_cache_option(),
+    max_context_tokens: int = context_limit_option(),
+    parallel_commands: int = parallel_commands_option(),
+    container_pool_size: int = container_pool_option(),
+    speculative: bool = speculative_option(),
+    no_incremental: bool = no_incremental_option(),
+    artifact_cache_dir: Path = artifact_cache_option(),
+    no_artifact_cache: bool = no_artifact_cache_option(),
+    no_similar_runs: bool = no_similar_runs_option(),
+    no_model_routing: bool = no_model_routing_option(),
+    model_policy: Optional[List[str]] = model_policy_option(),
+    hedge_percentile: Optional[float] = hedge_percentile_option(),
+    hedge_budget: float = hedge_budget_option(),
+    hedge_max_cost: Optional[float] = hedge_max_cost_option(),
+    stream: bool = stream_option(),
+    no_trace: bool = no_trace_option(),
+    no_transcripts: bool = no_transcripts_option(),
+):
+    """Generate many environments headlessly, one worker process per project."""
+    from batch_runner import load_specs, run_batch
+
+    api_key = load_api_key() or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        console.print(Panel("API key not found. Run the interactive command once to store it or set OPENAI_API_KEY.", style="red", expand=False))
+        raise typer.Exit(code=1)
+
+    try:
+        specs = load_specs(spec_file)
+    except ValueError as e:
+        console.print(Panel(str(e), style="red", expand=False))
+        raise typer.Exit(code=1)
+
+    system_options = {"cache_dir": None if no_cache else str(cache_dir), "context_token_limit": max_context_tokens,
+                      "parallel_commands": parallel_commands, "container_pool_size": container_pool_size,
+                      "speculative": speculative, "incremental": not no_incremental,
+                      "checkpoint_dir": str(CHECKPOINT_DIR_PATH),
+                      "artifact_cache_dir": None if no_artifact_cache else str(artifact_cache_dir),
+                      "similar_run_hints": not no_similar_runs, "streaming": stream,
+                      "trace_dir": None if no_trace else str(TRACE_DIR_PATH),
+                      "transcript_db": None if no_transcripts else str(TRANSCRIPT_DB_PATH),
+                      **routing_options(no_model_routing, model_policy),
+                      **hedging_options(hedge_percentile, hedge_budget, hedge_max_cost)}
+    summary = run_batch(specs, api_key, workspace_root, report, workers, console, sessions_per_worker, system_options)
+    style = "green" if summary["failed"] == 0 else "yellow"
+    console.print(Panel(f"{summary['succeeded']}/{summary['total']} projects succeeded in {summary['wall_time_s']}s. Report: {report}", style=style, expand=False))
+    if summary["failed"]:
+        raise typer.Exit(code=1)
+
+@app.command(name="report")
+def trace_report(
+    run: Optional[str] = typer.Argument(None, metavar="[RUN-ID]", help="Run id or trace file (default: the latest run)"),
+    trace_dir: Path = typer.Option(TRACE_DIR_PATH, help="Directory of the run traces"),
+    slowest: int = typer.Option(10, min=0, help="Number of slowest LLM calls, commands and docker phases listed"),
+):
+    """Print where a run spent its time: per-stage breakdown, slowest operations and the critical path."""
+    from trace_report import load_spans, print_report
+
+    if run is not None and Path(run).is_file():
+        path = Path(run)
+    elif run is not None:
+        path = trace_dir / f"{run}.jsonl"
+    else:
+        traces = sorted(trace_dir.glob("*.jsonl"), key=lambda p: p.stat().st_mtime) if trace_dir.is_dir() else []
+        path = traces[-1] if traces else None
+    if path is None or not path.is_file():
+        console.print(Panel(f"No trace found for {'run ' + repr(run) if run else 'any run'} in {trace_dir}.", style="red", expand=False))
+        raise typer.Exit(code=1)
+    print_report(load_spans(str(path)), console, slowest=slowest)
+
+@app.command()
+def retries(
+    days: float = typer.Option(7, min=0, help="Only runs started in the last DAYS days"),
+    env_type: Optional[str] = typer.Option(None, help="Only runs of this environment type (normal or docker)"),
+    db: Path = typer.Option(TRANSCRIPT_DB_PATH, help="Transcript database of the runs"),
+):
+    """Print how often each stage had to be retried, per stack, from the stored transcripts."""
+    import time
+    from rich.table import Table
+    from TranscriptStore import TranscriptStore
+
+    if not db.is_file():
+        console.print(Panel(f"No transcripts found in {db}.", style="red", expand=False))
+        raise typer.Exit(code=1)
+    rows = TranscriptStore.open(str(db)).retry_counts(since=time.time() - days * 86400, env_type=env_type)
+    table = Table(title=f"Stage retries over the last {days:g} days", title_justify="left")
+    for column in ("Stack", "Stage", "Runs", "Attempts", "Retries", "Retries / run", "Completed"):
+        table.add_column(column, justify="left" if column in ("Stack", "Stage") else "right")
+    for row in rows:
+        table.add_row(row["stack"] or "-", row["stage"], str(row["runs"]), str(row["attempts"]), str(row["retries"]),
+                      f"{row['retries'] / row['runs']:.2f}", f"{row['completed'] / row['runs']:.0%}")
+    console.print(table)
 
 if __name__ == "__main__":
     app()
@@ -1,47 +1,11 @@
-from pydantic import BaseModel
 from openai import OpenAI,LengthFinishReasonError
-from typing import List, Tuple
-from pydantic import Field
 from helper_functions import get_sys_msg_normal
+from structured_output import CommandResponse
 from sys_msg_normal import template_agent_prompt
 import json
 
 client = OpenAI()
 
-class CommandResponse(BaseModel):
-    class Commands(BaseModel):
-        command: str = Field(
-            ...,
-            description="The command to execute",
-            example="npm init -y"
-        )
-        comment: str = Field(
-            ...,
-            description="The comment associated with the command",
-            example="Initialize a new Node.js project"
-        )
-
-    
-    commands: List[Commands] = Field(
-        ...,
-        description="List of commands for the team",
-        example=[
-            {
-                "command": "npm init -y",
-                "comment": "Initialize a new Node.js project"
-            },
-            {
-                "command": "npm install express",
-                "comment": "Install the Express.js framework"
-            }
-        ]
-    )
-    summary: str = Field(
-        ...,
-        description="Summary of the commands for the team",
-        example="This set of commands initializes a new Node.js project and installs the Express.js framework."
-    )
-
 sysprompt = get_sys_msg_normal(template_agent_prompt)
 final_response = None
 json_response = {}
@@ -0,0 +1,111 @@
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+import json
+import re
+
+
+class CommandResponse(BaseModel):
+    class Commands(BaseModel):
+        command: str = Field(
+            ...,
+            description="The command to execute",
+            examples=["npm init -y"]
+        )
+        comment: str = Field(
+            ...,
+            description="The comment associated with the command",
+            examples=["Initialize a new Node.js project"]
+        )
+
+
+    commands: List[Commands] = Field(
+        ...,
+        description="List of commands for the team",
+        examples=[[
+            {
+                "command": "npm init -y",
+                "comment": "Initialize a new Node.js project"
+            },
+            {
+                "command": "npm install express",
+                "comment": "Install the Express.js framework"
+            }
+        ]]
+    )
+    summary: str = Field(
+        ...,
+        description="Summary of the commands for the team",
+        examples=["This set of commands initializes a new Node.js project and installs the Express.js framework."]
+    )
+
+
+class CommandOutcome(BaseModel):
+    command: str
+    exit_code: Optional[int] = None
+    duration: float = 0.0
+    skipped: bool = False       # not run because an earlier command failed
+    reused: bool = False        # not run because it already succeeded in an earlier attempt (ExecutionLedger)
+
+
+class ExecutionResult(BaseModel):
+    """What HumanProxyGroup reports back after running an agent's commands."""
+    exit_code: int
+    output: str = ""
+    failed_command: Optional[str] = None
+    duration: float = 0.0
+    commands: List[CommandOutcome] = Field(default_factory=list)
+
+    @property
+    def succeeded(self) -> bool:
+        return self.exit_code == 0
+
+
+def _strict_schema(node, names: bool = False):
+    """
+    A JSON schema in the form strict structured outputs accept: every object closed (additionalProperties false)
+    with all of its properties required, and without the examples (the prompts carry those).
+    """
+    if isinstance(node, list):
+        return [_strict_schema(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+    if names:       # the keys of properties / $defs are names, not keywords
+        return {name: _strict_schema(value) for name, value in node.items()}
+    strict = {key: _strict_schema(value, names=key in ("properties", "$defs"))
+              for key, value in node.items() if key != "examples"}
+    if strict.get("type") == "object":
+        strict["additionalProperties"] = False
+        strict["required"] = list(strict.get("properties", {}))
+    return strict
+
+
+def command_response_format() -> Dict:
+    """`response_format` request option that makes the model answer with a CommandResponse (strict JSON schema)."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": CommandResponse.__name__,
+            "schema": _strict_schema(CommandResponse.model_json_schema()),
+            "strict": True,
+        },
+    }
+
+
+_FENCED_JSON = re.compile(r"```(?:json)?\s*(\{.*\})\s*```", re.DOTALL)
+
+
+def load_message_json(content: Optional[str]) -> Optional[Dict]:
+    """The JSON object of a structured message (bare or in a ```json fence), or None."""
+    if not content:
+        return None
+    text = content.strip()
+    match = _FENCED_JSON.search(text)
+    if match:
+        text = match.group(1)
+    if not text.startswith("{"):
+        return None
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
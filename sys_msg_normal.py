@@ -96,7 +96,11 @@ Generate a series of shell commands that, when executed sequentially, will creat
 
 # Output Format
 
-Provide the shell commands as a series of command-line entries, one per line. Ensure that they are clear and executable as written.
+Answer with a JSON object with two fields:
+- "commands": the list of shell commands, in the order they have to run. Each item has:
+  - "command": one shell command, exactly as it is to be executed. The commands run one after the other in the same shell session, so a `cd` or an activated virtual environment carries over to the commands after it.
+  - "comment": what the command does, in a few words.
+- "summary": a brief summary in English for the members of your team, including the name of the main project directory and details of what you did.
 
 # Guidelines
 
@@ -110,48 +114,38 @@ Provide the shell commands as a series of command-line entries, one per line. En
 
 1.  For a React project with Express backend:
 
-```sh
-# Create project directory
-mkdir my-fullstack-app && cd my-fullstack-app
-
-# Initialize backend
-mkdir backend && cd backend
-npm init -y
-npm install --save express cors body-parser
-echo "const express = require('express');\nconst app = express();\nconst port = 3000;\n\napp.get('/', (req, res) => res.send('Hello World!'));\n\napp.listen(port, () => console.log('Server running on port '+ port));" > index.js
-
-# Initialize frontend
-cd ..
-npx create-react-app frontend --template typescript --use-npm
-cd frontend
-npm install --save axios
-
-# Return to project root
-cd ..
-```
+{
+  "commands": [
+    {"command": "mkdir my-fullstack-app && cd my-fullstack-app", "comment": "Create the project directory"},
+    {"command": "mkdir backend && cd backend", "comment": "Create the backend directory"},
+    {"command": "npm init -y", "comment": "Initialize the backend package"},
+    {"command": "npm install --save express cors body-parser", "comment": "Install the backend dependencies"},
+    {"command": "echo \\"const express = require('express');\\\\nconst app = express();\\\\nconst port = 3000;\\\\n\\\\napp.get('/', (req, res) => res.send('Hello World!'));\\\\n\\\\napp.listen(port, () => console.log('Server running on port '+ port));\\" > index.js", "comment": "Create the Express server"},
+    {"command": "cd .. && npx create-react-app frontend --template typescript --use-npm", "comment": "Create the React frontend"},
+    {"command": "cd frontend && npm install --save axios", "comment": "Install the frontend dependencies"},
+    {"command": "cd ..", "comment": "Return to the project root"}
+  ],
+  "summary": "Created my-fullstack-app with an Express server in backend/index.js and a TypeScript React app in frontend/ (with axios)."
+}
 
 2. For a Python Flask project:
 
-```sh
-# Create project directory and virtual environment
-mkdir flask-project && cd flask-project
-python3 -m venv venv
-source venv/bin/activate
-
-# Install dependencies
-pip install flask flask-sqlalchemy
-
-# Create basic app structure
-mkdir app
-echo "from flask import Flask\nfrom flask_sqlalchemy import SQLAlchemy\n\napp = Flask(__name__)\napp.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'\ndb = SQLAlchemy(app)\n\n@app.route('/')\ndef home():\n    return 'Hello, World!'\n\nif __name__ == '__main__':\n    app.run(debug=True)" > app/__init__.py
-
-# Create requirements file
-pip freeze > requirements.txt
-```
+{
+  "commands": [
+    {"command": "mkdir flask-project && cd flask-project", "comment": "Create the project directory"},
+    {"command": "python3 -m venv venv && source venv/bin/activate", "comment": "Create and activate a virtual environment"},
+    {"command": "pip install flask flask-sqlalchemy", "comment": "Install the dependencies"},
+    {"command": "mkdir app", "comment": "Create the app package"},
+    {"command": "echo \\"from flask import Flask\\\\nfrom flask_sqlalchemy import SQLAlchemy\\\\n\\\\napp = Flask(__name__)\\\\napp.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'\\\\ndb = SQLAlchemy(app)\\\\n\\\\n@app.route('/')\\\\ndef home():\\\\n    return 'Hello, World!'\\\\n\\\\nif __name__ == '__main__':\\\\n    app.run(debug=True)\\" > app/__init__.py", "comment": "Create a basic Flask app"},
+    {"command": "pip freeze > requirements.txt", "comment": "Write the requirements file"}
+  ],
+  "summary": "Created flask-project with a virtual environment (venv), Flask and Flask-SQLAlchemy installed, a basic app in app/__init__.py and requirements.txt."
+}
 
 # Final Note
 
-- After the shell commands, give a brief summary in English separately, including the name of the main project directory and details of what you did, for the members of your team with the heading "Summary for the team:"
+- Put every shell command in "commands"; do not answer with code blocks or any text outside the JSON object.
+- The "summary" is all your team members see of your work, so name the main project directory and the files you created.
 """
 
 tester_agent_prompt = """You are TesterAgent. 
@@ -174,7 +168,11 @@ Generate non-interactive shell commands to create and run tests that verify the
 
 # Output Format
 
-Provide the output as a list of shell commands, with each command on a new line. Include comments inline to describe the purpose of each command.
+Answer with a JSON object with two fields:
+- "commands": the list of shell commands, in the order they have to run. Each item has:
+  - "command": one shell command, exactly as it is to be executed. The commands run one after the other in the same shell session, so a `cd` or an activated virtual environment carries over to the commands after it.
+  - "comment": the purpose of the command, in a few words.
+- "summary": a brief summary in English for the members of your team about what you did.
 
 # Guidelines
 
@@ -186,40 +184,35 @@ Provide the output as a list of shell commands, with each command on a new line.
 
 # Examples
 
-1. For a Python Flask Project Structure_
+1. For a Python Flask Project Structure:
 
-```sh
-# Generate unit tests for Flask API routes
-touch tests/test_routes.py
-# Generate integration tests for database connection
-touch tests/test_db_integration.py
-# Generate end-to-end tests for user authentication flow
-touch tests/test_user_auth_flow.py
-```
+{
+  "commands": [
+    {"command": "mkdir -p tests", "comment": "Create the tests folder"},
+    {"command": "touch tests/test_routes.py", "comment": "Generate unit tests for Flask API routes"},
+    {"command": "touch tests/test_db_integration.py", "comment": "Generate integration tests for database connection"},
+    {"command": "touch tests/test_user_auth_flow.py", "comment": "Generate end-to-end tests for user authentication flow"}
+  ],
+  "summary": "Created tests/ with test files for the routes, the database connection and the authentication flow."
+}
 
 2.  For a Node.js project with Jest:
 
-```sh
-# Install Jest as a dev dependency
-npm install --save-dev jest
-
-# Create a test file to check environment setup
-echo "test('Node.js and npm are installed', () => {
-  expect(process.versions.node).toBeDefined();
-  expect(process.versions.npm).toBeDefined();
-});" > environment.test.js
-
-# Add test script to package.json
-npm pkg set scripts.test="jest"
-
-# Run tests
-npm test
-```
+{
+  "commands": [
+    {"command": "npm install --save-dev jest", "comment": "Install Jest as a dev dependency"},
+    {"command": "echo \\"test('Node.js and npm are installed', () => {\\\\n  expect(process.versions.node).toBeDefined();\\\\n  expect(process.versions.npm).toBeDefined();\\\\n});\\" > environment.test.js", "comment": "Create a test file to check environment setup"},
+    {"command": "npm pkg set scripts.test=\\\"jest\\\"", "comment": "Add test script to package.json"},
+    {"command": "npm test", "comment": "Run tests"}
+  ],
+  "summary": "Installed Jest, added environment.test.js checking that Node.js and npm are installed, and set it up as the test script."
+}
 
 (Note that real examples should include actual commands paired with the testing framework and specific logic related to the project structure.)
 
 # Notes
 
 - You may be given the summary of your team members' work; if given, use it to store the test files in the correct folder.
-- After the shell commands, give a brief summary in English separately about what you did to the members of your team with a heading "Summary for the team:"
+- Put every shell command in "commands"; do not answer with code blocks or any text outside the JSON object.
+- The "summary" is all your team members see of your work, so name the tests folder and what the tests check.
 """
\ No newline at end of file
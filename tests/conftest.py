@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# the modules live at the top of the repository (no package); the benchmarks import each other as siblings
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(1, str(REPO_ROOT / "benchmarks"))
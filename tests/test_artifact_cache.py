@@ -0,0 +1,61 @@
+import json
+
+from ArtifactCache import ArtifactCache, canonical_spec, normalize_dependency, spec_key
+
+
+def test_normalize_dependency():
+    assert normalize_dependency("Flask_SQLAlchemy >= 3.0 (ORM)") == "flask-sqlalchemy>=3.0"
+    assert normalize_dependency("flask: web framework") == "flask"
+    assert normalize_dependency("Django 4.2") == "django==4.2"
+
+
+def test_equivalent_specs_have_the_same_key():
+    first = json.dumps({
+        "project_type": "Web Application",
+        "language_preferences": ["Python"],
+        "required_dependencies": ["Flask", "SQLAlchemy"],
+    })
+    second = json.dumps({
+        "Project Type": "web application.",
+        "language_preferences": ["python"],
+        "required_dependencies": ["sqlalchemy, flask (web framework)"],
+    })
+    assert canonical_spec(first) == canonical_spec(second)
+    assert spec_key(canonical_spec(first), "normal") == spec_key(canonical_spec(second), "normal")
+    assert spec_key(canonical_spec(first), "normal") != spec_key(canonical_spec(first), "docker")
+
+
+def test_markdown_specs_are_canonicalized():
+    description = ("1. **Project Name**:\n   - Shop\n\n2. **Programming Language**:\n   - Python\n\n"
+                   "3. **Dependencies and Requirements**:\n   - Flask\n   - Redis\n")
+    spec = canonical_spec(description)
+    assert spec["project_name"] == ["shop"]
+    assert spec["dependencies_and_requirements"] == ["flask", "redis"]
+
+
+def test_free_text_has_no_spec():
+    assert canonical_spec(None) is None
+    assert canonical_spec("") is None
+
+
+def test_scripts_are_stored_relative_to_the_workspace(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    work_dir = tmp_path / "workspace"
+    description = json.dumps({"project_type": "cli", "required_dependencies": ["click"]})
+    scripts = {"TemplateAgent": [{"command": "pip install click", "cwd": str(work_dir / "app")},
+                                 {"command": "mkdir tests", "cwd": None}]}
+
+    key = cache.store(description, "normal", scripts, str(work_dir))
+    assert key == cache.key_for(description, "normal")
+    entry = cache.get(key)
+    assert entry.scripts["TemplateAgent"][0]["cwd"] == "app"
+
+    elsewhere = tmp_path / "other"
+    assert entry.script("TemplateAgent", str(elsewhere)) == [
+        {"command": "pip install click", "cwd": str(elsewhere / "app")},
+        {"command": "mkdir tests", "cwd": None},
+    ]
+    assert entry.script("TesterAgent", str(elsewhere)) is None
+
+    cache.invalidate(key)
+    assert cache.get(key) is None
@@ -0,0 +1,43 @@
+import json
+
+from StreamingClient import CommandStream
+
+REPLY = json.dumps({
+    "commands": [
+        {"command": "mkdir -p app", "comment": "Create the app {directory}"},
+        {"command": "echo \"}\" > app/brace.txt", "comment": "A brace in a string"},
+        {"command": "pip install flask", "comment": "Install Flask"},
+    ],
+    "summary": "Created app/ with Flask installed",
+})
+
+
+def _feed(stream, text, size):
+    completed = []
+    for i in range(0, len(text), size):
+        completed.append(stream.feed(text[i:i + size]))
+    return completed
+
+
+def test_commands_complete_as_their_objects_close():
+    completed = _feed(CommandStream(), REPLY, 7)
+    assert [command for batch in completed for command in batch] == [
+        "mkdir -p app", 'echo "}" > app/brace.txt', "pip install flask"]
+    # each command is returned once its object has arrived, before the rest of the reply
+    first = next(i for i, batch in enumerate(completed) if batch)
+    assert first * 7 < REPLY.index("pip install flask")
+
+
+def test_whole_reply_in_one_chunk():
+    assert CommandStream().feed(REPLY) == ["mkdir -p app", 'echo "}" > app/brace.txt', "pip install flask"]
+
+
+def test_free_text_reply_runs_nothing_early():
+    stream = CommandStream()
+    assert stream.feed("Here are the commands:\n```sh\nmkdir app\n```") == []
+    assert stream.feed('{"commands": [{"command": "true"}]}') == []
+
+
+def test_nothing_after_an_unreadable_command():
+    reply = '{"commands": [{"command": "true"}, {"command": 1}, {"command": "false"}], "summary": ""}'
+    assert CommandStream().feed(reply) == ["true"]
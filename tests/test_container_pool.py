@@ -0,0 +1,145 @@
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import agent_skills
+from agent_skills import TEST_COMMAND_LABEL, collect_docker_timings, run_image_tests, stop_collecting_docker_timings
+from ContainerPool import PRISTINE_DIR, ContainerPool
+
+
+class FakeContainer:
+    def __init__(self, name, image, ports):
+        self.name = name
+        self.image = image
+        self.status = "running"
+        self.removed = False
+        self.commands = []
+        self.attrs = {
+            "Config": {"WorkingDir": "/app"},
+            "NetworkSettings": {"Ports": {port: [{"HostPort": str(49000 + i)}] for i, port in enumerate(ports)}},
+        }
+
+    def reload(self):
+        pass
+
+    def exec_run(self, command):
+        self.commands.append(command)
+        return SimpleNamespace(exit_code=0, output=b"")
+
+    def remove(self, force=False):
+        self.removed = True
+
+
+class FakeDockerClient:
+    """The parts of docker.DockerClient the pool uses: images.get and containers.run."""
+
+    def __init__(self):
+        self.tags = {"app:latest": "sha256:1"}
+        self.started = []
+        self._names = itertools.count()
+        self._lock = threading.Lock()
+        self.labels = {}
+        self.images = SimpleNamespace(get=lambda tag: SimpleNamespace(id=self.tags[tag], labels=self.labels))
+        self.containers = SimpleNamespace(run=self._run)
+        self.api = SimpleNamespace(build=lambda **options: iter([{"stream": "Successfully built"}]))
+
+    def _run(self, image, name, labels, ports, detach, **options):
+        with self._lock:
+            container = FakeContainer(f"fake-{next(self._names)}", image, ports)
+            self.started.append(container)
+        return container
+
+    def running(self):
+        with self._lock:
+            return [container for container in self.started if not container.removed]
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def client():
+    return FakeDockerClient()
+
+
+@pytest.fixture
+def pool(client):
+    pool = ContainerPool(lambda: client, size=1, idle_timeout=60)
+    yield pool
+    pool.shutdown()
+
+
+def test_released_container_is_reset_and_reused(pool, client):
+    first = pool.acquire("app:latest", ports=["8000"])
+    assert pool.stats["cold"] == 1
+    assert first.host_ports == {"8000/tcp": "49000"}
+    assert any(PRISTINE_DIR in command[-1] for command in first.container.commands)   # snapshot of /app taken
+    _wait_for(lambda: len(pool._idle[first.key]) == 1)                                  # topped up in the background
+
+    pool.size = 2           # room for the released container next to the pre-started one
+    pool.release(first)
+    _wait_for(lambda: len(pool._idle[first.key]) == 2)
+    assert "find /app -mindepth 1 -delete" in first.container.commands[-1][-1]
+
+    assert pool.acquire("app:latest", ports=["8000"]) is first
+    assert pool.stats == {"warm": 1, "cold": 1, "evicted": 0, "reset_failures": 0}
+
+
+def test_containers_are_only_shared_by_the_same_ports(pool, client):
+    pool.acquire("app:latest", ports=["8000"])
+    _wait_for(lambda: len(client.started) == 2)
+
+    other = pool.acquire("app:latest", ports=["5000"])
+    assert pool.stats["cold"] == 2
+    assert other.host_ports == {"5000/tcp": "49000"}
+
+
+def test_rebuilt_tag_evicts_the_old_containers(pool, client):
+    pool.acquire("app:latest")
+    _wait_for(lambda: len(pool._idle[("sha256:1", ())]) == 1)
+
+    client.tags["app:latest"] = "sha256:2"
+    assert pool.acquire("app:latest").image_id == "sha256:2"
+    assert pool.stats["evicted"] == 1
+    assert client.started[1].removed        # the idle container of the old image
+
+
+def test_idle_containers_time_out_without_acquire(client):
+    pool = ContainerPool(lambda: client, size=2, idle_timeout=0.2, sweep_interval=0.05)
+    try:
+        pool.acquire("app:latest")
+        _wait_for(lambda: len(pool._idle[("sha256:1", ())]) == 2)
+        _wait_for(lambda: len(client.running()) == 1)           # only the acquired container is left
+        assert pool.stats["evicted"] == 2
+    finally:
+        pool.shutdown()
+
+
+def test_image_tests_run_in_a_pooled_container(pool, client, tmp_path, monkeypatch):
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / "Dockerfile").write_text("FROM python:3.11-slim\n")
+    client.labels[TEST_COMMAND_LABEL] = "python -m unittest"
+    monkeypatch.chdir(tmp_path)                                     # the context tarball is cached in .cache
+    monkeypatch.setattr(agent_skills.shutil, "which", lambda name: None)        # build through the client
+    monkeypatch.setattr(agent_skills, "get_docker_client", lambda: client)
+    monkeypatch.setattr(agent_skills, "get_container_pool", lambda: pool)
+
+    timings = []
+    token = collect_docker_timings(timings)
+    try:
+        output, exit_code = run_image_tests(str(project), "app:latest")
+    finally:
+        stop_collecting_docker_timings(token)
+    assert exit_code == 0, output
+    assert ["sh", "-c", "python -m unittest"] in client.started[0].commands
+    assert pool.stats["cold"] == 1
+    assert [timing["exit_code"] for timing in timings] == [0]
+    assert {"context", "build", "start", "exec", "teardown"} <= set(timings[0])
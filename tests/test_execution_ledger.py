@@ -0,0 +1,70 @@
+import io
+
+import pytest
+from rich.console import Console
+
+from CustomCodeExecutor import PersistentShellExecutor
+from ExecutionLedger import ExecutionLedger, LedgerEntry, changes_environment, snapshot
+
+
+def _record(ledger, stage, work_dir, command, change, cwd_after=None):
+    before = snapshot(str(work_dir))
+    change()
+    entry = LedgerEntry(command=command, cwd_before=str(work_dir), cwd_after=cwd_after or str(work_dir), duration=1.0)
+    ledger.record(stage, entry, before)
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = ExecutionLedger(str(tmp_path))
+    ledger.restart("TemplateAgent", [], snapshot(str(tmp_path)))
+    _record(ledger, "TemplateAgent", tmp_path, "echo a > a.txt", lambda: (tmp_path / "a.txt").write_text("a\n"))
+    _record(ledger, "TemplateAgent", tmp_path, "echo b > b.txt", lambda: (tmp_path / "b.txt").write_text("b\n"))
+    return ledger
+
+
+def test_identical_leading_commands_are_reusable(ledger, tmp_path):
+    prefix, _ = ledger.reusable_prefix("TemplateAgent", ["echo a > a.txt", "echo b > b.txt", "false"], str(tmp_path))
+    assert [entry.command for entry in prefix] == ["echo a > a.txt", "echo b > b.txt"]
+    assert prefix[0].paths == ["a.txt"]
+
+
+def test_prefix_ends_at_the_first_changed_command(ledger, tmp_path):
+    prefix, _ = ledger.reusable_prefix("TemplateAgent", ["echo a > a.txt", "echo c > b.txt"], str(tmp_path))
+    assert [entry.command for entry in prefix] == ["echo a > a.txt"]
+
+
+def test_prefix_ends_where_its_effects_were_changed_since(ledger, tmp_path):
+    (tmp_path / "b.txt").write_text("changed by the failed command\n")
+    prefix, _ = ledger.reusable_prefix("TemplateAgent", ["echo a > a.txt", "echo b > b.txt"], str(tmp_path))
+    assert [entry.command for entry in prefix] == ["echo a > a.txt"]
+
+
+def test_nothing_is_reused_from_another_directory_or_stage(ledger, tmp_path):
+    assert ledger.reusable_prefix("TemplateAgent", ["echo a > a.txt"], str(tmp_path / "sub"))[0] == []
+    assert ledger.reusable_prefix("TesterAgent", ["echo a > a.txt"], str(tmp_path))[0] == []
+
+
+def test_changes_environment():
+    assert changes_environment("source venv/bin/activate")
+    assert changes_environment("cd app && export FLASK_APP=app.py")
+    assert changes_environment("FLASK_ENV=development")
+    assert not changes_environment("pip install flask")
+
+
+def test_retried_stage_skips_what_already_succeeded(tmp_path):
+    ledger = ExecutionLedger(str(tmp_path))
+    shell = PersistentShellExecutor(work_dir=str(tmp_path), keep_cwd=False, console=Console(file=io.StringIO()),
+                                    ledger=ledger)
+    script = [{"command": "mkdir -p app"}, {"command": "cd app"}, {"command": "echo 1 >> count.txt"}]
+    try:
+        first = shell.execute_commands(script + [{"command": "false"}], stage="TemplateAgent")
+        assert first.failed_command == "false"
+
+        retry = shell.execute_commands(script + [{"command": "test -f count.txt"}], stage="TemplateAgent")
+    finally:
+        shell.stop()
+    assert retry.succeeded
+    assert [outcome.reused for outcome in retry.commands] == [True, True, True, False]
+    assert (tmp_path / "app" / "count.txt").read_text() == "1\n"     # not appended to a second time
+    assert ledger.stats()["TemplateAgent"]["reused"] == 3
@@ -0,0 +1,25 @@
+from HedgedClient import Hedger
+
+
+def test_close_releases_the_loop_and_the_clients():
+    hedger = Hedger()
+    client = hedger._async_client({"api_key": "sk-test", "base_url": "http://127.0.0.1:9/v1"})
+
+    hedger.close()
+    assert client.is_closed()
+    assert not hedger._thread.is_alive()
+    assert hedger._loop.is_closed()
+    assert hedger._clients == {}
+    hedger.close()          # a second close is a no-op
+
+
+def test_delay_waits_for_enough_samples():
+    hedger = Hedger(percentile=0.9, min_samples=5)
+    try:
+        for latency in (1.0, 1.0, 1.0, 2.0):
+            hedger._record_latency("gpt-4o", latency)
+        assert hedger.delay("gpt-4o") is None
+        hedger._record_latency("gpt-4o", 4.0)
+        assert hedger.delay("gpt-4o") == 4.0
+    finally:
+        hedger.close()
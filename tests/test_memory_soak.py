@@ -0,0 +1,43 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+from conftest import REPO_ROOT
+
+SESSIONS = 6
+FULL_SESSIONS = 100
+WARMUP = 30
+GROWTH_BUDGET_MB = 16.0
+
+
+def _soak(*args):
+    return subprocess.run(
+        [sys.executable, str(REPO_ROOT / "benchmarks" / "memory_soak_benchmark.py"), *args],
+        cwd=REPO_ROOT, capture_output=True, text=True, timeout=1800,
+    )
+
+
+def test_short_memory_soak():
+    """
+    A few sessions of the soak benchmark against the mock server: every session succeeds and the message store holds
+    nothing once a session is over. The max RSS only settles after a few dozen sessions (--warmup equal to
+    --sessions turns its check off here).
+    """
+    process = _soak("--sessions", str(SESSIONS), "--warmup", str(SESSIONS), "--log-kb", "64",
+                    "--report-every", str(SESSIONS))
+    assert process.returncode == 0, process.stdout + process.stderr
+    assert '"contents": 0' in process.stdout
+
+
+@pytest.mark.skipif(not os.environ.get("RUN_SOAK"), reason="takes a few minutes; set RUN_SOAK=1 to run it")
+def test_full_memory_soak():
+    """The whole soak: 100 sessions, and the max RSS grows by at most the budget after the warm-up sessions."""
+    process = _soak("--sessions", str(FULL_SESSIONS), "--warmup", str(WARMUP),
+                    "--growth-budget-mb", str(GROWTH_BUDGET_MB))
+    assert process.returncode == 0, process.stdout + process.stderr
+    growth = re.search(rf"max RSS growth after {WARMUP} sessions: (-?[\d.]+) MB", process.stdout)
+    assert growth is not None, process.stdout
+    assert float(growth.group(1)) <= GROWTH_BUDGET_MB
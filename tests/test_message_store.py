@@ -0,0 +1,148 @@
+from autogen import ConversableAgent
+
+import MessageStore as message_store_module
+from CustomGroupChat import CustomGroupChat
+from MessageScanner import scan_message
+from MessageStore import TRIM_MIN_CHARS, MessageStore, get_message_store
+
+
+def test_hold_returns_the_stored_equal_string():
+    store = MessageStore()
+    first = "x" * 100
+    second = "".join(["x" * 50, "x" * 50])       # equal, but another object
+    assert second is not first
+
+    assert store.hold(first) is first
+    assert store.hold(second) is first
+    assert store.stats()["contents"] == 1
+    assert store.stats()["references"] == 2
+    assert store.stats()["deduplicated"] == 1
+
+
+def test_release_drops_an_entry_with_its_last_reference():
+    store = MessageStore()
+    store.hold("log")
+    store.hold("log")
+
+    store.release(["log"])
+    assert "log" in store
+    store.release(["log"])
+    assert "log" not in store
+    assert store.stats() == {"contents": 0, "references": 0, "chars": 0, "deduplicated": 1, "trims": 0}
+
+
+def test_release_ignores_contents_that_are_not_held():
+    store = MessageStore()
+    store.hold("held")
+    store.release(["unknown", "held", "held"])
+    assert store.stats()["contents"] == 0
+
+
+def test_cached_computes_once_while_held():
+    store = MessageStore()
+    calls = []
+
+    def compute(content):
+        calls.append(content)
+        return len(content)
+
+    store.hold("abc")
+    assert store.cached("abc", compute) == 3
+    assert store.cached("abc", compute) == 3
+    assert calls == ["abc"]
+
+
+def test_cached_does_not_keep_values_of_contents_that_are_not_held():
+    store = MessageStore()
+    calls = []
+
+    def compute(content):
+        calls.append(content)
+        return content.upper()
+
+    assert store.cached("abc", compute) == "ABC"
+    assert store.cached("abc", compute) == "ABC"
+    assert calls == ["abc", "abc"]
+    assert "abc" not in store
+
+
+def test_derived_values_are_dropped_with_the_content():
+    store = MessageStore()
+    calls = []
+
+    def compute(content):
+        calls.append(content)
+        return len(content)
+
+    store.hold("abc")
+    store.cached("abc", compute)
+    store.release(["abc"])
+    store.hold("abc")
+    store.cached("abc", compute)
+    assert calls == ["abc", "abc"]
+
+
+def test_trim_waits_for_enough_released_chars(monkeypatch):
+    trims = []
+    monkeypatch.setattr(message_store_module, "_malloc_trim", trims.append)
+    store = MessageStore()
+    small, large = "s" * 10, "l" * TRIM_MIN_CHARS
+
+    store.hold(small)
+    store.release([small])
+    store.trim()
+    assert trims == [] and store.trims == 0
+
+    store.hold(large)
+    store.release([large])
+    store.trim()
+    assert trims == [0] and store.trims == 1
+    store.trim()        # nothing released since
+    assert store.trims == 1
+
+
+def test_group_chat_holds_its_messages_until_cleared():
+    store = MessageStore()
+    proxy = ConversableAgent("HumanProxyGroup", llm_config=False, human_input_mode="NEVER")
+    chat = CustomGroupChat(agents=[proxy], messages=[], message_store=store)
+    chat.append({"content": "".join(["output\n"] * 10), "role": "user"}, proxy)
+    chat.append({"content": "".join(["output\n"] * 10), "role": "user"}, proxy)
+
+    assert chat.messages[1]["content"] is chat.messages[0]["content"]
+    assert store.stats()["references"] == 2
+
+    chat.reset()
+    assert chat.messages == []
+    assert store.stats()["contents"] == 0
+
+
+def test_group_chat_accepts_multimodal_content(monkeypatch):
+    store = MessageStore()
+    proxy = ConversableAgent("HumanProxyGroup", llm_config=False, human_input_mode="NEVER")
+    chat = CustomGroupChat(agents=[proxy], messages=[], message_store=store)
+    image = {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA"}}
+
+    chat.append({"content": [{"type": "text", "text": "see the screenshot"}, image], "role": "user"}, proxy)
+    assert isinstance(chat.messages[0]["content"], str)        # autogen flattens it to text, which is held
+    assert store.stats()["contents"] == 1
+
+    # content that stays a list (autogen does not flatten it) is kept as it is, without a reference
+    monkeypatch.setattr("autogen.agentchat.groupchat.content_str", lambda content: content)
+    chat.append({"content": [image], "role": "user"}, proxy)
+    assert chat.messages[1]["content"] == [image]
+    assert store.stats()["references"] == 1
+
+    chat.reset()
+    assert store.stats()["contents"] == 0
+
+
+def test_scan_results_are_shared_while_the_message_is_held():
+    store = get_message_store()
+    content = store.hold('{"commands": [{"command": "true", "comment": "noop"}], "summary": "done"}')
+    try:
+        first = scan_message(content)
+        assert first.command_response is not None
+        assert scan_message(content) is first
+    finally:
+        store.release([content])
+    assert scan_message(content) is not first
@@ -0,0 +1,51 @@
+import json
+
+from ArtifactCache import ArtifactCache, ArtifactEntry, canonical_spec
+from SpecIndex import SpecIndex, run_tokens, similar_run_hint, spec_tokens
+
+FLASK = {"project_type": "web application", "language_preferences": ["Python"],
+         "required_dependencies": ["flask", "flask-sqlalchemy", "pytest"], "special_configurations": ["venv"]}
+DJANGO = {**FLASK, "required_dependencies": ["django", "flask-sqlalchemy", "pytest"]}
+EXPRESS = {"project_type": "api", "language_preferences": ["JavaScript"],
+           "required_dependencies": ["express", "jest", "cors"], "special_configurations": ["eslint"]}
+
+
+def _store(cache, spec, env_type="normal", scripts=None):
+    scripts = scripts or {"TemplateAgent": [{"command": "mkdir app", "cwd": None}],
+                          "TesterAgent": [{"command": "touch tests/test_app.py", "cwd": None}]}
+    return cache.store(json.dumps(spec), env_type, scripts, "/tmp/workspace")
+
+
+def test_closest_run_first(tmp_path):
+    cache = ArtifactCache(str(tmp_path))
+    flask, express = _store(cache, FLASK), _store(cache, EXPRESS)
+    index = SpecIndex.open(cache)
+    assert len(index) == 2
+
+    matches = index.query(spec_tokens(canonical_spec(json.dumps(DJANGO))), "normal", k=2)
+    assert matches[0][0] == flask
+    assert express not in [key for key, _ in matches]
+    assert index.query(spec_tokens(canonical_spec(json.dumps(DJANGO))), "docker") == []
+
+
+def test_open_picks_up_new_and_invalidated_entries(tmp_path):
+    cache = ArtifactCache(str(tmp_path))
+    flask = _store(cache, FLASK)
+    index = SpecIndex.open(cache)
+    index.save()
+
+    express = _store(cache, EXPRESS)
+    cache.invalidate(flask)
+    reopened = SpecIndex.open(cache)
+    assert reopened.dirty
+    assert reopened.query(spec_tokens(canonical_spec(json.dumps(FLASK))), "normal") == []
+    assert reopened.query(run_tokens(cache.get(express)), "normal")[0] == (express, 1.0)
+
+
+def test_hint_lists_the_stage_script():
+    entry = ArtifactEntry(key="k", env_type="normal", spec=canonical_spec(json.dumps(FLASK)),
+                          scripts={"TemplateAgent": [{"command": "pip install flask", "cwd": "app"}], "TesterAgent": []})
+    hint = similar_run_hint(entry, "TemplateAgent", 0.8)
+    assert "pip install flask" in hint and "(in app)" in hint
+    assert similar_run_hint(entry, "TesterAgent", 0.8) is None
+    assert similar_run_hint(entry, "DockerAgent", 0.8) is None
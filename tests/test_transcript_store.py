@@ -0,0 +1,16 @@
+from TranscriptStore import TranscriptStore
+
+
+def test_known_hashes_are_bounded(tmp_path):
+    store = TranscriptStore(str(tmp_path / "transcripts.db"), known_hashes=4)
+    try:
+        store.start_run("run", "shop", "normal", None)
+        for seq in range(20):
+            store.add_message("run", seq, "TemplateAgent", 1, {"name": "TemplateAgent", "content": f"reply {seq % 10}"})
+        assert store.flush(timeout=10)
+        assert len(store._known_hashes) == 4
+        # the forgotten contents are still stored once
+        assert store.deduplicated == 10
+        assert [row["content"] for row in store.transcript("run")] == [f"reply {seq % 10}" for seq in range(20)]
+    finally:
+        store.close()
@@ -0,0 +1,145 @@
+"""
+Per-stage breakdown, slowest operations and critical path of the span files written by Tracer.
+"""
+import json
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from rich.console import Console
+from rich.table import Table
+from rich.markup import escape
+
+EPSILON = 1e-3      # seconds of slack between a child's end and the next one's start
+
+
+def load_spans(path: str) -> List[Dict]:
+    """Spans of a trace file (lines that cannot be read, e.g. of an interrupted write, are skipped)."""
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                continue
+    return spans
+
+
+def children_of(spans: List[Dict]) -> Dict[str, List[Dict]]:
+    ids = {span["span_id"] for span in spans}
+    children: Dict[str, List[Dict]] = defaultdict(list)
+    for span in spans:
+        children[span["parent_id"] if span["parent_id"] in ids else None].append(span)
+    return children
+
+
+def critical_path(spans: List[Dict]) -> List[Tuple[Dict, int]]:
+    """(span, depth) of every span on the critical path of every root span (one per session of the run)."""
+    children = children_of(spans)
+    path: List[Tuple[Dict, int]] = []
+
+    def expand(span: Dict, depth: int):
+        path.append((span, depth))
+        cursor, chain = span["end"], []
+        for child in sorted(children.get(span["span_id"], []), key=lambda s: s["end"], reverse=True):
+            if child["end"] <= cursor + EPSILON:
+                chain.append(child)
+                cursor = child["start"]
+        for child in reversed(chain):
+            expand(child, depth + 1)
+
+    for root in sorted(children.get(None, []), key=lambda s: s["start"]):
+        expand(root, 0)
+    return path
+
+
+def stage_breakdown(spans: List[Dict]) -> Dict[str, Dict[str, float]]:
+    """Per stage name: wall time, rounds, completions, commands and docker phases of all its stage spans."""
+    children = children_of(spans)
+    stages: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for stage in (span for span in spans if span["kind"] == "stage"):
+        totals = stages[stage["name"]]
+        totals["duration"] += stage["duration"]
+        totals["failed"] += stage["status"] != "ok"
+        pending = list(children.get(stage["span_id"], []))
+        while pending:
+            span = pending.pop()
+            pending.extend(children.get(span["span_id"], []))
+            attrs = span.get("attrs", {})
+            if span["kind"] == "round":
+                totals["rounds"] += 1
+            elif span["kind"] == "llm":
+                totals["llm_calls"] += 1
+                totals["llm_s"] += span["duration"]
+                totals["tokens_in"] += attrs.get("tokens_in", 0)
+                totals["tokens_out"] += attrs.get("tokens_out", 0)
+                totals["cached"] += bool(attrs.get("cached"))
+                totals["cost"] += attrs.get("cost", 0.0) or 0.0
+            elif span["kind"] == "exec":
+                totals["commands"] += 1
+                totals["exec_s"] += span["duration"]
+                totals["failed_commands"] += attrs.get("exit_code") not in (0, None)
+            elif span["kind"] == "docker":
+                totals["docker_s"] += span["duration"]
+    return {name: dict(totals) for name, totals in stages.items()}
+
+
+def _label(span: Dict) -> str:
+    attrs = span.get("attrs", {})
+    if span["kind"] == "llm":
+        cached = ", cached" if attrs.get("cached") else ""
+        return f"llm {attrs.get('model')} ({attrs.get('agent')}, {attrs.get('tokens_in', 0)}→{attrs.get('tokens_out', 0)} tokens{cached})"
+    if span["kind"] == "exec":
+        return f"exec `{attrs.get('command', '')}` (exit {attrs.get('exit_code')})"
+    if span["kind"] == "round":
+        return f"round {attrs.get('round', '')}: {span['name']}"
+    if span["kind"] in ("run", "stage", "execute"):
+        return f"{span['kind']} {span['name']}" if span["kind"] != span["name"] else span["name"]
+    return span["name"]
+
+
+def print_report(spans: List[Dict], console: Console, slowest: int = 10):
+    if not spans:
+        console.print("[yellow]The trace has no spans.[/yellow]")
+        return
+    roots = children_of(spans).get(None, [])
+    start, end = min(s["start"] for s in spans), max(s["end"] for s in spans)
+    runs = [s for s in roots if s["kind"] == "run"]
+    status = ", ".join(f"{s['status']} ({s['duration']:.1f}s)" for s in runs) or "-"
+    console.print(f"[bold]Trace {escape(spans[0]['trace_id'])}[/bold]: {len(spans)} spans, "
+                  f"{end - start:.1f}s from first to last span, sessions: {status}")
+
+    stages = stage_breakdown(spans)
+    if stages:
+        table = Table(title="Stages", title_justify="left")
+        for column in ("Stage", "Wall (s)", "Rounds", "LLM calls", "LLM (s)", "Tokens in/out", "Cached", "Cost ($)",
+                       "Commands", "Exec (s)", "Docker (s)"):
+            table.add_column(column, justify="left" if column == "Stage" else "right")
+        for name, t in stages.items():
+            failed = " [red](failed)[/red]" if t.get("failed") else ""
+            table.add_row(escape(name) + failed, f"{t['duration']:.1f}", str(int(t.get("rounds", 0))),
+                          str(int(t.get("llm_calls", 0))), f"{t.get('llm_s', 0):.1f}",
+                          f"{int(t.get('tokens_in', 0))}/{int(t.get('tokens_out', 0))}", str(int(t.get("cached", 0))),
+                          f"{t.get('cost', 0):.4f}", f"{int(t.get('commands', 0))} ({int(t.get('failed_commands', 0))} failed)",
+                          f"{t.get('exec_s', 0):.1f}", f"{t.get('docker_s', 0):.1f}")
+        console.print(table)
+
+    leaves = sorted((s for s in spans if s["kind"] in ("llm", "exec", "docker")), key=lambda s: s["duration"], reverse=True)
+    if leaves:
+        table = Table(title="Slowest operations", title_justify="left")
+        table.add_column("Duration (s)", justify="right")
+        table.add_column("Operation")
+        for span in leaves[:slowest]:
+            table.add_row(f"{span['duration']:.2f}", escape(_label(span)))
+        console.print(table)
+
+    table = Table(title="Critical path", title_justify="left")
+    table.add_column("Span")
+    table.add_column("Duration (s)", justify="right")
+    table.add_column("Share", justify="right")
+    table.add_column("Status")
+    total = sum(root["duration"] for root in roots) or 1.0
+    for span, depth in critical_path(spans):
+        status = "" if span["status"] == "ok" else f"[red]{escape(span['status'])}[/red]"
+        table.add_row("  " * depth + escape(_label(span)), f"{span['duration']:.2f}",
+                      f"{span['duration'] / total:.0%}", status)
+    console.print(table)